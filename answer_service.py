@@ -0,0 +1,215 @@
+"""
+Streaming, shared answer service for the Data Assistant.
+
+Answers are generated on a small worker pool and streamed to the chat as the
+chunks arrive. Requests are keyed on the normalized question plus the data
+version of the table it is about, which gives three things:
+
+- identical questions in flight from different sessions share one LLM call;
+- a session that asks again stops listening to its previous answer, and a
+  request nobody listens to any more is cancelled;
+- completed answers go into a persistent ResultCache (memory plus disk, with
+  TTL and LRU eviction) that survives restarts and "Refresh Data".
+
+Every call has a deadline (``ANALYTIQ_ANSWER_TIMEOUT``, 60 s by default):
+when it passes, everyone waiting gets the error message and the next ask
+starts a new call, even if the model never answers.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import record, timed
+from llm_client import LLMClient
+from result_cache import ResultCache
+
+ANSWER_TTL = 7 * 24 * 60 * 60
+DEFAULT_ANSWER_CACHE_DIR = os.path.join('.cache', 'answers')
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 60
+ERROR_MESSAGE = 'Error: Could not get response from the AI model.'
+
+# Tag under which answers are stored in the cache (see ResultCache.invalidate).
+_ANSWER_TABLES = ('answers',)
+_NON_WORD_RE = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases ``question`` and reduces punctuation and whitespace to single spaces."""
+    return ' '.join(_NON_WORD_RE.sub(' ', question.lower()).split())
+
+
+def answer_key(question: str, data_version: str) -> str:
+    return hashlib.sha256(f'{data_version}\n{normalize_question(question)}'.encode('utf-8')).hexdigest()
+
+
+class _Request:
+    """One LLM call in flight, shared by every session waiting for it."""
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline  # time.monotonic() by which the answer must be complete
+        self.chunks = []
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.listeners = set()
+        self.cond = threading.Condition()
+
+
+class AnswerService:
+    """
+    Streams, coalesces, cancels and caches assistant answers.
+
+    Args:
+        client: The LLMClient that generates answers.
+        cache: Cache for completed answers; defaults to one with a disk tier
+            under ``ANALYTIQ_ANSWER_CACHE_DIR`` (default ``.cache/answers``).
+        max_workers: Concurrent LLM calls.
+        timeout: Seconds an answer may take before its listeners get the
+            error message; defaults to ``ANALYTIQ_ANSWER_TIMEOUT`` (60).
+    """
+
+    def __init__(self, client: LLMClient, cache: ResultCache | None = None, max_workers: int = DEFAULT_WORKERS,
+                 timeout: float | None = None):
+        if cache is None:
+            cache = ResultCache(
+                max_bytes=16 * 1024 * 1024,
+                disk_dir=os.environ.get('ANALYTIQ_ANSWER_CACHE_DIR', DEFAULT_ANSWER_CACHE_DIR),
+                max_disk_entries=5000,
+            )
+        self.client = client
+        self.cache = cache
+        self.timeout = timeout if timeout is not None else float(os.environ.get('ANALYTIQ_ANSWER_TIMEOUT', DEFAULT_TIMEOUT))
+        # Updated under _lock.
+        self.stats = {'cache_hits': 0, 'coalesced': 0, 'started': 0, 'cancelled': 0, 'errors': 0, 'timeouts': 0}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+        self._requests = {}  # answer key -> _Request
+        self._sessions = {}  # session id -> (_Request, listener token)
+        self._lock = threading.Lock()
+
+    def stream_answer(self, session_id: str, question: str, data_version: str, prompt: str):
+        """
+        Yields the answer to ``question`` as text chunks.
+
+        Args:
+            session_id: Identifies the asking session; its previous request is
+                abandoned (and cancelled when nobody else is waiting for it).
+            question: The user's question, used with ``data_version`` as the cache key.
+            data_version: Version of the data the prompt was built from.
+            prompt: The full prompt sent to the LLM on a cache miss.
+        """
+        key = answer_key(question, data_version)
+        hit, answer = self.cache.get(key, _ANSWER_TABLES)
+        if hit:
+            with self._lock:
+                self.stats['cache_hits'] += 1
+            record('llm', 'answer', 0.0, cache='hit', answer_chars=len(answer))
+            self._leave_session(session_id)
+            yield answer
+            return
+
+        token = object()
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            request = self._requests.get(key)
+            if request is None or request.cancelled:
+                request = _Request(time.monotonic() + self.timeout)
+                self._requests[key] = request
+                self.stats['started'] += 1
+                self._pool.submit(self._generate, key, request, prompt)
+            else:
+                self.stats['coalesced'] += 1
+            request.listeners.add(token)
+            self._sessions[session_id] = (request, token)
+        if previous is not None:
+            self._leave(*previous)
+
+        try:
+            seen = 0
+            while True:
+                with request.cond:
+                    while seen == len(request.chunks) and not request.done:
+                        remaining = request.deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        request.cond.wait(remaining)
+                if not request.done and time.monotonic() >= request.deadline:
+                    self._expire(key, request)
+                with request.cond:
+                    new_chunks = request.chunks[seen:]
+                    seen = len(request.chunks)
+                    done, error = request.done, request.error
+                yield from new_chunks
+                if done:
+                    if error is not None:
+                        yield ERROR_MESSAGE
+                    return
+        finally:
+            # Also runs when Streamlit stops the script because the user asked again.
+            self._leave(request, token)
+
+    def _leave_session(self, session_id):
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+        if previous is not None:
+            self._leave(*previous)
+
+    def _leave(self, request, token):
+        with self._lock:
+            request.listeners.discard(token)
+            if not request.listeners and not request.done and not request.cancelled:
+                request.cancelled = True
+                self.stats['cancelled'] += 1
+
+    def _expire(self, key, request):
+        # The client may never return; listeners stop waiting and new asks start over.
+        with self._lock:
+            if self._requests.get(key) is request:
+                del self._requests[key]
+            with request.cond:
+                if request.done:
+                    return
+                request.cancelled = True
+                request.error = TimeoutError(f'No complete answer within {self.timeout:g}s')
+                request.done = True
+                request.cond.notify_all()
+            self.stats['timeouts'] += 1
+        print(f"[AnswerService] {self.client.name} timed out after {self.timeout:g}s")
+
+    def _generate(self, key, request, prompt):
+        started = time.perf_counter()
+        try:
+            if request.cancelled:
+                return
+            with timed('llm', self.client.name, cache='miss', prompt_chars=len(prompt)) as info:
+                for chunk in self.client.stream(prompt):
+                    if request.cancelled:
+                        info['cancelled'] = True
+                        return
+                    if not request.chunks:
+                        info['first_chunk_seconds'] = time.perf_counter() - started
+                    with request.cond:
+                        request.chunks.append(chunk)
+                        request.cond.notify_all()
+                info['answer_chars'] = sum(len(chunk) for chunk in request.chunks)
+            if request.cancelled:
+                # Timed out while the last chunks arrived.
+                return
+            self.cache.put(key, ''.join(request.chunks), ANSWER_TTL, _ANSWER_TABLES)
+        except Exception as e:
+            print(f"[AnswerService] {self.client.name} error: {e}")
+            with request.cond:
+                if request.error is None:
+                    request.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+        finally:
+            with self._lock:
+                if self._requests.get(key) is request:
+                    del self._requests[key]
+            with request.cond:
+                request.done = True
+                request.cond.notify_all()
@@ -1,217 +1,129 @@
-import os
+import time
+# Start of this script run, for the cold-start measurements
+run_started = time.perf_counter()
 import streamlit as st
-from google.cloud import bigquery
 import pandas as pd
 from datetime import datetime, timedelta
-from st_aggrid import AgGrid, GridOptionsBuilder
-import google.generativeai as genai
 from dotenv import load_dotenv
-import json
-import hashlib
-from fpdf import FPDF
-import io
-
-# Path to your service account key
-SERVICE_ACCOUNT_JSON = 'bigsave-6767d8651634.json'
-PROJECT_ID = 'bigsave'
-DATASET = 'demo'
-
-# Set up BigQuery client
-if os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON"):
-    service_account_info = json.loads(os.environ["GOOGLE_SERVICE_ACCOUNT_JSON"])
-    client = bigquery.Client.from_service_account_info(service_account_info)
-else:
-    client = bigquery.Client.from_service_account_json(SERVICE_ACCOUNT_JSON)
+import uuid
 
+# Load .env before data_access builds the query backend from the environment
 load_dotenv()
 
-@st.cache_data
-def get_branches():
-    query = f"""
-        SELECT DISTINCT branch FROM `{PROJECT_ID}.{DATASET}.sales`
-        WHERE branch IS NOT NULL
-        ORDER BY branch
-    """
-    df = client.query(query).to_dataframe()
-    return df['branch'].tolist()
+# Heavy, rarely needed dependencies (st_aggrid, fpdf, the BigQuery and Gemini
+# SDKs) are imported where they are first used, not here.
+import client_pool
+from instrumentation import start_trace, serve_prometheus, write_prometheus, record_startup, startup_times
+from answer_service import AnswerService
+from assistant_context import build_prompt
+from purchase_export import export_purchase_orders, EXPORT_FORMATS, MIME_TYPES
+from grid_model import GroupedRowModel, DEFAULT_PAGE_SIZE
+from prefetch import fetch_all
+from views import prefetch_related, schedule_weeks, GROUP_COLS
+from view_pipeline import ViewPipeline
+from forecasting import FORECAST_METHODS, METHOD_LABELS, DEFAULT_WINDOW, SEASON_LENGTH
+from data_access import backend, result_cache, get_branches, get_weeks, get_stock_ledger
 
-@st.cache_data
-def get_weeks():
-    query = f"""
-        SELECT DISTINCT FORMAT_DATE('%Y-%W', PARSE_DATE('%Y-%m-%d', TranDate)) AS week
-        FROM `{PROJECT_ID}.{DATASET}.sales`
-        WHERE TranDate IS NOT NULL
-        ORDER BY week DESC
-    """
-    df = client.query(query).to_dataframe()
-    return df['week'].dropna().tolist()
+# Steps timed during this run, shown in the sidebar's performance panel
+trace = start_trace()
+# Only the process's first run pays for the imports above
+record_startup('imports', time.perf_counter() - run_started)
+serve_prometheus()
+# Build the backend's and the Data Assistant's clients in the background (once per process)
+client_pool.warm_up([*backend.clients, 'llm'])
 
-@st.cache_data
-def get_sales_by_stockid(branch, week):
-    query = f"""
-        SELECT REGEXP_EXTRACT(StockID, r'([0-9]+(?:-[0-9]+)?)') AS StockID, SUM(CAST(Quantity AS FLOAT64)) AS total_qty
-        FROM `{PROJECT_ID}.{DATASET}.sales`
-        WHERE branch = @branch
-          AND FORMAT_DATE('%Y-%W', PARSE_DATE('%Y-%m-%d', TranDate)) = @week
-        GROUP BY StockID
+@st.cache_resource
+def get_answer_service():
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter('branch', 'STRING', branch),
-            bigquery.ScalarQueryParameter('week', 'STRING', week)
-        ]
-    )
-    df = client.query(query, job_config=job_config).to_dataframe()
-    return df
-
-@st.cache_data
-def get_stock_onhand_by_stockid(branch):
-    query = f"""
-        SELECT REGEXP_EXTRACT(StockCodeID, r'([0-9]+)') AS StockID, ONHAND
-        FROM `{PROJECT_ID}.{DATASET}.stock_onhands`
-        WHERE BRANCH = @branch
+    Returns the process-wide Data Assistant answer service (shared by all sessions).
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter('branch', 'STRING', branch)
-        ]
-    )
-    df = client.query(query, job_config=job_config).to_dataframe()
-    return df
+    return AnswerService(client_pool.get('llm'))
 
-@st.cache_data
-def get_item_names_by_stockid(stockids):
-    if not stockids:
-        return pd.DataFrame(columns=['StockID', 'Description1'])
-    codes_str = ','.join([f'"{code}"' for code in stockids])
-    query = f"""
-        SELECT StockID, Description1
-        FROM `{PROJECT_ID}.{DATASET}.stock`
-        WHERE StockID IN ({codes_str})
+def build_grid_options(display_df, group_cols):
     """
-    df = client.query(query).to_dataframe()
-    return df
-
-@st.cache_data
-def get_item_details_by_stockid(stockids):
-    if not stockids:
-        return pd.DataFrame(columns=[
-            'StockID', 'Description1', 'SupplierID', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand'
-        ])
-    codes_str = ','.join([f'"{code}"' for code in stockids])
-    query = f'''
-        SELECT StockID, Description1, SupplierID, Cat0, Cat1, Cat2, Cat3, Cat4, Brand
-        FROM `{PROJECT_ID}.{DATASET}.stock`
-        WHERE StockID IN ({codes_str})
-    '''
-    df = client.query(query).to_dataframe()
-    return df
-
-@st.cache_data
-def get_supplier_names_by_ids(supplier_ids):
-    if not supplier_ids:
-        return pd.DataFrame(columns=['SupplierID', 'SupplierName'])
-    ids_str = ','.join([f'"{sid}"' for sid in supplier_ids])
-    query = f'''
-        SELECT SupplierID, SupplierName
-        FROM `{PROJECT_ID}.{DATASET}.suppliers`
-        WHERE SupplierID IN ({ids_str})
-    '''
-    df = client.query(query).to_dataframe()
-    return df
-
-@st.cache_data
-def get_weekly_sales_table(week):
+    Returns the AgGrid options grouping the whole table in the browser.
     """
-    Returns a DataFrame with StockID, Name (Description1), SupplierID, Quantity sold, and LinkQty for the given week (all branches), only for items that sold.
+    from st_aggrid import GridOptionsBuilder
+    gb = GridOptionsBuilder.from_dataframe(display_df)
+    gb.configure_default_column(groupable=True)
+    for col in group_cols:
+        gb.configure_column(col, rowGroup=True, hide=True)
+    gb.configure_side_bar()
+    gb.configure_grid_options(domLayout='normal')
+    return gb.build()
+
+def render_client_grid(pipeline, group_cols):
     """
-    query = f"""
-        SELECT
-            REGEXP_EXTRACT(s.StockID, r'(\\d+)') AS StockID,
-            st.Description1 AS Name,
-            st.SupplierID AS SupplierID,
-            SUM(CAST(s.Quantity AS FLOAT64)) AS Quantity_Sold,
-            SUM(CAST(s.LinkQty AS FLOAT64)) AS LinkQty_Sold
-        FROM `{PROJECT_ID}.{DATASET}.sales` s
-        JOIN `{PROJECT_ID}.{DATASET}.stock` st
-          ON REGEXP_EXTRACT(s.StockID, r'(\\d+)') = st.StockID
-        WHERE FORMAT_DATE('%Y-%W', PARSE_DATE('%Y-%m-%d', s.TranDate)) = @week
-          AND CAST(s.Quantity AS FLOAT64) > 0
-        GROUP BY StockID, st.Description1, st.SupplierID
-        HAVING SUM(CAST(s.Quantity AS FLOAT64)) > 0
-        ORDER BY Quantity_Sold DESC
+    Renders the whole table in AgGrid, grouped in the browser.
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter('week', 'STRING', week)
-        ]
+    from st_aggrid import AgGrid
+    grid_options = pipeline.stage('grid_options', build_grid_options, tuple(group_cols))
+    AgGrid(
+        pipeline.table(),
+        gridOptions=grid_options,
+        enable_enterprise_modules=True,
+        allow_unsafe_jscode=True,
+        height=600,
     )
-    df = client.query(query, job_config=job_config).to_dataframe()
-    return df
 
-@st.cache_data
-def get_context_summary(display_df, show_schedule, week, branch):
+def render_server_grid(pipeline, group_cols, value_cols, key):
     """
-    Returns a string summary of the current data context, including a mapping of product names to sales for the week, supplier mappings, and supplier total sales/order quantities.
+    Renders one group level (or one page of a group's rows) at a time; selecting a group opens it.
     """
-    # Build supplier and product context
-    supplier_map = {}
-    product_supplier_map = {}
-    supplier_total_qty = {}
-    if 'SupplierID' in display_df.columns and 'SupplierName' in display_df.columns:
-        supplier_map = display_df[['SupplierID', 'SupplierName']].drop_duplicates().set_index('SupplierID')['SupplierName'].to_dict()
-        product_supplier_map = display_df[['Item Name', 'SupplierID']].set_index('Item Name')['SupplierID'].to_dict()
-        # Calculate total quantity sold or total order quantity per supplier
-        if not show_schedule and 'Quantity Sold' in display_df.columns:
-            supplier_total_qty = display_df.groupby('SupplierName')['Quantity Sold'].sum().sort_values(ascending=False).to_dict()
-        elif show_schedule and 'Order Qty' in display_df.columns:
-            supplier_total_qty = display_df.groupby('SupplierName')['Order Qty'].sum().sort_values(ascending=False).to_dict()
-    if not show_schedule:
-        # Build a mapping of product names to sales quantities
-        name_qty = display_df[['Item Name', 'Quantity Sold']].set_index('Item Name')['Quantity Sold'].to_dict()
-        # Also include a list of all product names for fuzzy matching
-        all_names = list(name_qty.keys())
-        return (
-            f"Weekly Sales Table for week {week} at branch {branch}.\n"
-            f"Top items by quantity sold: {display_df[['Item Name', 'Quantity Sold']].head(5).to_dict(orient='records')}\n"
-            f"Total items: {len(display_df)}\n"
-            f"Product sales mapping: {name_qty}\n"
-            f"All product names: {all_names}\n"
-            f"Supplier mapping (SupplierID to SupplierName): {supplier_map}\n"
-            f"Product to SupplierID mapping: {product_supplier_map}\n"
-            f"Supplier total quantity sold: {supplier_total_qty}"
-        )
-    else:
-        # For purchase schedule, include order qty mapping
-        name_order = display_df[['Item Name', 'Order Qty']].set_index('Item Name')['Order Qty'].to_dict()
-        all_names = list(name_order.keys())
-        return (
-            f"Purchase Schedule for branch {branch}.\n"
-            f"Top recommended orders: {display_df[['Item Name', 'Order Qty']].head(5).to_dict(orient='records')}\n"
-            f"Total items: {len(display_df)}\n"
-            f"Product order mapping: {name_order}\n"
-            f"All product names: {all_names}\n"
-            f"Supplier mapping (SupplierID to SupplierName): {supplier_map}\n"
-            f"Product to SupplierID mapping: {product_supplier_map}\n"
-            f"Supplier total order quantity: {supplier_total_qty}"
-        )
+    from st_aggrid import AgGrid, GridOptionsBuilder
+    # Group aggregates are built once per table and reused by every rerun
+    model = pipeline.stage('grouped_model', GroupedRowModel, tuple(group_cols), tuple(value_cols))
+    path_key = f'{key}_path'
+    path = st.session_state.get(path_key, [])
+    if not model.has_path(path):
+        path = []
+    # Breadcrumb back to any enclosing level
+    crumbs = ['All'] + path
+    for depth, (crumb_col, label) in enumerate(zip(st.columns(len(crumbs)), crumbs)):
+        if crumb_col.button(str(label), key=f'{key}_crumb_{depth}', disabled=depth == len(path)):
+            st.session_state[path_key] = path[:depth]
+            st.session_state[f'{key}_nav'] = st.session_state.get(f'{key}_nav', 0) + 1
+            st.rerun()
+    # Sorting and paging run here, so only the visible page is sent to the browser
+    level_key = f'{key}_{len(path)}'
+    sort_col, order_col, page_col = st.columns([2, 1, 1])
+    sort_by = sort_col.selectbox('Sort by', model.sort_options(path), key=f'{level_key}_sort')
+    ascending = order_col.toggle('Ascending', key=f'{level_key}_ascending')
+    page_key = f'{key}_page_{"/".join(path)}'
+    page = st.session_state.get(page_key, 1)
+    rows, total = model.children(tuple(path), sort_by, ascending, page - 1, DEFAULT_PAGE_SIZE)
+    page_count = max(1, -(-total // DEFAULT_PAGE_SIZE))
+    if page > page_count:
+        # The table shrank (new data) since this page was chosen
+        page = st.session_state[page_key] = page_count
+        rows, total = model.children(tuple(path), sort_by, ascending, page - 1, DEFAULT_PAGE_SIZE)
+    page_col.number_input(f'Page (of {page_count})', min_value=1, max_value=page_count, key=page_key)
+    at_groups = len(path) < model.depth
+    gb = GridOptionsBuilder.from_dataframe(rows)
+    gb.configure_default_column(sortable=False)
+    if at_groups:
+        gb.configure_selection('single')
+    response = AgGrid(
+        rows,
+        gridOptions=gb.build(),
+        height=600,
+        update_on=['selectionChanged'] if at_groups else [],
+        # A fresh grid per navigation step, so a stale selection can't reopen a group
+        key=f'{key}_grid_{st.session_state.get(f"{key}_nav", 0)}_{sort_by}_{ascending}_{page}',
+    )
+    selected = response.selected_rows if at_groups else None
+    if selected is not None and len(selected):
+        first = selected.iloc[0] if isinstance(selected, pd.DataFrame) else selected[0]
+        st.session_state[path_key] = path + [first[model.group_cols[len(path)]]]
+        st.session_state[f'{key}_nav'] = st.session_state.get(f'{key}_nav', 0) + 1
+        st.rerun()
+    st.caption(f'{total:,} {"groups" if at_groups else "items"} at this level')
 
-@st.cache_data
-def get_ai_response(prompt, api_key):
-    """
-    Calls Gemini AI and logs whether the cache is hit or missed based on the prompt hash.
-    """
-    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:10]
-    print(f"[get_ai_response] Cache miss: recomputing for prompt hash {prompt_hash}")
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        st.error(f"Gemini API error: {e}")
-        print("Gemini API error:", e)
-        return "Error: Could not get response from Gemini AI."
+def render_grid(pipeline, group_cols, value_cols, key):
+    if st.session_state.get('server_side_grid', True):
+        render_server_grid(pipeline, group_cols, value_cols, key)
+    else:
+        render_client_grid(pipeline, group_cols)
 
 # Streamlit UI
 st.set_page_config(page_title='Procurement Demo', layout='wide')
@@ -222,7 +134,10 @@ with st.sidebar:
         from datetime import datetime
         st.session_state['last_refresh'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     if st.button('🔄 Refresh Data', use_container_width=True):
-        st.cache_data.clear()
+        # Re-check every table's data version: only results built from tables
+        # that actually changed are recomputed (AI answers are kept). The rollup
+        # itself is maintained by the load and batch jobs.
+        result_cache.refresh_versions()
         from datetime import datetime
         st.session_state['last_refresh'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         st.rerun()
@@ -232,22 +147,45 @@ with st.sidebar:
     if 'show_schedule' not in st.session_state:
         st.session_state['show_schedule'] = False
 
-    branches = get_branches()
+    branches, weeks = fetch_all(get_branches, get_weeks)
     branch = st.selectbox('Branch', branches)
-    weeks = get_weeks()
     # Only show week selection if not in Purchase Schedule view
     if not st.session_state['show_schedule']:
-        week = st.selectbox('Sales Week (YYYY-WW)', weeks)
+        week = st.selectbox('Sales Week (YYYY-WW)', weeks, key='sales_week')
+        forecast_method, history_window = None, None
     else:
-        # Keep week variable defined for downstream logic
-        week = weeks[0] if weeks else None
+        ledger = get_stock_ledger()
+        if ledger is not None and weeks:
+            # Past weeks' schedules use the stock on hand the ledger had at the time
+            week = st.selectbox('Schedule for week', weeks, key='schedule_week',
+                                help='Earlier weeks use the stock on hand at the end of the week before, '
+                                     'from the stock ledger')
+        else:
+            # Keep week variable defined for downstream logic
+            week = weeks[0] if weeks else None
+        forecast_method = st.selectbox(
+            'Forecast Method', list(FORECAST_METHODS), format_func=METHOD_LABELS.get, key='forecast_method'
+        )
+        default_window = SEASON_LENGTH if forecast_method == 'seasonal_naive' else DEFAULT_WINDOW
+        history_window = st.number_input(
+            'History Window (weeks)', min_value=1, max_value=104, value=default_window, step=1,
+            key=f'history_window_{forecast_method}'
+        )
 
     def toggle_schedule():
         st.session_state['show_schedule'] = not st.session_state['show_schedule']
 
+    st.toggle('Server-side grouping', value=True, key='server_side_grid',
+              help='Aggregate groups on the server and send only the visible level to the grid')
+
     toggle_label = 'Show Weekly Sales Report' if st.session_state['show_schedule'] else 'Create Purchase Schedule'
     st.button(toggle_label, key='toggle_button', use_container_width=True, on_click=toggle_schedule)
 
+    st.toggle('Performance panel', value=False, key='perf_panel',
+              help='Show the time, rows, bytes and cache result of each step of this page load')
+    # Filled at the end of the script, once every step has run
+    perf_box = st.container()
+
 # Main layout: left sidebar, main data area, right AI chat
 main_col, ai_col = st.columns([3, 1.5], gap="large")
 
@@ -283,154 +221,77 @@ with main_col:
         if not st.session_state['show_schedule']:
             st.success('**Currently viewing: Weekly Sales Table**')
             st.subheader(f'Weekly Sales Table (All Branches) for Week: {week}')
-            weekly_sales_df = get_weekly_sales_table(week)
-            item_details_df = get_item_details_by_stockid(weekly_sales_df['StockID'].unique().tolist())
-            # Always merge SupplierID from weekly_sales_df, and SupplierName from suppliers
-            supplier_ids = weekly_sales_df['SupplierID'].dropna().unique().tolist()
-            supplier_names_df = get_supplier_names_by_ids(supplier_ids)
-            # Merge item details (for categories/brand) and supplier names
-            weekly_sales_df = weekly_sales_df.merge(item_details_df, on='StockID', how='left', suffixes=('', '_details'))
-            weekly_sales_df = weekly_sales_df.merge(supplier_names_df, on='SupplierID', how='left')
-            group_cols = ['SupplierName', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand']
-            display_cols = [
-                'SupplierID', 'SupplierName', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand',
-                'StockID', 'Name', 'Quantity_Sold', 'LinkQty_Sold'
-            ]
-            display_df = weekly_sales_df[display_cols].rename(columns={
-                'Name': 'Item Name',
-                'Quantity_Sold': 'Quantity Sold',
-                'LinkQty_Sold': 'LinkQty'
-            })
-            gb = GridOptionsBuilder.from_dataframe(display_df)
-            gb.configure_default_column(groupable=True)
-            gb.configure_column('SupplierName', rowGroup=True, hide=True)
-            gb.configure_column('Cat0', rowGroup=True, hide=True)
-            gb.configure_column('Cat1', rowGroup=True, hide=True)
-            gb.configure_column('Cat2', rowGroup=True, hide=True)
-            gb.configure_column('Cat3', rowGroup=True, hide=True)
-            gb.configure_column('Cat4', rowGroup=True, hide=True)
-            gb.configure_column('Brand', rowGroup=True, hide=True)
-            gb.configure_side_bar()
-            gb.configure_grid_options(domLayout='normal')
-            grid_options = gb.build()
-            AgGrid(
-                display_df,
-                gridOptions=grid_options,
-                enable_enterprise_modules=True,
-                allow_unsafe_jscode=True,
-                height=600,
-            )
+            # Staged and memoized: reruns with the same week and data (e.g. chat turns) rebuild nothing
+            pipeline = ViewPipeline(False, week=week)
+            display_df = pipeline.table()
+            render_grid(pipeline, GROUP_COLS, ['Quantity Sold', 'LinkQty'], 'weekly_grid')
         else:
             st.info('**Currently viewing: Purchase Schedule**')
-            st.subheader('Recommended Purchase Schedule for Next Week')
-            st.caption('Based on average sales of the last 4 weeks minus current stock on hand (negative stock treated as zero).')
-            week_index = weeks.index(week)
-            prev_weeks = weeks[week_index+1:week_index+5] if week_index+5 <= len(weeks) else weeks[week_index+1:]
+            # A past week's schedule uses the ledger's stock on hand at the end of the week before
+            prev_weeks, onhand_week = schedule_weeks(week, weeks, history_window)
+            if onhand_week is None:
+                st.subheader('Recommended Purchase Schedule for Next Week')
+                stock_label = 'current stock on hand'
+            else:
+                st.subheader(f'Recommended Purchase Schedule for Week {week}')
+                stock_label = (f'stock on hand at the end of week {onhand_week}'
+                               if onhand_week <= (ledger.through_week or '') else
+                               f'current stock on hand (the stock ledger ends at week {ledger.through_week})')
+            st.caption(
+                f'Based on {METHOD_LABELS[forecast_method].lower()} over the last {history_window} weeks '
+                f'minus {stock_label} (negative stock treated as zero).'
+            )
             if len(prev_weeks) < 1:
                 st.warning('Not enough historical data to calculate running average.')
                 display_df = None
             else:
-                prev_sales = []
-                for w in prev_weeks:
-                    df = get_sales_by_stockid(branch, w)
-                    df = df.rename(columns={'total_qty': w})
-                    prev_sales.append(df.set_index('StockID'))
-                if prev_sales:
-                    sales_hist = pd.concat(prev_sales, axis=1).fillna(0)
-                    sales_hist['avg_sales'] = sales_hist.mean(axis=1)
-                    stock_onhand_df = get_stock_onhand_by_stockid(branch)
-                    stock_onhand_df['ONHAND'] = pd.to_numeric(stock_onhand_df['ONHAND'], errors='coerce').fillna(0)
-                    stock_onhand_df['ONHAND'] = stock_onhand_df['ONHAND'].clip(lower=0)
-                    schedule = sales_hist.reset_index().merge(stock_onhand_df, on='StockID', how='left')
-                    schedule['ONHAND'] = schedule['ONHAND'].fillna(0)
-                    schedule['RecommendedOrder'] = (schedule['avg_sales'] - schedule['ONHAND']).clip(lower=0)
-                    # Always get item details (for SupplierID) and supplier names
-                    item_details_df = get_item_details_by_stockid(schedule['StockID'].unique().tolist())
-                    schedule = schedule.merge(item_details_df, on='StockID', how='left', suffixes=('', '_details'))
-                    supplier_ids = schedule['SupplierID'].dropna().unique().tolist()
-                    supplier_names_df = get_supplier_names_by_ids(supplier_ids)
-                    schedule = schedule.merge(supplier_names_df, on='SupplierID', how='left')
-                    group_cols = ['SupplierName', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand']
-                    schedule = schedule.sort_values(group_cols + ['Description1'])
-                    display_cols = [
-                        'SupplierID', 'SupplierName', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand',
-                        'StockID', 'Description1', 'avg_sales', 'ONHAND', 'RecommendedOrder'
-                    ]
-                    display_df = schedule[display_cols].rename(columns={
-                        'Description1': 'Item Name',
-                        'avg_sales': 'Avg Weekly Sales',
-                        'ONHAND': 'Stock On Hand',
-                        'RecommendedOrder': 'Order Qty'
-                    })
-                    # PDF Download Button
-                    def generate_purchase_pdf(df, week, branch):
-                        pdf = FPDF()
-                        pdf.set_auto_page_break(auto=True, margin=15)
-                        grouped = df.groupby(['SupplierID', 'SupplierName'])
-                        for (sid, sname), group in grouped:
-                            pdf.add_page()
-                            pdf.set_font('Arial', 'B', 14)
-                            pdf.cell(0, 10, f'Purchase Recommendation - {sname} ({sid})', ln=1)
-                            pdf.set_font('Arial', '', 12)
-                            pdf.cell(0, 10, f'Branch: {branch} | Week: {week}', ln=1)
-                            pdf.ln(4)
-                            # Improved Table header
-                            pdf.set_font('Arial', 'B', 11)
-                            pdf.cell(60, 8, 'Item Name', 1)
-                            pdf.cell(22, 8, 'Order Qty', 1)
-                            pdf.cell(22, 8, 'Stock On Hand', 1)
-                            pdf.cell(22, 8, 'Avg Sales', 1)
-                            pdf.cell(28, 8, 'Cat0', 1)
-                            pdf.cell(28, 8, 'Cat1', 1)
-                            pdf.ln()
-                            pdf.set_font('Arial', '', 9)
-                            for _, row in group.iterrows():
-                                pdf.cell(60, 8, str(row['Item Name'])[:40], 1)
-                                pdf.cell(22, 8, str(row['Order Qty']), 1)
-                                pdf.cell(22, 8, str(int(row['Stock On Hand'])), 1)
-                                pdf.cell(22, 8, str(int(row['Avg Weekly Sales'])), 1)
-                                pdf.cell(28, 8, str(row['Cat0'])[:12], 1)
-                                pdf.cell(28, 8, str(row['Cat1'])[:12], 1)
-                                pdf.ln()
-                        pdf_bytes = pdf.output(dest='S').encode('latin1')
-                        pdf_buffer = io.BytesIO(pdf_bytes)
-                        return pdf_buffer
+                pipeline = ViewPipeline(True, branch, prev_weeks=prev_weeks, method=forecast_method, window=history_window,
+                                        onhand_week=onhand_week)
+                display_df = pipeline.table()
+                if display_df is not None:
+                    # Purchase-order documents (rendered in worker processes, cached per schedule)
                     st.markdown('---')
-                    pdf_buffer = None
-                    if st.button('Download Purchase Recommendation PDF by Supplier', use_container_width=True):
-                        pdf_buffer = generate_purchase_pdf(display_df, week, branch)
-                    if pdf_buffer:
+                    export_format = st.radio(
+                        'Purchase orders by supplier', list(EXPORT_FORMATS), format_func=EXPORT_FORMATS.get,
+                        horizontal=True, key='export_format'
+                    )
+                    document = None
+                    if st.button('Prepare Purchase Recommendation Download', use_container_width=True):
+                        with st.spinner('Rendering purchase orders...'):
+                            document = export_purchase_orders(
+                                display_df, branch, week, export_format, cache=result_cache
+                            )
+                    if document:
                         st.download_button(
-                            label='Click here to download PDF',
-                            data=pdf_buffer,
-                            file_name=f'purchase_recommendation_{branch}_{week}.pdf',
-                            mime='application/pdf'
+                            label='Click here to download',
+                            data=document,
+                            file_name=f'purchase_recommendation_{branch}_{week}.{export_format}',
+                            mime=MIME_TYPES[export_format]
                         )
                     # Always show the table after download
-                    gb = GridOptionsBuilder.from_dataframe(display_df)
-                    gb.configure_default_column(groupable=True)
-                    gb.configure_column('SupplierName', rowGroup=True, hide=True)
-                    gb.configure_column('Cat0', rowGroup=True, hide=True)
-                    gb.configure_column('Cat1', rowGroup=True, hide=True)
-                    gb.configure_column('Cat2', rowGroup=True, hide=True)
-                    gb.configure_column('Cat3', rowGroup=True, hide=True)
-                    gb.configure_column('Cat4', rowGroup=True, hide=True)
-                    gb.configure_column('Brand', rowGroup=True, hide=True)
-                    gb.configure_side_bar()
-                    gb.configure_grid_options(domLayout='normal')
-                    grid_options = gb.build()
-                    AgGrid(
-                        display_df,
-                        gridOptions=grid_options,
-                        enable_enterprise_modules=True,
-                        allow_unsafe_jscode=True,
-                        height=600,
-                    )
-                else:
-                    display_df = None
+                    render_grid(pipeline, GROUP_COLS, ['Order Qty'], 'schedule_grid')
     else:
         st.info('Please select a branch and week to view data.')
 
+# Warm the cache, in the background, for the weeks, branches and view likely to be opened next.
+# The other view's widgets aren't rendered, so it opens on their stored values or else their defaults.
+def _stored_week(key):
+    stored = st.session_state.get(key)
+    return stored if stored in weeks else weeks[0]
+
+if branch and week:
+    if st.session_state['show_schedule']:
+        sales_week, schedule_week = _stored_week('sales_week'), week
+        next_method, next_window = forecast_method, history_window
+    else:
+        sales_week, schedule_week = week, _stored_week('schedule_week')
+        next_method = st.session_state.get('forecast_method', list(FORECAST_METHODS)[0])
+        next_window = st.session_state.get(
+            f'history_window_{next_method}', SEASON_LENGTH if next_method == 'seasonal_naive' else DEFAULT_WINDOW
+        )
+    prefetch_related(branch, sales_week, schedule_week, weeks, branches, st.session_state['show_schedule'],
+                     next_method, next_window)
+
 with ai_col:
     st.markdown(
         '<span style="font-size:1.2em;font-weight:600;white-space:nowrap;">💬 Data Assistant</span>',
@@ -441,37 +302,68 @@ with ai_col:
         st.session_state["chat_history"] = []
 
     if 'display_df' in locals() and display_df is not None:
-        context_summary = get_context_summary(display_df, st.session_state['show_schedule'], week, branch)
+        context_index = pipeline.context_index()
 
         # Fixed height, scrollable chat history container
         chat_height = 400  # px, adjust as needed
-        with st.container(height=chat_height, border=True):
+        chat_box = st.container(height=chat_height, border=True)
+        with chat_box:
             for msg in st.session_state["chat_history"]:
                 with st.chat_message(msg["role"], avatar=msg.get("avatar")):
                     st.markdown(msg["content"])
+                    if msg.get("stats"):
+                        st.caption(
+                            f"Prompt {msg['stats']['prompt_chars']:,} chars · {msg['stats']['total_seconds']:.2f}s"
+                        )
 
         # Chat input always at the bottom of the column
         user_input = st.chat_input("Ask about the data above...", key="data_chat_input")
         if user_input:
-            # Load Gemini API key from environment variable (set in .env file)
-            GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-            st.write("Gemini API Key loaded:", bool(GEMINI_API_KEY))
-            prompt = (
-                "You are a helpful data assistant. "
-                "Answer the user's question in clear, natural language, using only the data provided below. "
-                "If the answer is not in the data, say you don't know. "
-                "If the user asks about a product by name (e.g. 'Tastic Rice'), match it to the closest product name in the product sales mapping (using substring or fuzzy match if needed). "
-                "If the user asks about a generic product (e.g. 'Tastic Rice'), show all matching products and their sales or recommended order quantities. "
-                "If the user asks about a specific product (e.g. 'Tastic 10kg'), show just that product's sales or recommended order. "
-                "If the user asks about a supplier (by name or SupplierID), use the supplier mapping to answer. "
-                "If the user asks which supplier provides a product, use the product-to-supplier mapping. "
-                "If the user asks which supplier sold the most product or has the highest recommended order, use the supplier total quantity mapping. "
-                f"Data context:\n{context_summary}\n"
-                f"User question: {user_input}"
-            )
-            response = get_ai_response(prompt, GEMINI_API_KEY)
+            if "session_id" not in st.session_state:
+                st.session_state["session_id"] = uuid.uuid4().hex
+            started = time.perf_counter()
+            # Only the rows matching the question go into the prompt
+            prompt = build_prompt(user_input, context_index)
+            with chat_box:
+                with st.chat_message("user", avatar="🧑"):
+                    st.markdown(user_input)
+                with st.chat_message("assistant", avatar="💡"):
+                    # Streams as chunks arrive; asking again stops this script run,
+                    # which abandons (and, if unshared, cancels) the request.
+                    response = st.write_stream(get_answer_service().stream_answer(
+                        st.session_state["session_id"], user_input, context_index.version, prompt
+                    ))
+            stats = {'prompt_chars': len(prompt), 'total_seconds': time.perf_counter() - started}
             st.session_state["chat_history"].append({"role": "user", "content": user_input, "avatar": "🧑"})
-            st.session_state["chat_history"].append({"role": "assistant", "content": response, "avatar": "💡"})
+            st.session_state["chat_history"].append({"role": "assistant", "content": response, "avatar": "💡", "stats": stats})
             st.rerun()
     else:
         st.info("No data available for chat.")
+
+# Performance panel: every instrumented step of this run
+if st.session_state.get('perf_panel'):
+    with perf_box:
+        st.markdown('**Performance (this run)**')
+        if trace:
+            perf_df = pd.DataFrame(trace)
+            columns = ['kind', 'name', 'seconds', 'rows', 'bytes_processed', 'bytes_billed', 'cache']
+            perf_df = perf_df[[c for c in columns if c in perf_df.columns]]
+            st.dataframe(perf_df, hide_index=True, use_container_width=True)
+            queries = perf_df[perf_df['kind'] == 'query']
+            hits = (perf_df['cache'] == 'hit').sum()
+            lookups = perf_df['cache'].isin(['hit', 'miss']).sum()
+            st.caption(
+                f"{len(queries)} queries · {queries['seconds'].sum():.2f}s in queries · "
+                f"{int(perf_df['bytes_processed'].fillna(0).sum()):,} bytes processed · "
+                f"cache {hits}/{lookups} hits"
+            )
+        else:
+            st.caption('No instrumented steps ran.')
+        cold_start = startup_times()
+        if cold_start:
+            st.caption('Cold start (this process): ' + ' · '.join(
+                f"{step.replace('_', ' ')} {seconds:.2f}s" for step, seconds in cold_start.items()
+            ))
+# Time to the first complete page of this process (imports, clients, rollup check, queries and rendering)
+record_startup('first_render', time.perf_counter() - run_started)
+write_prometheus()
@@ -0,0 +1,268 @@
+"""
+Retrieval-based context for the Data Assistant.
+
+Instead of serializing the whole table into every prompt, the table on screen
+is indexed once (trigram index over item names, supplier and category
+values, plus precomputed aggregates) and each question gets a context made of
+the aggregates and only the rows that match it. Prompt size then depends on
+the question, not on how busy the week was.
+
+The LLM is any callable taking a prompt and returning text (see
+``tests/test_assistant_context.py``).
+"""
+import hashlib
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+MAX_MATCHED_ROWS = 30
+TOP_N = 10
+# Fraction of a question word's trigrams that must appear in a value for it to count as a match.
+MATCH_THRESHOLD = 0.6
+
+CATEGORY_COLUMNS = ['Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand']
+
+STOPWORDS = {
+    'a', 'about', 'all', 'an', 'and', 'any', 'are', 'at', 'by', 'can', 'did', 'do', 'does', 'for',
+    'from', 'give', 'has', 'have', 'how', 'i', 'in', 'is', 'it', 'list', 'many', 'me', 'most',
+    'much', 'of', 'on', 'or', 'order', 'our', 'please', 'product', 'products', 'provides', 'qty',
+    'quantity', 'should', 'show', 'sold', 'sales', 'sell', 'supplier', 'suppliers', 'tell', 'the',
+    'this', 'to', 'top', 'us', 'was', 'we', 'week', 'what', 'which', 'who', 'with',
+}
+
+PROMPT_TEMPLATE = (
+    "You are a helpful data assistant. "
+    "Answer the user's question in clear, natural language, using only the data provided below. "
+    "If the answer is not in the data, say you don't know. "
+    "The data lists the items whose names, suppliers or categories match the question; "
+    "if the user asks about a generic product (e.g. 'Tastic Rice'), show all matching items and their values, "
+    "and if they ask about a specific product (e.g. 'Tastic 10kg'), show just that item. "
+    "For questions about suppliers or categories overall (e.g. which supplier sold the most), use the totals. "
+    "Data context:\n{context}\n"
+    "User question: {question}"
+)
+
+_NON_WORD_RE = re.compile(r'[^0-9a-z]+')
+
+
+def _words(text) -> list:
+    return [w for w in _NON_WORD_RE.sub(' ', str(text).lower()).split() if w]
+
+
+def _trigrams(word: str) -> set:
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Fuzzy word matcher over a list of short texts (item names, supplier names, ...).
+
+    Args:
+        values: The texts to index; search scores are aligned with them.
+    """
+
+    def __init__(self, values):
+        self.values = [str(v) for v in values]
+        postings = {}
+        for position, value in enumerate(self.values):
+            grams = set()
+            for word in _words(value):
+                grams |= _trigrams(word)
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: np.array(rows) for gram, rows in postings.items()}
+
+    def search(self, words, threshold: float = MATCH_THRESHOLD) -> np.ndarray:
+        """
+        Scores every value against ``words``.
+
+        Returns:
+            A float array, one score per value: the sum over ``words`` of the
+            fraction of each word's trigrams found in the value (fractions
+            below ``threshold`` count as zero).
+        """
+        scores = np.zeros(len(self.values))
+        for word in words:
+            grams = _trigrams(word)
+            hits = np.zeros(len(self.values))
+            for gram in grams:
+                rows = self._postings.get(gram)
+                if rows is not None:
+                    hits[rows] += 1
+            fraction = hits / len(grams)
+            scores += np.where(fraction >= threshold, fraction, 0.0)
+        return scores
+
+
+class ContextIndex:
+    """
+    Search index and aggregates over the table shown on screen.
+
+    Args:
+        display_df: The displayed table (``Item Name``, ``SupplierID``,
+            ``SupplierName``, categories and the value column).
+        value_column: ``'Quantity Sold'`` or ``'Order Qty'``.
+        title: First line of every context, e.g. the view, week and branch.
+    """
+
+    def __init__(self, display_df: pd.DataFrame, value_column: str, title: str):
+        self.title = title
+        self.value_column = value_column
+        df = display_df.reset_index(drop=True)
+        self.rows = df
+        # Identifies the indexed data, e.g. for caching answers about it.
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        self.version = hashlib.sha256(title.encode('utf-8') + row_hashes.tobytes()).hexdigest()[:16]
+        self.values = pd.to_numeric(df[value_column], errors='coerce').fillna(0).to_numpy()
+        self.names = TrigramIndex(df['Item Name'].fillna(''))
+        self.total = float(self.values.sum())
+        self.top_items = self._top(df['Item Name'])
+
+        self.supplier_totals = pd.Series(dtype=float)
+        self.suppliers = None
+        if 'SupplierName' in df.columns:
+            supplier_labels = df['SupplierName'].astype(object).fillna('Unknown supplier')
+            if 'SupplierID' in df.columns:
+                supplier_labels = supplier_labels + ' (' + df['SupplierID'].astype(object).fillna('?').astype(str) + ')'
+            self.supplier_labels = supplier_labels.to_numpy()
+            self.supplier_totals = self._totals(supplier_labels)
+            self.suppliers = TrigramIndex(self.supplier_totals.index)
+
+        # Category values across all category columns, as (column, value) pairs.
+        self.category_totals = {}
+        pairs = []
+        for col in CATEGORY_COLUMNS:
+            if col in df.columns:
+                totals = self._totals(df[col].astype(object))
+                self.category_totals[col] = totals
+                pairs.extend((col, value) for value in totals.index)
+        self.category_pairs = pairs
+        self.categories = TrigramIndex(value for _, value in pairs)
+
+    def _totals(self, labels: pd.Series) -> pd.Series:
+        return pd.Series(self.values, index=labels.to_numpy()).groupby(level=0).sum().sort_values(ascending=False)
+
+    def _top(self, labels: pd.Series) -> list:
+        order = np.argsort(-self.values, kind='stable')[:TOP_N]
+        return [(labels.iloc[i], self.values[i]) for i in order]
+
+    def _format_rows(self, positions) -> str:
+        lines = []
+        names = self.rows['Item Name']
+        for i in positions:
+            supplier = self.supplier_labels[i] if self.suppliers is not None else ''
+            lines.append(f"- {names.iat[i]} | {supplier} | {self.value_column}: {_fmt(self.values[i])}")
+        return '\n'.join(lines)
+
+    def build_context(self, question: str, max_rows: int = MAX_MATCHED_ROWS) -> str:
+        """
+        Returns the prompt context for ``question``: the aggregates plus the matching rows.
+        """
+        words = [w for w in _words(question) if w not in STOPWORDS and len(w) > 1]
+        parts = [
+            self.title,
+            f"Total items: {len(self.rows)}; total {self.value_column}: {_fmt(self.total)}",
+            f"Top items by {self.value_column}: {_pairs(self.top_items)}",
+        ]
+        if len(self.supplier_totals):
+            parts.append(f"Supplier totals (top {TOP_N}): {_pairs(self.supplier_totals.head(TOP_N).items())}")
+        if 'Cat0' in self.category_totals:
+            parts.append(f"Cat0 totals (top {TOP_N}): {_pairs(self.category_totals['Cat0'].head(TOP_N).items())}")
+        if not words:
+            return '\n'.join(parts)
+
+        row_scores = self.names.search(words)
+        row_mask = np.zeros(len(self.rows), dtype=bool)
+
+        if self.suppliers is not None:
+            supplier_scores = self.suppliers.search(words)
+            best = _best(supplier_scores)
+            if len(best):
+                matched = self.supplier_totals.iloc[best]
+                parts.append(f"Matching suppliers: {_pairs(matched.items())}")
+                row_mask |= np.isin(self.supplier_labels, matched.index)
+
+        category_scores = self.categories.search(words)
+        best = _best(category_scores)
+        if len(best):
+            matches = [self.category_pairs[i] for i in best]
+            parts.append('Matching categories: ' + '; '.join(
+                f"{col} {value}: {_fmt(self.category_totals[col][value])}" for col, value in matches
+            ))
+            for col, value in matches:
+                row_mask |= (self.rows[col] == value).to_numpy(dtype=bool, na_value=False)
+
+        # Name matches first (best match, then largest value), then rows of matched suppliers/categories.
+        # Names matching most of the question's words; "item" alone shouldn't pull in every row.
+        name_hits = row_scores >= 0.75 * row_scores.max(initial=0.0)
+        candidates = np.flatnonzero(((row_scores > 0) & name_hits) | row_mask)
+        keys = (-self.values[candidates], ~row_mask[candidates], -row_scores[candidates])
+        order = candidates[np.lexsort(keys)][:max_rows]
+        if len(order):
+            more = f" (showing {len(order)} of {len(candidates)})" if len(candidates) > len(order) else ''
+            parts.append(f"Matching items{more}:\n{self._format_rows(order)}")
+        else:
+            parts.append("Matching items: none")
+        return '\n'.join(parts)
+
+
+def _best(scores: np.ndarray, limit: int = 5) -> np.ndarray:
+    """Positions of the values tied for the best score (at most ``limit``)."""
+    top = scores.max(initial=0.0)
+    if top <= 0:
+        return np.array([], dtype=int)
+    positions = np.flatnonzero(scores >= top * 0.999)
+    return positions[:limit]
+
+
+def _fmt(value) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else f'{value:.2f}'
+
+
+def _pairs(items) -> str:
+    return ', '.join(f'{label}: {_fmt(value)}' for label, value in items)
+
+
+def build_prompt(question: str, index: ContextIndex) -> str:
+    """Returns the LLM prompt for ``question`` with its retrieved context."""
+    with timed('context', 'build_prompt') as info:
+        prompt = PROMPT_TEMPLATE.format(context=index.build_context(question), question=question)
+        info['prompt_chars'] = len(prompt)
+    return prompt
+
+
+def answer_question(question: str, index: ContextIndex, generate) -> tuple:
+    """
+    Builds the prompt for ``question`` and asks the LLM.
+
+    Args:
+        question: The user's question.
+        index: ContextIndex over the displayed table.
+        generate: Callable taking the prompt and returning the answer text.
+
+    Returns:
+        ``(answer, stats)`` where stats holds ``prompt_chars``,
+        ``context_seconds`` and ``total_seconds``.
+    """
+    started = time.perf_counter()
+    prompt = build_prompt(question, index)
+    context_done = time.perf_counter()
+    answer = generate(prompt)
+    finished = time.perf_counter()
+    stats = {
+        'prompt_chars': len(prompt),
+        'context_seconds': context_done - started,
+        'total_seconds': finished - started,
+    }
+    print(
+        f"[answer_question] prompt {stats['prompt_chars']} chars, context {stats['context_seconds'] * 1000:.1f} ms, "
+        f"total {stats['total_seconds'] * 1000:.1f} ms"
+    )
+    return answer, stats
+
@@ -0,0 +1,360 @@
+"""
+Benchmarks the dashboard data paths against a local Parquet snapshot.
+
+Times every data function behind the views, the two view pipelines, the
+purchase-schedule computation, the Data Assistant context and the purchase
+order export, using the DuckDB backend over a snapshot such as one written by
+``synthetic_data.py``. Each step runs ``--repeat`` times from a cold result
+cache, then once more warm. With ``--startup`` it also measures cold start:
+the app's first render and a rerun in fresh processes (``streamlit.testing``),
+against BigQuery by default (``--startup-backend duckdb`` for the snapshot),
+with an import profile of the first run (``python -X importtime``). Results
+are written as JSON so runs from different versions can be compared with
+``--compare``.
+
+Usage:
+    python synthetic_data.py --out data/synthetic
+    python benchmark.py --data data/synthetic --label my-change
+    python benchmark.py --data data/synthetic --startup --compare benchmark_results/baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from instrumentation import row_count
+from result_cache import _sizeof
+
+DEFAULT_OUT_DIR = 'benchmark_results'
+DEFAULT_REPEAT = 3
+# A step counts as a regression when its median grows by more than this factor.
+DEFAULT_THRESHOLD = 1.2
+
+SAMPLE_QUESTIONS = ['which supplier sold the most', 'tastic rice', 'beverages 2L']
+# Imports listed in the startup profile.
+TOP_IMPORTS = 15
+
+_APP_RUN_MARKER = '-- app run --'
+# Runs in a fresh interpreter: renders app.py twice and prints the timings as JSON.
+_STARTUP_SCRIPT = f'''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+print({_APP_RUN_MARKER!r}, file=sys.stderr, flush=True)
+started = time.perf_counter()
+app.run()
+first_render = time.perf_counter() - started
+started = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - started
+print(json.dumps({{'first_render': first_render, 'rerun': rerun, 'errors': [e.message for e in app.exception]}}))
+'''
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def measure_memory(func, reset) -> dict:
+    """
+    Runs ``func`` once from a cold cache under tracemalloc.
+
+    Returns:
+        ``peak_mb``, the most memory allocated at once during the call, and
+        ``result_mb``, the deep size of what it returns (what a cache entry or
+        a session holds on to).
+    """
+    reset()
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_mb': peak / 2**20, 'result_mb': _sizeof(result) / 2**20}
+
+
+def time_step(func, repeat: int, reset) -> dict:
+    """
+    Times ``func`` ``repeat`` times after calling ``reset`` (cold), then once more without it (warm).
+
+    Returns:
+        ``runs`` (seconds), ``min``, ``median``, ``mean``, ``warm``, the result's
+        ``rows`` and the ``measure_memory`` figures.
+    """
+    memory = measure_memory(func, reset)
+    runs = []
+    result = None
+    for _ in range(repeat):
+        reset()
+        started = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    func()
+    warm = time.perf_counter() - started
+    return {
+        'runs': runs,
+        'min': min(runs),
+        'median': statistics.median(runs),
+        'mean': statistics.fmean(runs),
+        'warm': warm,
+        'rows': row_count(result),
+        **memory,
+    }
+
+
+def run_benchmarks(data_dir: str, repeat: int = DEFAULT_REPEAT, export: bool = True) -> dict:
+    """Runs every step against the snapshot in ``data_dir`` and returns the results document."""
+    # The data modules build their backend from the environment at import.
+    os.environ['ANALYTIQ_BACKEND'] = 'duckdb'
+    os.environ['ANALYTIQ_PARQUET_DIR'] = data_dir
+    os.environ.pop('ANALYTIQ_CACHE_DIR', None)
+    # An empty schedule store, so purchase_schedule_view computes the schedule
+    # instead of serving whatever batch run (possibly of other data) is stored.
+    schedule_store = tempfile.TemporaryDirectory(prefix='benchmark-schedules-')
+    os.environ['ANALYTIQ_SCHEDULE_DIR'] = schedule_store.name
+    import data_access
+    from assistant_context import ContextIndex
+    from forecasting import build_schedule, DEFAULT_METHOD, DEFAULT_WINDOW
+    from sales_rollup import refresh_weekly_rollup
+    from views import build_weekly_sales_view, build_purchase_schedule_view
+
+    backend, cache = data_access.backend, data_access.result_cache
+    refresh_weekly_rollup(backend, full=True)
+    weeks = data_access.get_weeks()
+    branches = data_access.get_branches()
+    if len(weeks) < 2 + DEFAULT_WINDOW or not branches:
+        raise SystemExit(f"Snapshot in {data_dir} has too little data ({len(weeks)} weeks, {len(branches)} branches)")
+    # The latest week is usually partial; benchmark the last complete one.
+    week, prev_weeks = weeks[1], tuple(weeks[2:2 + DEFAULT_WINDOW])
+    branch = branches[0]
+
+    weekly = data_access.get_weekly_sales_table(week)
+    stock_ids = weekly['StockID'].unique().tolist()
+    supplier_ids = weekly['SupplierID'].dropna().unique().tolist()
+    history = data_access.get_sales_history(branch, prev_weeks)
+    onhand = data_access.get_stock_onhand_by_stockid(branch)
+    weekly_view = build_weekly_sales_view(week)
+    schedule_view = build_purchase_schedule_view(branch, prev_weeks, DEFAULT_METHOD, DEFAULT_WINDOW)
+
+    def build_context():
+        index = ContextIndex(weekly_view, 'Quantity Sold', f'Weekly Sales Table for week {week}.')
+        return [index.build_context(question) for question in SAMPLE_QUESTIONS]
+
+    steps = {
+        'refresh_weekly_rollup': lambda: refresh_weekly_rollup(backend, full=True),
+        'get_branches': data_access.get_branches,
+        'get_weeks': data_access.get_weeks,
+        'get_weekly_sales_table': lambda: data_access.get_weekly_sales_table(week),
+        'get_dimensions': data_access.get_dimensions,
+        'get_item_details_by_stockid': lambda: data_access.get_item_details_by_stockid(stock_ids),
+        'get_supplier_names_by_ids': lambda: data_access.get_supplier_names_by_ids(supplier_ids),
+        'get_sales_history': lambda: data_access.get_sales_history(branch, prev_weeks),
+        'get_stock_onhand_by_stockid': lambda: data_access.get_stock_onhand_by_stockid(branch),
+        'build_schedule': lambda: build_schedule(history, onhand, DEFAULT_METHOD, DEFAULT_WINDOW),
+        'weekly_sales_view': lambda: build_weekly_sales_view(week),
+        'purchase_schedule_view': lambda: build_purchase_schedule_view(branch, prev_weeks, DEFAULT_METHOD, DEFAULT_WINDOW),
+        'assistant_context': build_context,
+    }
+    if export and schedule_view is not None:
+        from purchase_export import export_purchase_orders
+        steps['export_pdf'] = lambda: export_purchase_orders(schedule_view, branch, week, 'pdf')
+        steps['export_zip'] = lambda: export_purchase_orders(schedule_view, branch, week, 'zip')
+
+    results = {}
+    for name, func in steps.items():
+        results[name] = time_step(func, repeat, cache.invalidate)
+        print(f"[benchmark] {name}: median {results[name]['median'] * 1000:.1f} ms, "
+              f"warm {results[name]['warm'] * 1000:.1f} ms, rows {results[name]['rows']}, "
+              f"peak {results[name]['peak_mb']:.1f} MB, result {results[name]['result_mb']:.2f} MB")
+
+    # Steady state: everything a warm app process keeps for this branch and week.
+    cache.invalidate()
+    for func in steps.values():
+        func()
+    memory = {'cache_mb': cache._bytes / 2**20, 'peak_rss_mb': _peak_rss_mb()}
+    print(f"[benchmark] result cache {memory['cache_mb']:.1f} MB, peak RSS {memory['peak_rss_mb'] or 0:.0f} MB")
+    schedule_store.cleanup()
+
+    manifest_path = os.path.join(data_dir, '_manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            data = json.load(f)
+    else:
+        data = {'rows': {'sales': int(backend.query(f"SELECT COUNT(*) AS n FROM {backend.table('sales')}")['n'][0])}}
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend': backend.name,
+        'data_dir': data_dir,
+        'data': data,
+        'params': {'branch': branch, 'week': week, 'history_weeks': list(prev_weeks), 'repeat': repeat},
+        'results': results,
+        'memory': memory,
+    }
+
+
+def _import_profile(stderr: str) -> dict:
+    """Sums the ``-X importtime`` lines printed after the app run started into top-level imports."""
+    lines = stderr.split(_APP_RUN_MARKER, 1)[-1].splitlines()
+    top_level = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module that triggered them.
+        if not name[1:].startswith(' '):
+            top_level[name.strip()] = int(cumulative) / 1e6
+    ranked = sorted(top_level.items(), key=lambda item: item[1], reverse=True)
+    return {'import_seconds': sum(top_level.values()), 'top_imports': ranked[:TOP_IMPORTS]}
+
+
+def measure_startup(data_dir: str, repeat: int = DEFAULT_REPEAT, backend: str = 'bigquery') -> dict:
+    """
+    Renders the app ``repeat`` times in fresh processes, as a new replica would.
+
+    With ``backend='bigquery'`` (the default) the processes use the
+    credentials in the environment, so the figures include the client setup
+    and the BigQuery round-trips of a real replica; ``'duckdb'`` renders from
+    the snapshot in ``data_dir`` instead, for offline comparisons.
+
+    Returns:
+        ``first_render`` and ``rerun`` timings (``runs``, ``median``), the
+        median ``import_seconds`` of the first render and the slowest
+        ``top_imports`` of the last process, with their cumulative seconds.
+    """
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    env = {**os.environ, 'ANALYTIQ_BACKEND': backend, 'ANALYTIQ_LLM': 'fake'}
+    if backend == 'duckdb':
+        env['ANALYTIQ_PARQUET_DIR'] = os.path.abspath(data_dir)
+    env.pop('ANALYTIQ_CACHE_DIR', None)
+    first, reruns, imports, profile = [], [], [], {}
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _STARTUP_SCRIPT, app_path],
+            capture_output=True, text=True, env=env, cwd=os.path.dirname(app_path),
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"Startup run failed:\n{proc.stderr[-2000:]}")
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        if timings['errors']:
+            raise RuntimeError(f"The app raised during startup: {timings['errors']}")
+        profile = _import_profile(proc.stderr)
+        first.append(timings['first_render'])
+        reruns.append(timings['rerun'])
+        imports.append(profile['import_seconds'])
+    return {
+        'backend': backend,
+        'first_render': {'runs': first, 'median': statistics.median(first)},
+        'rerun': {'runs': reruns, 'median': statistics.median(reruns)},
+        'import_seconds': statistics.median(imports),
+        'top_imports': profile['top_imports'],
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Prints the median of each step against ``baseline``.
+
+    Returns:
+        The names of the steps slower than ``threshold`` times their baseline.
+    """
+    regressions = []
+    print(f"{'step':32} {'baseline ms':>12} {'current ms':>12} {'ratio':>7} {'peak MB':>15} {'result MB':>15}")
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            print(f"{name:32} {'-':>12} {result['median'] * 1000:12.1f} {'new':>7}")
+            continue
+        ratio = result['median'] / before['median'] if before['median'] else float('inf')
+        flag = '  <-- slower' if ratio > threshold else ''
+        print(f"{name:32} {before['median'] * 1000:12.1f} {result['median'] * 1000:12.1f} {ratio:7.2f} "
+              f"{_change(before, result, 'peak_mb'):>15} {_change(before, result, 'result_mb'):>15}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    before, after = baseline.get('memory', {}), current.get('memory', {})
+    for field in ('cache_mb', 'peak_rss_mb'):
+        print(f"{field:32} {_change(before, after, field):>15}")
+    before, after = baseline.get('startup'), current.get('startup')
+    if after and before and before.get('backend') == after.get('backend'):
+        for field in ('first_render', 'rerun'):
+            ratio = after[field]['median'] / before[field]['median'] if before[field]['median'] else float('inf')
+            flag = '  <-- slower' if ratio > threshold else ''
+            print(f"{'startup_' + field:32} {before[field]['median'] * 1000:12.1f} "
+                  f"{after[field]['median'] * 1000:12.1f} {ratio:7.2f}{flag}")
+            if ratio > threshold:
+                regressions.append(f'startup_{field}')
+    return regressions
+
+
+def _change(before: dict, after: dict, field: str) -> str:
+    """``'<before> -> <after>'`` for a memory figure, or just the current value for older baselines."""
+    if after.get(field) is None:
+        return '-'
+    if before.get(field) is None:
+        return f"{after[field]:.1f}"
+    return f"{before[field]:.1f} -> {after[field]:.1f}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard data paths on a local Parquet snapshot.')
+    parser.add_argument('--data', default=os.path.join('data', 'synthetic'), help='Snapshot directory')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Cold runs per step')
+    parser.add_argument('--label', help='Name for this run (default: commit and time)')
+    parser.add_argument('--out', help=f'Results file (default: {DEFAULT_OUT_DIR}/<label>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown factor reported as a regression')
+    parser.add_argument('--no-export', action='store_true', help='Skip the purchase order export steps')
+    parser.add_argument('--startup', action='store_true', help='Also measure cold start (first render, import profile)')
+    parser.add_argument('--startup-backend', default='bigquery', choices=['bigquery', 'duckdb'],
+                        help='Backend of the cold-start runs (default: bigquery, with the credentials in the environment)')
+    args = parser.parse_args()
+
+    document = run_benchmarks(args.data, args.repeat, export=not args.no_export)
+    if args.startup:
+        document['startup'] = measure_startup(args.data, args.repeat, args.startup_backend)
+        startup = document['startup']
+        print(f"[benchmark] startup ({startup['backend']}): first render {startup['first_render']['median'] * 1000:.0f} ms "
+              f"({startup['import_seconds'] * 1000:.0f} ms importing), rerun {startup['rerun']['median'] * 1000:.0f} ms")
+        for name, seconds in startup['top_imports']:
+            print(f"[benchmark]   import {name}: {seconds * 1000:.0f} ms")
+    label = args.label or f"{document['git_commit'] or 'run'}-{datetime.datetime.now():%Y%m%d-%H%M%S}"
+    document['label'] = label
+    out = args.out or os.path.join(DEFAULT_OUT_DIR, f'{label}.json')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"[benchmark] Wrote {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(document, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(f"Regressions: {', '.join(regressions)}")
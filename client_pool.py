@@ -0,0 +1,78 @@
+"""
+Process-wide pool of the app's external clients.
+
+Building a client is slow: it imports a large SDK (``google-cloud-bigquery``,
+``google-generativeai``), parses credentials and sets up connections. Each
+client here is built on first use, once per process, and then shared by
+every session and thread; callers asking for a client that is still being
+built wait for it rather than building another.
+
+``warm_up`` builds clients on background threads. The app calls it near the
+top of every run (a no-op once they exist), so on a new replica the SDK
+imports and credential loading overlap the rest of the first render, and
+the first chat message doesn't pay for the LLM client.
+"""
+import threading
+import time
+
+from instrumentation import record_startup
+
+_lock = threading.Lock()
+_factories = {}  # name -> zero-argument callable building the client
+_clients = {}
+_building = {}  # name -> lock held while the client is built
+_warm_ups = {}  # name -> warm-up thread
+
+
+def register(name: str, factory) -> None:
+    """Declares how to build the client ``name``; it is built by the first ``get(name)``."""
+    with _lock:
+        _factories[name] = factory
+
+
+def get(name: str):
+    """
+    Returns the process-wide client ``name``, building it on first use.
+
+    Raises:
+        KeyError: No factory is registered under ``name``.
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        factory = _factories[name]
+        building = _building.setdefault(name, threading.Lock())
+    with building:
+        if name not in _clients:
+            started = time.perf_counter()
+            _clients[name] = factory()
+            record_startup(f'client_{name}', time.perf_counter() - started)
+        return _clients[name]
+
+
+def _warm(name):
+    try:
+        get(name)
+    except Exception as e:
+        # Not fatal here: the first real use builds (and reports) it again.
+        print(f"[client_pool] Warm-up of '{name}' failed: {e}")
+
+
+def warm_up(names) -> list:
+    """
+    Builds the clients ``names`` on background threads; returns the threads.
+
+    Clients already built or warming up are skipped, so calling this on
+    every script run is cheap.
+    """
+    threads = []
+    with _lock:
+        for name in names:
+            if name in _clients or name in _warm_ups or name not in _factories:
+                continue
+            thread = _warm_ups[name] = threading.Thread(target=_warm, args=(name,), name=f'warm_{name}', daemon=True)
+            threads.append(thread)
+    for thread in threads:
+        thread.start()
+    return threads
@@ -0,0 +1,157 @@
+"""
+Data functions behind the dashboard views.
+
+Every function runs its SQL through the configured query backend (see
+``query_backend.py``) and is cached in a tiered ResultCache keyed on its
+arguments and the data version of the tables it reads (see
+``result_cache.py``). Results are shared between sessions and must not be
+mutated in place.
+"""
+import os
+
+from dimension_store import DimensionStore
+from forecasting import load_sales_history
+from instrumentation import timed
+from query_backend import get_backend
+from result_cache import ResultCache, cached, DEFAULT_MAX_BYTES
+from sales_rollup import ROLLUP_TABLE, CALENDAR_TABLE
+from schedule_batch import find_schedule, SOURCE_TABLES as SCHEDULE_SOURCE_TABLES
+from stock_ledger import load_ledger
+
+# Query backend: BigQuery by default, or a local DuckDB/Parquet snapshot
+# when ANALYTIQ_BACKEND=duckdb (see query_backend.py)
+backend = get_backend()
+
+result_cache = ResultCache(
+    versions=backend.table_versions,
+    max_bytes=int(os.environ.get('ANALYTIQ_CACHE_MB', DEFAULT_MAX_BYTES // 2**20)) * 2**20,
+    disk_dir=os.environ.get('ANALYTIQ_CACHE_DIR') or None,
+)
+
+
+@cached(result_cache, ['sales'])
+def get_branches():
+    query = f"""
+        SELECT DISTINCT Branch AS branch FROM {backend.table('sales')}
+        WHERE Branch IS NOT NULL
+        ORDER BY branch
+    """
+    df = backend.query(query)
+    return df['branch'].tolist()
+
+
+@cached(result_cache, [CALENDAR_TABLE])
+def get_weeks():
+    query = f"""
+        SELECT week FROM {backend.table(CALENDAR_TABLE)}
+        ORDER BY week DESC
+    """
+    df = backend.query(query)
+    return df['week'].dropna().tolist()
+
+
+@cached(result_cache, [ROLLUP_TABLE])
+def get_sales_by_stockid(branch, week):
+    query = f"""
+        SELECT StockKey AS StockID, qty AS total_qty
+        FROM {backend.table(ROLLUP_TABLE)}
+        WHERE branch = @branch
+          AND week = @week
+    """
+    df = backend.query(query, {'branch': branch, 'week': week})
+    return df
+
+
+@cached(result_cache, [ROLLUP_TABLE])
+def get_sales_history(branch, weeks):
+    """
+    Returns the item × week sales history of a branch for the given weeks (one query).
+    """
+    return load_sales_history(backend, branch, weeks)
+
+
+@cached(result_cache, ['stock_onhands'])
+def get_stock_onhand_by_stockid(branch):
+    query = f"""
+        SELECT StockKey AS StockID, ONHAND
+        FROM {backend.table('stock_onhands')}
+        WHERE BRANCH = @branch
+    """
+    df = backend.query(query, {'branch': branch})
+    return df
+
+
+def get_precomputed_schedule(branch, weeks, method, window):
+    """
+    Returns the branch's schedule from the batch job's results store when it is current, else None.
+    """
+    with timed('data', 'get_precomputed_schedule') as info:
+        versions = {table: version for table, (version, _) in result_cache.table_versions(SCHEDULE_SOURCE_TABLES).items()}
+        schedule = find_schedule(branch, weeks, method, window, versions)
+        info.update(cache='miss' if schedule is None else 'hit', rows=None if schedule is None else len(schedule))
+    return schedule
+
+
+def get_stock_ledger():
+    """
+    Returns the weekly stock ledger (see ``stock_ledger.py``), read once per update, or None when it hasn't been built.
+    """
+    return load_ledger()
+
+
+def get_stock_onhand_as_of(branch, week):
+    """
+    Returns the stock on hand of ``branch`` at the end of ``week`` from the stock ledger, or None when the ledger doesn't reach that week.
+    """
+    with timed('data', 'get_stock_onhand_as_of') as info:
+        ledger = get_stock_ledger()
+        if ledger is None or ledger.through_week is None or week > ledger.through_week:
+            return None
+        df = ledger.as_of(branch, week)
+        info['rows'] = len(df)
+    return df
+
+
+@cached(result_cache, ['stock', 'suppliers'])
+def get_dimensions():
+    """
+    Returns the in-memory stock and supplier dimensions, loaded once per data version.
+    """
+    return DimensionStore.load(backend)
+
+
+def get_item_names_by_stockid(stockids):
+    return get_dimensions().item_names(stockids)
+
+
+def get_item_details_by_stockid(stockids):
+    return get_dimensions().item_details(stockids)
+
+
+def get_supplier_names_by_ids(supplier_ids):
+    return get_dimensions().supplier_names(supplier_ids)
+
+
+@cached(result_cache, [ROLLUP_TABLE, 'stock', 'suppliers'])
+def get_weekly_sales_table(week):
+    """
+    Returns a DataFrame with StockID, Name (Description1), SupplierID, Quantity sold, and LinkQty for the given week (all branches), only for items that sold.
+    """
+    query = f"""
+        SELECT
+            StockKey AS StockID,
+            SUM(sold_qty) AS Quantity_Sold,
+            SUM(sold_link_qty) AS LinkQty_Sold
+        FROM {backend.table(ROLLUP_TABLE)}
+        WHERE week = @week
+          AND sold_qty > 0
+          AND StockKey IS NOT NULL
+        GROUP BY 1
+        HAVING SUM(sold_qty) > 0
+    """
+    df = backend.query(query, {'week': week})
+    # Item names and suppliers come from the in-memory stock dimension
+    df = get_dimensions().attach_items(df, ['Description1', 'SupplierID'], how='inner')
+    df = df.rename(columns={'Description1': 'Name'})
+    df = df[['StockID', 'Name', 'SupplierID', 'Quantity_Sold', 'LinkQty_Sold']]
+    return df.sort_values('Quantity_Sold', ascending=False, kind='stable').reset_index(drop=True)
@@ -0,0 +1,98 @@
+"""
+In-process store for the small ``stock`` and ``suppliers`` dimensions.
+
+Both tables are loaded once per data version (~88k items, ~1.4k suppliers)
+into compact frames, with categorical dtypes for the repetitive columns and
+a hash index from key to row position. Item and supplier lookups are then
+local array takes instead of BigQuery jobs with giant ``IN (...)`` lists, and
+there is no limit on how many IDs a lookup can take. Each item also carries its
+supplier's name, so the views get every display column from one lookup.
+"""
+import pandas as pd
+
+from query_backend import QueryBackend
+
+ITEM_COLUMNS = ['Description1', 'SupplierID', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand']
+# Few distinct values relative to the row count: stored as categoricals.
+CATEGORICAL_ITEM_COLUMNS = ['SupplierID', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand']
+
+
+class DimensionStore:
+    """
+    Indexed item and supplier dimensions.
+
+    Args:
+        items: One row per StockKey with ``ITEM_COLUMNS``.
+        suppliers: One row per SupplierID with SupplierName.
+    """
+
+    def __init__(self, items: pd.DataFrame, suppliers: pd.DataFrame):
+        items = items.reset_index(drop=True)
+        for col in CATEGORICAL_ITEM_COLUMNS:
+            items[col] = items[col].astype('category')
+        self.suppliers = suppliers.reset_index(drop=True)
+        self.suppliers['SupplierName'] = self.suppliers['SupplierName'].astype('category')
+        self._supplier_index = pd.Index(self.suppliers['SupplierID'].astype(object))
+        supplier_positions = self._supplier_index.get_indexer(items['SupplierID'].astype(object))
+        items['SupplierName'] = self.suppliers['SupplierName'].array.take(supplier_positions, allow_fill=True)
+        self.items = items
+        self._item_index = pd.Index(items['StockKey'])
+
+    @classmethod
+    def load(cls, backend: QueryBackend) -> 'DimensionStore':
+        """Loads both dimensions from ``backend`` (two queries)."""
+        item_cols = ', '.join(f'ANY_VALUE({col}) AS {col}' for col in ITEM_COLUMNS)
+        items = backend.query(f"""
+            SELECT StockKey, {item_cols}
+            FROM {backend.table('stock')}
+            WHERE StockKey IS NOT NULL
+            GROUP BY StockKey
+        """)
+        suppliers = backend.query(f"""
+            SELECT SupplierID, ANY_VALUE(SupplierName) AS SupplierName
+            FROM {backend.table('suppliers')}
+            WHERE SupplierID IS NOT NULL
+            GROUP BY SupplierID
+        """)
+        return cls(items, suppliers)
+
+    def _take_items(self, stockids) -> pd.DataFrame:
+        positions = self._item_index.get_indexer(pd.Index(stockids).unique().dropna())
+        return self.items.take(positions[positions >= 0])
+
+    def item_details(self, stockids) -> pd.DataFrame:
+        """StockID plus ``ITEM_COLUMNS`` for the known items among ``stockids``."""
+        return self._take_items(stockids).rename(columns={'StockKey': 'StockID'}).reset_index(drop=True)
+
+    def item_names(self, stockids) -> pd.DataFrame:
+        """StockID and Description1 for the known items among ``stockids``."""
+        return self.item_details(stockids)[['StockID', 'Description1']]
+
+    def supplier_names(self, supplier_ids) -> pd.DataFrame:
+        """SupplierID and SupplierName for the known suppliers among ``supplier_ids``."""
+        positions = self._supplier_index.get_indexer(pd.Index(supplier_ids).unique().dropna())
+        return self.suppliers.take(positions[positions >= 0]).reset_index(drop=True)
+
+    def lookup_items(self, stockids, columns, index=None) -> pd.DataFrame:
+        """
+        Item ``columns`` (any of ``ITEM_COLUMNS`` or SupplierName) for each of ``stockids``, in order.
+
+        Unknown items get missing values. Categorical columns stay categorical,
+        so the result holds only codes for them.
+        """
+        positions = self._item_index.get_indexer(stockids)
+        return pd.DataFrame(
+            {col: self.items[col].array.take(positions, allow_fill=True) for col in columns},
+            index=index if index is not None else pd.RangeIndex(len(positions)),
+        )
+
+    def attach_items(self, df: pd.DataFrame, columns, on: str = 'StockID', how: str = 'left') -> pd.DataFrame:
+        """
+        Returns ``df`` joined with item ``columns`` on its ``on`` key column.
+
+        ``how='inner'`` drops rows whose key is not in the stock dimension.
+        """
+        out = df.join(self.lookup_items(df[on].to_numpy(), columns, index=df.index))
+        if how == 'inner':
+            out = out[self._item_index.get_indexer(df[on]) >= 0]
+        return out
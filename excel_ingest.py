@@ -0,0 +1,188 @@
+"""
+Streaming Excel → Parquet ingestion.
+
+Each sheet of the workbook is read exactly once, in read-only mode, as
+fixed-size row chunks. Every chunk is converted to the sheet's declared types
+(see ``table_schemas.py``) and appended to ``<out_dir>/<table>.parquet`` as an
+Arrow record batch, so memory per worker stays bounded by the chunk size no
+matter how long the sheet is. Sheets are parsed in parallel worker processes
+and each finished Parquet file is handed to an upload callback on a thread
+pool while the remaining sheets are still being parsed.
+
+The Parquet files double as the local snapshot read by the DuckDB backend.
+
+For incremental loads a sheet can be given a watermark (see
+``incremental_load.py``); only rows past it are written.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from table_schemas import arrow_schema, coerce_frame
+
+DEFAULT_CHUNK_ROWS = 50_000
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def table_name_for(sheet: str) -> str:
+    """Sanitizes a sheet name into a table name: spaces to underscores, lowercased."""
+    return sheet.strip().replace(' ', '_').lower()
+
+
+def list_sheets(path: str) -> list:
+    """Returns the sheet names of the workbook without loading any cells."""
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def iter_sheet_chunks(path: str, sheet: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    """
+    Yields ``(header, rows)`` for consecutive chunks of at most ``chunk_rows`` data rows.
+
+    Fully empty rows are skipped.
+    """
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h).strip() if h is not None else f'column_{i}' for i, h in enumerate(header)]
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append(row[:len(header)])
+            if len(chunk) >= chunk_rows:
+                yield header, chunk
+                chunk = []
+        if chunk:
+            yield header, chunk
+    finally:
+        wb.close()
+
+
+def apply_watermark(df: pd.DataFrame, watermark: dict) -> pd.DataFrame:
+    """
+    Keeps the rows of a typed chunk that are newer than ``watermark``.
+
+    A watermark is ``{'column', 'date', 'key', 'seen_keys'}``: rows dated after
+    ``date`` are kept; rows dated on ``date`` are kept unless their ``key``
+    value is in ``seen_keys`` (all of them are kept when ``key`` is None, as the
+    boundary day is then replaced). Rows without a date are dropped.
+    """
+    dates = pd.to_datetime(df[watermark['column']], errors='coerce')
+    boundary = pd.Timestamp(watermark['date'])
+    keep = dates > boundary
+    on_boundary = dates == boundary
+    if watermark.get('key'):
+        on_boundary &= ~df[watermark['key']].isin(watermark.get('seen_keys') or [])
+    return df[keep | on_boundary]
+
+
+def chunk_to_arrow(header, rows, table: str, watermark: dict | None = None):
+    """Converts raw worksheet rows into a typed Arrow table for ``table``."""
+    import pyarrow as pa
+    df = pd.DataFrame.from_records(rows, columns=header)
+    coerce_frame(df, table)
+    if watermark and watermark.get('date') is not None:
+        df = apply_watermark(df, watermark)
+    return pa.Table.from_pandas(df, schema=arrow_schema(table, df.columns), preserve_index=False)
+
+
+def sheet_to_parquet(path: str, sheet: str, out_dir: str, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                     watermark: dict | None = None) -> dict:
+    """
+    Streams one sheet into ``<out_dir>/<table>.parquet``.
+
+    Args:
+        watermark: Optional high-water mark; only newer rows are written.
+
+    Returns:
+        Stats for the sheet: table, parquet path, rows, seconds, rows_per_sec
+        and the watermark applied.
+    """
+    import pyarrow.parquet as pq
+    table = table_name_for(sheet)
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f'{table}.parquet')
+    tmp_path = out_path + '.tmp'
+    start = time.perf_counter()
+    rows_written = 0
+    writer = None
+    try:
+        for header, rows in iter_sheet_chunks(path, sheet, chunk_rows):
+            batch = chunk_to_arrow(header, rows, table, watermark)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema)
+            writer.write_table(batch)
+            rows_written += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return {'table': table, 'path': None, 'rows': 0, 'seconds': 0.0, 'rows_per_sec': 0.0,
+                'watermark': watermark}
+    os.replace(tmp_path, out_path)
+    seconds = time.perf_counter() - start
+    return {
+        'table': table,
+        'path': out_path,
+        'rows': rows_written,
+        'seconds': seconds,
+        'rows_per_sec': rows_written / seconds if seconds else 0.0,
+        'watermark': watermark,
+    }
+
+
+def ingest_workbook(path: str, out_dir: str, upload=None, sheets=None, watermarks: dict | None = None,
+                    max_workers: int = DEFAULT_WORKERS, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                    delta_dir: str | None = None) -> list:
+    """
+    Converts every sheet of a workbook to Parquet in parallel and uploads each as it finishes.
+
+    Peak memory is roughly ``max_workers`` chunks of ``chunk_rows`` rows.
+
+    Args:
+        path: Excel workbook to read.
+        out_dir: Directory for the per-table Parquet files.
+        upload: Optional ``upload(stats)`` callback, run on a thread pool as
+            each sheet's Parquet file is completed.
+        sheets: Sheet names to ingest (default: all sheets).
+        watermarks: Optional ``{table: watermark}`` for incremental loads.
+        delta_dir: Directory for the Parquet files of the watermarked sheets,
+            which hold only the new rows (default: ``out_dir``).
+        max_workers: Parallel sheet parsers (and concurrent uploads).
+        chunk_rows: Rows converted per Arrow batch.
+
+    Returns:
+        The per-sheet stats dicts, in completion order.
+    """
+    sheets = sheets or list_sheets(path)
+    watermarks = watermarks or {}
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as parsers, \
+            ThreadPoolExecutor(max_workers=max_workers) as uploaders:
+        parsing = {}
+        for sheet in sheets:
+            watermark = watermarks.get(table_name_for(sheet))
+            sheet_dir = out_dir if watermark is None else (delta_dir or out_dir)
+            parsing[parsers.submit(sheet_to_parquet, path, sheet, sheet_dir, chunk_rows, watermark)] = sheet
+        uploads = []
+        for future in as_completed(parsing):
+            stats = future.result()
+            print(f"Parsed {parsing[future]}: {stats['rows']} rows in {stats['seconds']:.1f}s "
+                  f"({stats['rows_per_sec']:,.0f} rows/s)")
+            results.append(stats)
+            if upload is not None and stats['path']:
+                uploads.append(uploaders.submit(upload, stats))
+        for future in as_completed(uploads):
+            future.result()
+    return results
@@ -0,0 +1,146 @@
+"""
+Vectorized demand forecasting for the Purchase Schedule.
+
+The whole history window for a branch is loaded with one query against the
+weekly rollup and pivoted into a dense item × week NumPy array (columns run
+oldest → newest). Forecast methods reduce that array to one expected weekly
+quantity per item, and order quantities are computed for all items at once.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from query_backend import QueryBackend
+from sales_rollup import ROLLUP_TABLE
+
+DEFAULT_METHOD = 'moving_average'
+DEFAULT_WINDOW = 4
+SEASON_LENGTH = 52
+
+
+class SalesHistory(NamedTuple):
+    """Weekly quantities for one branch: ``quantities[i, j]`` is item ``stock_ids[i]`` in ``weeks[j]``."""
+    stock_ids: np.ndarray
+    weeks: list
+    quantities: np.ndarray
+
+
+def load_sales_history(backend: QueryBackend, branch: str, weeks) -> SalesHistory:
+    """
+    Loads the weekly sales of ``branch`` for ``weeks`` in a single query.
+
+    Args:
+        backend: Query backend holding the weekly rollup.
+        branch: Branch code.
+        weeks: 'YYYY-WW' week labels, in any order.
+
+    Returns:
+        A SalesHistory with weeks sorted oldest → newest; items that did not
+        sell in a week have 0 there.
+    """
+    weeks = sorted(weeks)
+    if not weeks:
+        return SalesHistory(np.array([], dtype=object), [], np.zeros((0, 0)))
+    query = f"""
+        SELECT StockKey AS StockID, week, qty
+        FROM {backend.table(ROLLUP_TABLE)}
+        WHERE branch = @branch
+          AND week BETWEEN @first_week AND @last_week
+    """
+    df = backend.query(query, {'branch': branch, 'first_week': weeks[0], 'last_week': weeks[-1]})
+    return history_from_frame(df, weeks)
+
+
+def history_from_frame(df: pd.DataFrame, weeks) -> SalesHistory:
+    """
+    Pivots rollup rows (``StockID``, ``week``, ``qty``) of one branch into a SalesHistory over ``weeks``.
+    """
+    weeks = sorted(weeks)
+    df = df[df['week'].isin(weeks) & df['StockID'].notna()]
+    item_codes, stock_ids = pd.factorize(df['StockID'], sort=True)
+    week_codes = pd.Categorical(df['week'], categories=weeks).codes
+    quantities = np.zeros((len(stock_ids), len(weeks)))
+    np.add.at(quantities, (item_codes, week_codes), pd.to_numeric(df['qty'], errors='coerce').fillna(0).to_numpy())
+    return SalesHistory(np.asarray(stock_ids), weeks, quantities)
+
+
+def moving_average(quantities: np.ndarray, window: int = DEFAULT_WINDOW) -> np.ndarray:
+    """Mean of the last ``window`` weeks (weeks without sales count as 0)."""
+    recent = quantities[:, -window:]
+    if recent.shape[1] == 0:
+        return np.zeros(len(quantities))
+    return recent.mean(axis=1)
+
+
+def ewma(quantities: np.ndarray, window: int = DEFAULT_WINDOW) -> np.ndarray:
+    """Exponentially weighted mean of the last ``window`` weeks, with span ``window``."""
+    recent = quantities[:, -window:]
+    if recent.shape[1] == 0:
+        return np.zeros(len(quantities))
+    alpha = 2.0 / (window + 1)
+    ages = np.arange(recent.shape[1])[::-1]
+    weights = (1 - alpha) ** ages
+    return recent @ (weights / weights.sum())
+
+
+def seasonal_naive(quantities: np.ndarray, window: int = SEASON_LENGTH) -> np.ndarray:
+    """
+    Sales of the same week one season (``window`` weeks) earlier.
+
+    Falls back to the moving average when the history is shorter than a season.
+    """
+    if quantities.shape[1] < window:
+        return moving_average(quantities, quantities.shape[1])
+    return quantities[:, -window].astype(float)
+
+
+FORECAST_METHODS = {
+    'moving_average': moving_average,
+    'ewma': ewma,
+    'seasonal_naive': seasonal_naive,
+}
+
+METHOD_LABELS = {
+    'moving_average': 'N-week moving average',
+    'ewma': 'Exponentially weighted average',
+    'seasonal_naive': 'Seasonal naive (same week last year)',
+}
+
+
+def forecast(history: SalesHistory, method: str = DEFAULT_METHOD, window: int = DEFAULT_WINDOW) -> np.ndarray:
+    """Returns the next-week forecast per item in ``history`` using ``method``."""
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method '{method}' (expected one of {sorted(FORECAST_METHODS)})")
+    return FORECAST_METHODS[method](history.quantities, window)
+
+
+def order_quantities(forecast_qty: np.ndarray, onhand: np.ndarray) -> np.ndarray:
+    """Recommended orders: forecast minus stock on hand, with negative stock treated as zero."""
+    return np.clip(forecast_qty - np.clip(onhand, 0, None), 0, None)
+
+
+def build_schedule(history: SalesHistory, onhand_df: pd.DataFrame,
+                   method: str = DEFAULT_METHOD, window: int = DEFAULT_WINDOW) -> pd.DataFrame:
+    """
+    Computes the purchase schedule for every item in ``history``.
+
+    Args:
+        history: Weekly sales from ``load_sales_history``.
+        onhand_df: Stock on hand with ``StockID`` and ``ONHAND`` columns.
+        method: Key of ``FORECAST_METHODS``.
+        window: History length (weeks) used by the method.
+
+    Returns:
+        DataFrame with StockID, avg_sales (the forecast), ONHAND and RecommendedOrder.
+    """
+    onhand = pd.to_numeric(onhand_df['ONHAND'], errors='coerce').fillna(0).clip(lower=0)
+    onhand = onhand.groupby(onhand_df['StockID'].to_numpy()).sum()
+    onhand = onhand.reindex(history.stock_ids).fillna(0).to_numpy()
+    expected = forecast(history, method, window)
+    return pd.DataFrame({
+        'StockID': history.stock_ids,
+        'avg_sales': expected,
+        'ONHAND': onhand,
+        'RecommendedOrder': order_quantities(expected, onhand),
+    })
@@ -0,0 +1,107 @@
+"""
+Server-side grouped row model for the AgGrid tables.
+
+Instead of sending the whole table to the browser and grouping it there, the
+grid is fed one level at a time: the groups under the current group path, with
+their aggregates precomputed here, or (at the deepest level) one sorted page
+of the rows of a single group. Aggregates for every level are computed once
+per table with pandas group-bys.
+"""
+import numpy as np
+import pandas as pd
+
+BLANK = '(blank)'
+DEFAULT_PAGE_SIZE = 100
+ROW_COUNT_COLUMN = 'Items'
+
+
+class GroupedRowModel:
+    """
+    Precomputed group aggregates and row lookup over a table.
+
+    Args:
+        df: The table.
+        group_cols: Grouping columns, outermost first.
+        value_cols: Numeric columns summed per group.
+    """
+
+    def __init__(self, df: pd.DataFrame, group_cols, value_cols):
+        self.group_cols = list(group_cols)
+        self.value_cols = list(value_cols)
+        # Group columns as categoricals (sorted categories, blanks as BLANK):
+        # compact to keep per table and fast to group and sort.
+        df = df.assign(**{col: _group_values(df[col]) for col in self.group_cols})
+        self.rows = df.sort_values(self.group_cols, kind='stable').reset_index(drop=True)
+        self.levels = []
+        for depth in range(1, len(self.group_cols) + 1):
+            grouped = self.rows.groupby(self.group_cols[:depth], sort=True, observed=True)
+            level = grouped[self.value_cols].sum()
+            level[ROW_COUNT_COLUMN] = grouped.size()
+            self.levels.append(level)
+        # Row positions of each leaf group; rows are sorted, so these are contiguous.
+        self._leaf_positions = {
+            _as_tuple(path): positions
+            for path, positions in self.rows.groupby(self.group_cols, sort=False, observed=True).indices.items()
+        }
+
+    @property
+    def depth(self) -> int:
+        return len(self.group_cols)
+
+    def has_path(self, path) -> bool:
+        """Whether ``path`` (a tuple of group values, outermost first) exists in the table."""
+        path = tuple(path)
+        if not path:
+            return True
+        if len(path) > self.depth:
+            return False
+        index = self.levels[len(path) - 1].index
+        return (path if len(path) > 1 else path[0]) in index
+
+    def sort_options(self, path) -> list:
+        """Columns the rows under ``path`` can be sorted by."""
+        if len(path) < self.depth:
+            return self.value_cols + [ROW_COUNT_COLUMN, self.group_cols[len(path)]]
+        return list(self.rows.columns)
+
+    def children(self, path, sort_by: str | None = None, ascending: bool = False,
+                 page: int = 0, page_size: int = DEFAULT_PAGE_SIZE) -> tuple:
+        """
+        Returns one page of what lies under ``path``.
+
+        Above the deepest level this is the next level's groups, with the
+        summed ``value_cols`` and the row count; at the deepest level it is
+        the group's rows.
+
+        Returns:
+            ``(page_df, total)``, total being the number of groups or rows under ``path``.
+        """
+        path = tuple(path)
+        if len(path) < self.depth:
+            level = self.levels[len(path)]
+            if path:
+                level = level.xs(path, level=list(range(len(path))), drop_level=True)
+            children = level.reset_index()
+            children = children[[self.group_cols[len(path)], *self.value_cols, ROW_COUNT_COLUMN]]
+        else:
+            positions = self._leaf_positions.get(path, np.array([], dtype=int))
+            children = self.rows.iloc[positions]
+        if sort_by is not None and sort_by in children.columns:
+            children = children.sort_values(sort_by, ascending=ascending, kind='stable')
+        start = page * page_size
+        return children.iloc[start:start + page_size].reset_index(drop=True), len(children)
+
+
+def _group_values(values: pd.Series) -> pd.Series:
+    """A group column as a categorical of strings with sorted categories and blanks as ``BLANK``."""
+    values = values.astype('category')
+    values = values.cat.rename_categories(values.cat.categories.astype(str))
+    if values.isna().any():
+        if BLANK not in values.cat.categories:
+            values = values.cat.add_categories([BLANK])
+        values = values.fillna(BLANK)
+    return values.cat.reorder_categories(values.cat.categories.sort_values())
+
+
+def _as_tuple(key) -> tuple:
+    return key if isinstance(key, tuple) else (key,)
@@ -0,0 +1,99 @@
+"""
+Watermark-based incremental loads into BigQuery.
+
+Tables listed in ``table_schemas.WATERMARKS`` (``sales``, ``stock_taxan`` and
+``purchases``) can be loaded as deltas: the current high-water mark is read
+from the target table, the ingester writes only newer rows, and the delta is
+merged into the target in a single transaction. Every load, full or
+incremental, is recorded in the ``_ingest_log`` table so downstream caches can
+tell which tables changed.
+"""
+import datetime
+
+from table_schemas import WATERMARKS, STOCK_KEY_SOURCES
+
+INGEST_LOG_TABLE = '_ingest_log'
+
+
+def get_watermark(client, full_table_id: str, table: str) -> dict | None:
+    """
+    Reads the current high-water mark of ``table`` from BigQuery.
+
+    Returns:
+        A watermark dict for ``excel_ingest.apply_watermark`` (``date`` is None
+        when the table is empty), or None when the table must be loaded in
+        full: it does not exist, has no watermark columns, or predates the
+        StockKey column or its string codes.
+    """
+    from google.api_core.exceptions import NotFound
+    if table not in WATERMARKS:
+        return None
+    column, key = WATERMARKS[table]
+    try:
+        existing = client.get_table(full_table_id)
+    except NotFound:
+        return None
+    key_types = {field.field_type for field in existing.schema if field.name == 'StockKey'}
+    if table in STOCK_KEY_SOURCES and key_types != {'STRING'}:
+        return None
+    rows = list(client.query(f"SELECT MAX({column}) AS wm FROM `{full_table_id}`").result())
+    date = rows[0]['wm'] if rows else None
+    seen_keys = []
+    if date is not None and key:
+        # Only the keys on the boundary day are needed to de-duplicate it.
+        from google.cloud import bigquery
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter('wm', 'DATE', date)]
+        )
+        seen_keys = [
+            row[0] for row in client.query(
+                f"SELECT DISTINCT {key} FROM `{full_table_id}` WHERE {column} = @wm",
+                job_config=job_config,
+            ).result()
+        ]
+    return {'column': column, 'date': date, 'key': key, 'seen_keys': seen_keys}
+
+
+def merge_delta(client, full_table_id: str, delta_table_id: str, columns, watermark: dict) -> None:
+    """
+    Appends the staged delta to the target in one transaction.
+
+    For tables without a document key the watermark day is deleted first,
+    since the delta carries that whole day again.
+    """
+    from google.cloud import bigquery
+    column_list = ', '.join(f'`{col}`' for col in columns)
+    statements = ['BEGIN TRANSACTION;']
+    params = []
+    if watermark.get('date') is not None and not watermark.get('key'):
+        statements.append(f"DELETE FROM `{full_table_id}` WHERE {watermark['column']} = @wm;")
+        params.append(bigquery.ScalarQueryParameter('wm', 'DATE', watermark['date']))
+    statements.append(
+        f"INSERT INTO `{full_table_id}` ({column_list}) SELECT {column_list} FROM `{delta_table_id}`;"
+    )
+    statements.append('COMMIT TRANSACTION;')
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    client.query('\n'.join(statements), job_config=job_config).result()
+
+
+def record_load(client, project: str, dataset: str, table: str, mode: str, rows: int, watermark: dict | None) -> None:
+    """Appends a row describing a completed load to ``_ingest_log``."""
+    from google.cloud import bigquery
+    log_table_id = f"{project}.{dataset}.{INGEST_LOG_TABLE}"
+    schema = [
+        bigquery.SchemaField('table_name', 'STRING'),
+        bigquery.SchemaField('mode', 'STRING'),
+        bigquery.SchemaField('rows', 'INT64'),
+        bigquery.SchemaField('watermark', 'DATE'),
+        bigquery.SchemaField('loaded_at', 'TIMESTAMP'),
+    ]
+    client.create_table(bigquery.Table(log_table_id, schema=schema), exists_ok=True)
+    row = {
+        'table_name': table,
+        'mode': mode,
+        'rows': rows,
+        'watermark': watermark['date'].isoformat() if watermark and watermark.get('date') else None,
+        'loaded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    job_config = bigquery.LoadJobConfig(schema=schema, write_disposition='WRITE_APPEND')
+    client.load_table_from_json([row], log_table_id, job_config=job_config).result()
@@ -0,0 +1,272 @@
+"""
+Timing and volume metrics for the app's hot paths.
+
+Every instrumented step (query, data function, merge, assistant context,
+document export, LLM call, cold-start step) produces an event with its wall time and, where
+known, rows returned, bytes processed/billed and cache hit or miss. Events
+go to three places:
+
+- a structured log, one JSON object per line, when ``ANALYTIQ_METRICS_LOG``
+  names a file (``-`` for stdout);
+- running totals exposed in the Prometheus text format, written to
+  ``ANALYTIQ_METRICS_FILE`` (for a textfile collector) and/or served on
+  ``ANALYTIQ_METRICS_PORT``;
+- the trace of the current Streamlit rerun, shown in the sidebar's
+  performance panel.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_local = threading.local()
+_totals = {}  # (kind, name) -> {'calls', 'seconds', 'rows', 'bytes_processed', 'bytes_billed', 'hits', 'misses'}
+_startup = {}  # cold-start step -> seconds, as first measured in this process
+_log_file = None
+_server = None
+_server_lock = threading.Lock()
+
+
+def row_count(value):
+    """Rows in a DataFrame/list result (the first field of a NamedTuple), or None."""
+    if value is None:
+        return None
+    if hasattr(value, '_fields'):
+        value = value[0]
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def _log(event):
+    global _log_file
+    target = os.environ.get('ANALYTIQ_METRICS_LOG')
+    if not target:
+        return
+    line = json.dumps(event, default=str)
+    if target == '-':
+        print(line)
+        return
+    with _lock:
+        if _log_file is None or _log_file.name != target:
+            _log_file = open(target, 'a', buffering=1)
+        _log_file.write(line + '\n')
+
+
+def record(kind: str, name: str, seconds: float, rows=None, bytes_processed=None, bytes_billed=None,
+           cache: str | None = None, **extra) -> dict:
+    """
+    Records one finished step and returns its event.
+
+    Args:
+        kind: Step category: ``query``, ``data``, ``merge``, ``stage``, ``context``, ``export``, ``llm``
+            or ``startup``.
+        name: Step name, e.g. the data function.
+        seconds: Wall time.
+        rows: Rows returned, if known.
+        bytes_processed: Bytes scanned by the query engine, if known.
+        bytes_billed: Bytes billed, if known.
+        cache: ``'hit'``, ``'miss'`` or None when the step isn't cached.
+    """
+    event = {
+        'ts': time.time(), 'kind': kind, 'name': name, 'seconds': round(seconds, 6), 'rows': rows,
+        'bytes_processed': bytes_processed, 'bytes_billed': bytes_billed, 'cache': cache, **extra,
+    }
+    with _lock:
+        totals = _totals.setdefault((kind, name), {
+            'calls': 0, 'seconds': 0.0, 'rows': 0, 'bytes_processed': 0, 'bytes_billed': 0, 'hits': 0, 'misses': 0,
+        })
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['rows'] += rows or 0
+        totals['bytes_processed'] += bytes_processed or 0
+        totals['bytes_billed'] += bytes_billed or 0
+        if cache == 'hit':
+            totals['hits'] += 1
+        elif cache == 'miss':
+            totals['misses'] += 1
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.append(event)
+    _log(event)
+    return event
+
+
+def record_startup(step: str, seconds: float) -> bool:
+    """
+    Records a cold-start step (e.g. ``imports``, ``first_render``) the first time this process measures it.
+
+    Returns:
+        True when recorded, False when the process already has a measurement.
+    """
+    with _lock:
+        if step in _startup:
+            return False
+        _startup[step] = seconds
+    record('startup', step, seconds)
+    return True
+
+
+def startup_times() -> dict:
+    """The cold-start steps recorded by this process, in seconds."""
+    with _lock:
+        return dict(_startup)
+
+
+@contextlib.contextmanager
+def timed(kind: str, name: str, **fields):
+    """
+    Times the ``with`` block as one step.
+
+    The yielded dict can be filled with ``rows``, ``bytes_processed``,
+    ``bytes_billed`` or ``cache`` before the block ends.
+    """
+    info = dict(fields)
+    started = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record(kind, name, time.perf_counter() - started, **info)
+
+
+def instrument(kind: str, name: str | None = None):
+    """Decorator recording each call of a function as a step, with the rows it returns."""
+
+    def decorator(func):
+        step = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(kind, step) as info:
+                result = func(*args, **kwargs)
+                info['rows'] = row_count(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def current_step() -> str | None:
+    """Name of the innermost data function running on this thread (used to label queries)."""
+    stack = getattr(_local, 'steps', None)
+    return stack[-1] if stack else None
+
+
+@contextlib.contextmanager
+def step_scope(name: str):
+    """Marks ``name`` as the data function running on this thread for the ``with`` block."""
+    stack = getattr(_local, 'steps', None)
+    if stack is None:
+        stack = _local.steps = []
+    stack.append(name)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def start_trace() -> list:
+    """Starts collecting this thread's events (one Streamlit rerun) and returns the list they go to."""
+    _local.trace = []
+    return _local.trace
+
+
+def current_trace() -> list | None:
+    """The list this thread's events are collected in, if any."""
+    return getattr(_local, 'trace', None)
+
+
+@contextlib.contextmanager
+def use_trace(trace: list | None):
+    """Collects this thread's events in ``trace`` for the ``with`` block (work done on behalf of another thread)."""
+    previous = getattr(_local, 'trace', None)
+    _local.trace = trace
+    try:
+        yield
+    finally:
+        _local.trace = previous
+
+
+def render_prometheus() -> str:
+    """Returns the running totals in the Prometheus text exposition format."""
+    with _lock:
+        items = sorted(_totals.items())
+    lines = []
+    metrics = [
+        ('analytiq_step_seconds', 'summary', 'Wall time of instrumented steps.', None),
+        ('analytiq_step_rows_total', 'counter', 'Rows returned by instrumented steps.', 'rows'),
+        ('analytiq_bytes_processed_total', 'counter', 'Bytes processed by queries.', 'bytes_processed'),
+        ('analytiq_bytes_billed_total', 'counter', 'Bytes billed for queries.', 'bytes_billed'),
+    ]
+    for metric, kind, help_text, field in metrics:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for (step_kind, name), totals in items:
+            labels = f'kind="{step_kind}",name="{_escape(name)}"'
+            if field is None:
+                lines.append(f'{metric}_sum{{{labels}}} {totals["seconds"]:.6f}')
+                lines.append(f'{metric}_count{{{labels}}} {totals["calls"]}')
+            else:
+                lines.append(f'{metric}{{{labels}}} {totals[field]}')
+    lines.append('# HELP analytiq_cache_requests_total Cache lookups by result.')
+    lines.append('# TYPE analytiq_cache_requests_total counter')
+    for (step_kind, name), totals in items:
+        if totals['hits'] or totals['misses']:
+            labels = f'kind="{step_kind}",name="{_escape(name)}"'
+            lines.append(f'analytiq_cache_requests_total{{{labels},result="hit"}} {totals["hits"]}')
+            lines.append(f'analytiq_cache_requests_total{{{labels},result="miss"}} {totals["misses"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(path: str | None = None) -> None:
+    """Writes the totals to ``path`` (default ``ANALYTIQ_METRICS_FILE``; no-op when unset)."""
+    path = path or os.environ.get('ANALYTIQ_METRICS_FILE')
+    if not path:
+        return
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def serve_prometheus(port: int | None = None):
+    """
+    Serves the totals at ``http://<host>:<port>/metrics`` from a background thread.
+
+    Uses ``ANALYTIQ_METRICS_PORT`` when ``port`` is None; does nothing when
+    neither is set or the server is already running.
+    """
+    global _server
+    port = port or int(os.environ.get('ANALYTIQ_METRICS_PORT') or 0)
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    # Sessions start their runs concurrently; only the first may bind the port.
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(('', port), Handler)
+            threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+            print(f"[instrumentation] Serving metrics on port {port}")
+    return _server
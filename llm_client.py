@@ -0,0 +1,94 @@
+"""
+Pluggable LLM clients for the Data Assistant.
+
+A client turns a prompt into a stream of text chunks. ``GeminiClient`` calls
+Gemini with streaming enabled; ``FakeLLMClient`` streams a canned answer
+locally so the assistant can be exercised without an API key. Select one with
+the ``ANALYTIQ_LLM`` environment variable (``gemini`` or ``fake``). The
+app shares one client per process through ``client_pool.get('llm')``.
+"""
+import os
+import time
+
+import client_pool
+
+GEMINI_MODEL = 'gemini-1.5-flash'
+GEMINI_TIMEOUT = 60
+
+
+class LLMClient:
+    """Streams the answer to a prompt."""
+
+    name = 'base'
+
+    def stream(self, prompt: str):
+        """Yields the answer to ``prompt`` as text chunks, as they arrive."""
+        raise NotImplementedError
+
+
+class GeminiClient(LLMClient):
+    """
+    Streams answers from a Gemini model.
+
+    Args:
+        timeout: Seconds before the API call is abandoned, so a hung call
+            frees its AnswerService worker.
+    """
+
+    name = 'gemini'
+
+    def __init__(self, api_key: str | None, model: str = GEMINI_MODEL, timeout: float = GEMINI_TIMEOUT):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model)
+        self.timeout = timeout
+
+    def stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True, request_options={'timeout': self.timeout}):
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeLLMClient(LLMClient):
+    """
+    Local stand-in for an LLM, for development and tests.
+
+    Args:
+        answer: Callable mapping the prompt to the full answer; defaults to a
+            short description of the prompt.
+        delay: Seconds to wait before each chunk, to mimic token streaming.
+    """
+
+    name = 'fake'
+
+    def __init__(self, answer=None, delay: float = 0.02):
+        self.answer = answer or (lambda prompt: f'(fake answer to a {len(prompt)}-character prompt)')
+        self.delay = delay
+        self.calls = 0
+
+    def stream(self, prompt):
+        self.calls += 1
+        for word in self.answer(prompt).split(' '):
+            time.sleep(self.delay)
+            yield word + ' '
+
+
+def get_llm_client(kind: str | None = None) -> LLMClient:
+    """
+    Builds the client named by ``kind`` or the ``ANALYTIQ_LLM`` environment variable.
+
+    Args:
+        kind: ``'gemini'`` (default, uses ``GEMINI_API_KEY``) or ``'fake'``.
+    """
+    kind = (kind or os.environ.get('ANALYTIQ_LLM', 'gemini')).lower()
+    if kind == 'fake':
+        return FakeLLMClient()
+    if kind == 'gemini':
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            print('[get_llm_client] GEMINI_API_KEY is not set')
+        return GeminiClient(api_key)
+    raise ValueError(f"Unknown ANALYTIQ_LLM '{kind}' (expected 'gemini' or 'fake')")
+
+
+client_pool.register('llm', get_llm_client)
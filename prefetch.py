@@ -0,0 +1,98 @@
+"""
+Concurrent and speculative data fetching for page renders.
+
+``fetch_all`` runs a render's independent data functions at the same time
+on a bounded thread pool, so a page waits for its slowest query rather than
+the sum of them. ``prefetch`` queues the data the user is likely to ask for
+next (the neighbouring weeks, the other view) on a second, smaller pool;
+its results land in the shared result cache, so the next render is a cache
+hit. Both pools are process-wide and shared by every session, and a request
+for a result that is already being computed waits for it instead of
+querying again (see ``ResultCache.get_or_compute``).
+
+``ANALYTIQ_QUERY_WORKERS`` (default 8) and ``ANALYTIQ_PREFETCH_WORKERS``
+(default 2, 0 disables prefetching) size the pools.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import current_trace, use_trace
+
+DEFAULT_QUERY_WORKERS = 8
+DEFAULT_PREFETCH_WORKERS = 2
+# Prefetches queued or running at once; further ones are dropped.
+MAX_PENDING_PREFETCHES = 32
+
+_lock = threading.Lock()
+_local = threading.local()
+_pools = {}
+_pending = set()  # (function name, args) of queued or running prefetches
+
+
+def _pool(kind: str, default_workers: int) -> ThreadPoolExecutor | None:
+    with _lock:
+        if kind not in _pools:
+            workers = int(os.environ.get(f'ANALYTIQ_{kind.upper()}_WORKERS', default_workers))
+            _pools[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=kind) if workers > 0 else None
+        return _pools[kind]
+
+
+def _run_in_worker(trace, call):
+    _local.in_worker = True
+    with use_trace(trace):
+        return call()
+
+
+def fetch_all(*calls) -> list:
+    """
+    Calls each of ``calls`` (zero-argument callables) concurrently and returns their results in order.
+
+    The first call runs on the calling thread. Calls made from a pool thread
+    run in sequence, so nested fan-outs can't exhaust the pool. The first
+    exception raised is re-raised after all calls finish.
+    """
+    pool = _pool('query', DEFAULT_QUERY_WORKERS)
+    if len(calls) < 2 or pool is None or getattr(_local, 'in_worker', False):
+        return [call() for call in calls]
+    trace = current_trace()
+    futures = [pool.submit(_run_in_worker, trace, call) for call in calls[1:]]
+    try:
+        first = calls[0]()
+    finally:
+        others = [future.exception() for future in futures]
+    errors = [error for error in others if error is not None]
+    if errors:
+        raise errors[0]
+    return [first, *(future.result() for future in futures)]
+
+
+def _run_prefetch(key, func, args):
+    _local.in_worker = True
+    try:
+        func(*args)
+    except Exception as e:
+        print(f"[prefetch] {key[0]}{args} failed: {e}")
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def prefetch(func, *args) -> bool:
+    """
+    Calls ``func(*args)`` in the background, for its side effect of filling the result cache.
+
+    Returns:
+        False when prefetching is disabled, the same call is already queued,
+        or the queue is full.
+    """
+    pool = _pool('prefetch', DEFAULT_PREFETCH_WORKERS)
+    if pool is None:
+        return False
+    key = (func.__qualname__, args)
+    with _lock:
+        if key in _pending or len(_pending) >= MAX_PENDING_PREFETCHES:
+            return False
+        _pending.add(key)
+    pool.submit(_run_prefetch, key, func, args)
+    return True
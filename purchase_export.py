@@ -0,0 +1,230 @@
+"""
+Purchase-order documents for the Purchase Schedule view.
+
+Rows are formatted once, vectorized, into the exact strings printed in the
+table cells; documents are then rendered from those plain tuples in a process
+pool, one task per batch of suppliers. Two outputs are offered:
+
+- ``'pdf'``: one combined PDF with a page per supplier. FPDF cannot merge
+  documents, so it is rendered serially, as a single task in the pool;
+- ``'zip'``: a ZIP with a PDF and a CSV per supplier, rendered in parallel.
+
+The pool's workers are spawned rather than forked: the app process runs
+Streamlit's and the client pool's threads, which a fork would copy in
+whatever state they hold.
+
+Finished documents are cached (see ``result_cache.py``) on branch, week and a
+hash of the schedule, so repeat downloads don't render again.
+
+As in the original in-app report, items without a SupplierID or SupplierName
+are left out: they have no supplier to order from.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from instrumentation import timed
+
+EXPORT_FORMATS = {'pdf': 'Combined PDF', 'zip': 'ZIP (PDF + CSV per supplier)'}
+MIME_TYPES = {'pdf': 'application/pdf', 'zip': 'application/zip'}
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Below this many suppliers the pool's start-up costs more than it saves.
+MIN_PARALLEL_SUPPLIERS = 8
+
+# (header, width, preformatted column) of each table column.
+PDF_COLUMNS = [
+    ('Item Name', 60, 'Item Name'),
+    ('Order Qty', 22, 'Order Qty'),
+    ('Stock On Hand', 22, 'Stock On Hand'),
+    ('Avg Sales', 22, 'Avg Weekly Sales'),
+    ('Cat0', 28, 'Cat0'),
+    ('Cat1', 28, 'Cat1'),
+]
+CSV_COLUMNS = ['StockID', 'Item Name', 'Order Qty', 'Stock On Hand', 'Avg Weekly Sales', 'Cat0', 'Cat1', 'Brand']
+
+_pool = None
+_pool_lock = threading.Lock()
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w.-]+')
+
+
+def _latin1(values: pd.Series) -> pd.Series:
+    # The core PDF fonts are latin-1 only.
+    return values.str.encode('latin-1', 'replace').str.decode('latin-1')
+
+
+def with_supplier(display_df: pd.DataFrame) -> pd.DataFrame:
+    """The rows that have both a SupplierID and a SupplierName."""
+    return display_df.dropna(subset=['SupplierID', 'SupplierName'])
+
+
+def preformat(display_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the PDF cell texts of every row, plus SupplierID and SupplierName, as strings.
+
+    ``display_df`` must already be filtered by ``with_supplier``.
+    """
+    cells = pd.DataFrame(index=display_df.index)
+    cells['SupplierID'] = display_df['SupplierID'].astype(str)
+    cells['SupplierName'] = _latin1(display_df['SupplierName'].astype(str))
+    cells['Item Name'] = _latin1(display_df['Item Name'].astype(str).str[:40])
+    cells['Order Qty'] = display_df['Order Qty'].astype(str)
+    # Truncated like int() would, as in the original report.
+    cells['Stock On Hand'] = display_df['Stock On Hand'].fillna(0).astype('int64').astype(str)
+    cells['Avg Weekly Sales'] = display_df['Avg Weekly Sales'].fillna(0).astype('int64').astype(str)
+    cells['Cat0'] = _latin1(display_df['Cat0'].astype(str).str[:12])
+    cells['Cat1'] = _latin1(display_df['Cat1'].astype(str).str[:12])
+    return cells
+
+
+def _supplier_groups(cells: pd.DataFrame) -> list:
+    """``(SupplierID, SupplierName, rows)`` per supplier, rows being tuples of cell texts."""
+    cell_columns = [source for _, _, source in PDF_COLUMNS]
+    groups = []
+    for (sid, sname), group in cells.groupby(['SupplierID', 'SupplierName'], sort=True):
+        groups.append((sid, sname, list(group[cell_columns].itertuples(index=False, name=None))))
+    return groups
+
+
+def _add_supplier_page(pdf, sid, sname, rows, branch, week):
+    pdf.add_page()
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, f'Purchase Recommendation - {sname} ({sid})', ln=1)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, f'Branch: {branch} | Week: {week}', ln=1)
+    pdf.ln(4)
+    pdf.set_font('Arial', 'B', 11)
+    for header, width, _ in PDF_COLUMNS:
+        pdf.cell(width, 8, header, 1)
+    pdf.ln()
+    pdf.set_font('Arial', '', 9)
+    widths = [width for _, width, _ in PDF_COLUMNS]
+    for row in rows:
+        for width, text in zip(widths, row):
+            pdf.cell(width, 8, text, 1)
+        pdf.ln()
+
+
+def render_pdf(groups, branch, week) -> tuple:
+    """
+    Renders one PDF starting a page per ``(SupplierID, SupplierName, rows)`` group.
+
+    Returns:
+        ``(bytes, pages)``; long suppliers run over several pages.
+    """
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    for sid, sname, rows in groups:
+        _add_supplier_page(pdf, sid, sname, rows, branch, week)
+    return pdf.output(dest='S').encode('latin1'), pdf.page_no()
+
+
+def _render_supplier_pdfs(groups, branch, week) -> list:
+    """Worker task: a separate PDF for each group, as ``(SupplierID, SupplierName, bytes, pages)``."""
+    return [(sid, sname, *render_pdf([(sid, sname, rows)], branch, week)) for sid, sname, rows in groups]
+
+
+def _get_pool(max_workers):
+    global _pool
+    # Sessions export concurrently; without the lock each could start its own pool.
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _batches(groups, count):
+    # Round-robin keeps batches balanced, since suppliers are sorted by ID, not size.
+    return [batch for batch in (groups[i::count] for i in range(count)) if batch]
+
+
+def _supplier_pdfs(groups, branch, week, max_workers) -> list:
+    if len(groups) < MIN_PARALLEL_SUPPLIERS or max_workers <= 1:
+        return _render_supplier_pdfs(groups, branch, week)
+    pool = _get_pool(max_workers)
+    futures = [
+        pool.submit(_render_supplier_pdfs, batch, branch, week)
+        for batch in _batches(groups, max_workers * 4)
+    ]
+    return [document for future in futures for document in future.result()]
+
+
+def _file_stem(sid, sname) -> str:
+    return _UNSAFE_FILENAME_RE.sub('_', f'{sid}_{sname}').strip('_') or 'supplier'
+
+
+def build_zip(display_df: pd.DataFrame, groups, branch, week, max_workers) -> tuple:
+    """
+    ZIP with ``<supplier>.pdf`` and ``<supplier>.csv`` for every supplier.
+
+    Returns:
+        ``(bytes, pages)``, pages being the total over the supplier PDFs.
+    """
+    buffer = io.BytesIO()
+    pages = 0
+    csv_columns = [col for col in CSV_COLUMNS if col in display_df.columns]
+    supplier_ids = display_df['SupplierID'].astype(str)
+    csv_groups = {sid: group for sid, group in display_df[csv_columns].groupby(supplier_ids.to_numpy())}
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for sid, sname, pdf_bytes, pdf_pages in _supplier_pdfs(groups, branch, week, max_workers):
+            stem = _file_stem(sid, sname)
+            archive.writestr(f'{stem}.pdf', pdf_bytes)
+            archive.writestr(f'{stem}.csv', csv_groups[sid].to_csv(index=False))
+            pages += pdf_pages
+    return buffer.getvalue(), pages
+
+
+def export_key(display_df: pd.DataFrame, branch, week, fmt: str) -> str:
+    row_hashes = pd.util.hash_pandas_object(display_df, index=False).to_numpy()
+    return hashlib.sha256(f'{branch}\n{week}\n{fmt}\n'.encode('utf-8') + row_hashes.tobytes()).hexdigest()
+
+
+def export_purchase_orders(display_df: pd.DataFrame, branch, week, fmt: str = 'pdf',
+                           cache=None, max_workers: int = DEFAULT_WORKERS) -> bytes:
+    """
+    Builds the purchase-order document for the displayed schedule.
+
+    Args:
+        display_df: The Purchase Schedule table as displayed; rows without a
+            supplier are left out.
+        branch: Branch printed on each page.
+        week: Week printed on each page.
+        fmt: ``'pdf'`` (combined) or ``'zip'`` (PDF and CSV per supplier).
+        cache: Optional ResultCache holding finished documents.
+        max_workers: Worker processes for per-supplier rendering.
+
+    Returns:
+        The document bytes.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}' (expected one of {', '.join(EXPORT_FORMATS)})")
+    display_df = with_supplier(display_df)
+    with timed('export', f'export_{fmt}') as info:
+        key = export_key(display_df, branch, week, fmt)
+        if cache is not None:
+            hit, document = cache.get(key, ('purchase_export',))
+            if hit:
+                suppliers = len(display_df[['SupplierID', 'SupplierName']].drop_duplicates())
+                info.update(cache='hit', bytes=len(document), suppliers=suppliers)
+                return document
+        groups = _supplier_groups(preformat(display_df))
+        if fmt == 'pdf':
+            if len(groups) >= MIN_PARALLEL_SUPPLIERS and max_workers > 1:
+                # A single document, rendered serially, but off the app process so other sessions stay responsive.
+                document, pages = _get_pool(max_workers).submit(render_pdf, groups, branch, week).result()
+            else:
+                document, pages = render_pdf(groups, branch, week)
+        else:
+            document, pages = build_zip(display_df, groups, branch, week, max_workers)
+        if cache is not None:
+            cache.put(key, document, tables=('purchase_export',))
+        info.update(cache='miss' if cache is not None else None, bytes=len(document),
+                    suppliers=len(groups), pages=pages)
+    return document
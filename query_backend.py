@@ -0,0 +1,373 @@
+"""
+Query backends for the dashboard data functions.
+
+The dashboard data functions (``data_access.py``) write their SQL once, in BigQuery dialect, and
+hand it to a backend. ``BigQueryBackend`` sends it to BigQuery unchanged;
+``DuckDBBackend`` runs it in-process over a local Parquet snapshot of the
+``bigsave.demo`` tables, which gives fast interactive queries, an offline
+dev/test mode and a way to benchmark the app without cloud credentials.
+
+Select the backend with the ``ANALYTIQ_BACKEND`` environment variable
+(``bigquery`` or ``duckdb``); the DuckDB backend reads its snapshot from
+``ANALYTIQ_PARQUET_DIR`` (default ``data/``).
+"""
+import datetime
+import glob
+import json
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+
+import client_pool
+from instrumentation import current_step, timed
+
+PROJECT_ID = 'bigsave'
+DATASET = 'demo'
+SERVICE_ACCOUNT_JSON = 'bigsave-6767d8651634.json'
+DEFAULT_PARQUET_DIR = 'data'
+
+# Tables the app reads; these make up a local snapshot.
+SNAPSHOT_TABLES = ['sales', 'stock', 'stock_onhands', 'suppliers', 'stock_taxan', 'purchases']
+
+# Text columns with few distinct values, returned as categoricals. Other text
+# columns become categoricals when each value repeats at least twice on
+# average, and Arrow-backed strings otherwise.
+CATEGORICAL_COLUMNS = {
+    'Branch', 'branch', 'BRANCH', 'WH', 'week', 'SupplierID', 'SupplierName',
+    'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand',
+}
+# Quantity columns converted to numbers when a table stores them as text.
+NUMERIC_COLUMNS = {'qty', 'total_qty', 'ONHAND', 'Quantity_Sold', 'LinkQty_Sold', 'sold_qty', 'sold_link_qty'}
+MIN_CATEGORICAL_ROWS = 64
+
+_PARAM_RE = re.compile(r'@(\w+)')
+_STRING_DTYPE = pd.StringDtype('pyarrow')
+# Names of the text type in table_columns(): BigQuery's, then DuckDB's.
+STRING_TYPES = ('STRING', 'VARCHAR')
+
+
+class QueryBackend:
+    """Runs BigQuery-dialect SQL and returns the result as a DataFrame."""
+
+    name = 'base'
+    # Pooled clients (see ``client_pool.py``) the backend uses, for warming up.
+    clients = ()
+
+    def table(self, name: str) -> str:
+        """Returns the SQL reference for table ``name``."""
+        raise NotImplementedError
+
+    def query(self, sql: str, params: dict | None = None) -> pd.DataFrame:
+        """Runs ``sql`` with named ``@param`` parameters and returns a DataFrame."""
+        raise NotImplementedError
+
+    def execute(self, sql: str, params: dict | None = None) -> None:
+        """Runs a statement (DDL/DML) whose result is not needed."""
+        self.query(sql, params)
+
+    def execute_transaction(self, statements) -> None:
+        """Runs ``(sql, params)`` DML statements in one transaction: all of them take effect or none do."""
+        raise NotImplementedError
+
+    def table_versions(self, tables) -> dict:
+        """Returns an opaque version per table that changes whenever the table's data does."""
+        raise NotImplementedError
+
+    def table_columns(self, name: str) -> dict | None:
+        """Returns ``{column: type}`` of table ``name`` (types as the engine names them), or None if it doesn't exist."""
+        raise NotImplementedError
+
+
+class BigQueryBackend(QueryBackend):
+    """
+    Runs queries against the ``bigsave.demo`` dataset in BigQuery.
+
+    Without an explicit ``client``, the process-wide pooled client is used,
+    built on the first query rather than when the backend is created.
+    """
+
+    name = 'bigquery'
+    clients = ('bigquery',)
+
+    def __init__(self, client=None, project: str = PROJECT_ID, dataset: str = DATASET):
+        self._client = client
+        self.project = project
+        self.dataset = dataset
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else client_pool.get('bigquery')
+
+    def table(self, name: str) -> str:
+        return f'`{self.project}.{self.dataset}.{name}`'
+
+    def query(self, sql, params=None):
+        from google.cloud import bigquery
+        job_config = bigquery.QueryJobConfig(query_parameters=_bigquery_parameters(params or {}))
+        with timed('query', current_step() or 'query', backend=self.name) as info:
+            job = self.client.query(sql, job_config=job_config)
+            df = to_frame(job.to_arrow())
+            info.update(
+                rows=len(df),
+                bytes_processed=job.total_bytes_processed,
+                bytes_billed=job.total_bytes_billed,
+                cache='hit' if job.cache_hit else 'miss',
+            )
+        return df
+
+    def execute(self, sql, params=None):
+        from google.cloud import bigquery
+        job_config = bigquery.QueryJobConfig(query_parameters=_bigquery_parameters(params or {}))
+        self.client.query(sql, job_config=job_config).result()
+
+    def execute_transaction(self, statements):
+        # One multi-statement script; BigQuery rolls the transaction back if any statement fails.
+        from google.cloud import bigquery
+        params = {}
+        for _, statement_params in statements:
+            params.update(statement_params or {})
+        script = ';\n'.join(['BEGIN TRANSACTION', *(sql for sql, _ in statements), 'COMMIT TRANSACTION'])
+        job_config = bigquery.QueryJobConfig(query_parameters=_bigquery_parameters(params))
+        self.client.query(script, job_config=job_config).result()
+
+    def table_versions(self, tables):
+        # Table metadata calls are cheap and don't start a query job.
+        from google.api_core.exceptions import NotFound
+        versions = {}
+        for name in tables:
+            try:
+                modified = self.client.get_table(f'{self.project}.{self.dataset}.{name}').modified
+                versions[name] = modified.isoformat() if modified else None
+            except NotFound:
+                versions[name] = None
+        return versions
+
+    def table_columns(self, name):
+        from google.api_core.exceptions import NotFound
+        try:
+            table = self.client.get_table(f'{self.project}.{self.dataset}.{name}')
+        except NotFound:
+            return None
+        return {field.name: field.field_type for field in table.schema}
+
+
+class DuckDBBackend(QueryBackend):
+    """
+    Runs queries in an embedded DuckDB database over a local Parquet snapshot.
+
+    Each table is read from ``<parquet_dir>/<table>.parquet`` or, for tables
+    written in several parts, ``<parquet_dir>/<table>/*.parquet``. The
+    connection is primed with macros emulating the BigQuery functions the app
+    uses (``PARSE_DATE``, ``FORMAT_DATE``, ``FLOAT64``) so the same SQL runs on
+    both backends.
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, parquet_dir: str = DEFAULT_PARQUET_DIR, database: str = ':memory:'):
+        import duckdb
+        self.parquet_dir = parquet_dir
+        self.con = duckdb.connect(database)
+        self._writes = 0
+        self._prime()
+        if self._parquet_source('sales'):
+            # The app only reads the weekly rollup, so a snapshot gets it when it is opened.
+            from sales_rollup import refresh_weekly_rollup
+            refresh_weekly_rollup(self)
+
+    def _prime(self):
+        statements = [
+            "CREATE TYPE FLOAT64 AS DOUBLE",
+            "CREATE TYPE INT64 AS BIGINT",
+            "CREATE MACRO parse_date(fmt, s) AS CAST(strptime(s, fmt) AS DATE)",
+            "CREATE MACRO format_date(fmt, d) AS strftime(d, fmt)",
+        ]
+        for statement in statements:
+            try:
+                self.con.execute(statement)
+            except Exception:
+                # Already defined in a persistent database.
+                pass
+        for name in SNAPSHOT_TABLES:
+            source = self._parquet_source(name)
+            if source:
+                self.con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet('{source}')")
+
+    def _parquet_source(self, name):
+        path = os.path.join(self.parquet_dir, f'{name}.parquet')
+        if os.path.exists(path):
+            return path
+        parts = os.path.join(self.parquet_dir, name, '*.parquet')
+        if glob.glob(parts):
+            return parts
+        return None
+
+    def table(self, name: str) -> str:
+        return name
+
+    def query(self, sql, params=None):
+        sql = _PARAM_RE.sub(r'$\1', sql)
+        # A cursor per call keeps the shared connection safe across Streamlit threads.
+        with timed('query', current_step() or 'query', backend=self.name) as info, self.con.cursor() as cur:
+            df = to_frame(cur.execute(sql, params or {}).fetch_arrow_table())
+            info['rows'] = len(df)
+        return df
+
+    def execute(self, sql, params=None):
+        sql = _PARAM_RE.sub(r'$\1', sql)
+        with self.con.cursor() as cur:
+            cur.execute(sql, params or {})
+        self._writes += 1
+
+    def execute_transaction(self, statements):
+        with self.con.cursor() as cur:
+            cur.execute('BEGIN TRANSACTION')
+            try:
+                for sql, params in statements:
+                    cur.execute(_PARAM_RE.sub(r'$\1', sql), params or {})
+                cur.execute('COMMIT')
+            except BaseException:
+                cur.execute('ROLLBACK')
+                raise
+        self._writes += 1
+
+    def table_versions(self, tables):
+        # Snapshot tables are versioned by their Parquet files' mtimes; tables
+        # materialized in DuckDB (e.g. the rollup) by the connection's write count.
+        versions = {}
+        for name in tables:
+            source = self._parquet_source(name)
+            if source:
+                versions[name] = max(os.path.getmtime(p) for p in glob.glob(source))
+            else:
+                versions[name] = f'local-{self._writes}'
+        return versions
+
+    def table_columns(self, name):
+        import duckdb
+        with self.con.cursor() as cur:
+            try:
+                rows = cur.execute(f"DESCRIBE {self.table(name)}").fetchall()
+            except duckdb.CatalogException:
+                return None
+        return {row[0]: row[1] for row in rows}
+
+
+def to_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow query result into a compact DataFrame.
+
+    Repetitive text columns become categoricals (with sorted categories, so
+    they sort like the strings), other text columns Arrow-backed strings,
+    decimals float64, and ``NUMERIC_COLUMNS`` stored as text are parsed as
+    numbers; nothing is held as Python objects except dates.
+    """
+    import pyarrow.compute as pc
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_decimal(column.type):
+            column = pc.cast(column, pa.float64())
+        elif (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)) and name not in NUMERIC_COLUMNS:
+            if name in CATEGORICAL_COLUMNS or (
+                len(column) >= MIN_CATEGORICAL_ROWS and pc.count_distinct(column).as_py() * 2 <= len(column)
+            ):
+                column = _sorted_dictionary(column)
+        columns.append(column)
+    df = pa.Table.from_arrays(columns, names=table.column_names).to_pandas(
+        types_mapper={pa.string(): _STRING_DTYPE, pa.large_string(): _STRING_DTYPE}.get,
+    )
+    for name in NUMERIC_COLUMNS.intersection(df.columns):
+        if not pd.api.types.is_numeric_dtype(df[name].dtype):
+            df[name] = pd.to_numeric(df[name].to_numpy(dtype=object, na_value=None), errors='coerce')
+    return df
+
+
+def _sorted_dictionary(column) -> pa.DictionaryArray:
+    """Dictionary-encodes a text column with a sorted dictionary."""
+    import numpy as np
+    import pyarrow.compute as pc
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    encoded = column.dictionary_encode()
+    order = pc.sort_indices(encoded.dictionary).to_numpy()
+    ranks = np.empty(len(order), dtype=np.int32)
+    ranks[order] = np.arange(len(order), dtype=np.int32)
+    return pa.DictionaryArray.from_arrays(pc.take(pa.array(ranks), encoded.indices), pc.take(encoded.dictionary, order))
+
+
+def _make_bigquery_client():
+    from google.cloud import bigquery
+    if os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON"):
+        service_account_info = json.loads(os.environ["GOOGLE_SERVICE_ACCOUNT_JSON"])
+        return bigquery.Client.from_service_account_info(service_account_info)
+    return bigquery.Client.from_service_account_json(SERVICE_ACCOUNT_JSON)
+
+
+client_pool.register('bigquery', _make_bigquery_client)
+
+
+def _bigquery_type(value):
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, int):
+        return 'INT64'
+    if isinstance(value, float):
+        return 'FLOAT64'
+    if isinstance(value, datetime.datetime):
+        return 'TIMESTAMP'
+    if isinstance(value, datetime.date):
+        return 'DATE'
+    return 'STRING'
+
+
+def _bigquery_parameters(params):
+    from google.cloud import bigquery
+    query_parameters = []
+    for name, value in params.items():
+        if isinstance(value, (list, tuple)):
+            element_type = _bigquery_type(value[0]) if value else 'STRING'
+            query_parameters.append(bigquery.ArrayQueryParameter(name, element_type, list(value)))
+        else:
+            query_parameters.append(bigquery.ScalarQueryParameter(name, _bigquery_type(value), value))
+    return query_parameters
+
+
+def get_backend(kind: str | None = None) -> QueryBackend:
+    """
+    Builds the backend named by ``kind`` or the ``ANALYTIQ_BACKEND`` environment variable.
+
+    Args:
+        kind: ``'bigquery'`` (default) or ``'duckdb'``.
+
+    Returns:
+        A ready-to-use QueryBackend.
+    """
+    kind = (kind or os.environ.get('ANALYTIQ_BACKEND', 'bigquery')).lower()
+    if kind == 'duckdb':
+        return DuckDBBackend(
+            os.environ.get('ANALYTIQ_PARQUET_DIR', DEFAULT_PARQUET_DIR),
+            os.environ.get('ANALYTIQ_DUCKDB_PATH', ':memory:'),
+        )
+    if kind == 'bigquery':
+        return BigQueryBackend()
+    raise ValueError(f"Unknown ANALYTIQ_BACKEND '{kind}' (expected 'bigquery' or 'duckdb')")
+
+
+def export_snapshot(source: QueryBackend, out_dir: str = DEFAULT_PARQUET_DIR, tables=None) -> list:
+    """
+    Copies tables from ``source`` into ``<out_dir>/<table>.parquet`` for the DuckDB backend.
+
+    Returns:
+        The list of Parquet paths written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name in tables or SNAPSHOT_TABLES:
+        df = source.query(f"SELECT * FROM {source.table(name)}")
+        path = os.path.join(out_dir, f'{name}.parquet')
+        df.to_parquet(path, index=False)
+        print(f"Wrote {len(df)} rows to {path}")
+        written.append(path)
+    return written
@@ -0,0 +1,271 @@
+"""
+Tiered cache for query results.
+
+Entries are keyed on the function, its arguments and the current *data
+version* of every table it reads, so a load into one table only invalidates
+the results that depend on it. The memory tier is bounded in bytes with LRU
+eviction; an optional disk tier (pickles under ``ANALYTIQ_CACHE_DIR``) lets
+results survive process restarts. Each entry's TTL is the shortest TTL of its
+tables: fast-moving tables such as ``stock_onhands`` expire on their own,
+while historical rollups live until their version changes.
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from instrumentation import row_count, step_scope, timed
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_DISK_ENTRIES = 2000
+# How long table versions are trusted before being re-read from the backend.
+DEFAULT_VERSION_TTL = 60
+
+# Seconds before a result built from this table expires regardless of its
+# version; tables not listed never expire on time alone.
+TABLE_TTLS = {
+    'stock_onhands': 5 * 60,
+    'stock': 24 * 60 * 60,
+    'suppliers': 24 * 60 * 60,
+}
+
+
+def _sizeof(value) -> int:
+    if hasattr(value, 'memory_usage'):
+        try:
+            return int(value.memory_usage(deep=True).sum())
+        except TypeError:
+            pass
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ResultCache:
+    """
+    Bounded, versioned, two-tier result cache.
+
+    Args:
+        versions: Callable mapping a list of table names to ``{table: version}``
+            (usually ``QueryBackend.table_versions``).
+        max_bytes: Memory tier budget; least recently used entries are evicted first.
+        disk_dir: Optional directory for the persistent tier.
+        max_disk_entries: Disk tier size; least recently used files are removed first.
+        version_ttl: Seconds a fetched table version is reused before re-checking.
+    """
+
+    def __init__(self, versions=None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 disk_dir: str | None = None, max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+                 version_ttl: float = DEFAULT_VERSION_TTL):
+        self.versions = versions
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.version_ttl = version_ttl
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires_at, tables)
+        self._bytes = 0
+        self._versions = {}  # table -> (version, fetched_at)
+        self._generations = {}  # table -> local invalidation counter
+        self._inflight = {}  # key -> Future of a computation in progress
+        self._lock = threading.RLock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # --- table versions -------------------------------------------------
+
+    def table_versions(self, tables) -> dict:
+        """Returns the current version of each table, re-reading stale ones from the backend."""
+        now = time.time()
+        with self._lock:
+            stale = [t for t in tables if t not in self._versions or now - self._versions[t][1] > self.version_ttl]
+        if stale and self.versions is not None:
+            try:
+                fetched = self.versions(stale)
+            except Exception as e:
+                # Keep serving with the last known versions rather than failing the page.
+                print(f"[ResultCache] Could not read table versions: {e}")
+                fetched = {t: self._versions.get(t, (None, 0))[0] for t in stale}
+            with self._lock:
+                for table in stale:
+                    self._versions[table] = (fetched.get(table), now)
+        with self._lock:
+            return {t: (self._versions.get(t, (None, 0))[0], self._generations.get(t, 0)) for t in tables}
+
+    def refresh_versions(self) -> None:
+        """Forgets all known table versions so the next lookups re-check the backend."""
+        with self._lock:
+            self._versions.clear()
+
+    def invalidate(self, table: str | None = None) -> None:
+        """Drops cached results (both tiers) that depend on ``table``, or everything when None."""
+        with self._lock:
+            if table is None:
+                self._versions.clear()
+            else:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                self._versions.pop(table, None)
+            for key in [k for k, entry in self._entries.items() if table is None or table in entry[3]]:
+                self._drop(key)
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.pkl') and (table is None or table in name.split('__')[0].split('+')):
+                    _remove(os.path.join(self.disk_dir, name))
+
+    # --- entries --------------------------------------------------------
+
+    def make_key(self, name: str, args, kwargs, tables) -> str:
+        payload = (name, args, sorted(kwargs.items()), sorted(self.table_versions(tables).items()))
+        return hashlib.sha256(pickle.dumps(payload, protocol=4)).hexdigest()
+
+    def get(self, key: str, tables=()):
+        """Returns ``(True, value)`` on a hit, ``(False, None)`` on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] is None or entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return True, entry[0]
+                self._drop(key)
+        if self.disk_dir:
+            path = self._disk_path(key, tables)
+            try:
+                with open(path, 'rb') as f:
+                    expires_at, tables, value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                if expires_at is None or expires_at > now:
+                    os.utime(path)
+                    self._store(key, value, expires_at, tables)
+                    with self._lock:
+                        self.stats['disk_hits'] += 1
+                    return True, value
+                _remove(path)
+        with self._lock:
+            self.stats['misses'] += 1
+        return False, None
+
+    def put(self, key: str, value, ttl: float | None = None, tables=()) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._store(key, value, expires_at, tuple(tables))
+        if self.disk_dir:
+            path = self._disk_path(key, tables)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((expires_at, tuple(tables), value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._prune_disk()
+
+    def get_or_compute(self, key: str, compute, ttl: float | None = None, tables=()) -> tuple:
+        """
+        Returns ``(hit, value)`` for ``key``, calling ``compute()`` and storing its result on a miss.
+
+        Concurrent misses on the same key (e.g. a page render and a background
+        prefetch) share one computation; the callers that waited for it get
+        ``hit=True``.
+        """
+        hit, value = self.get(key, tables)
+        if hit:
+            return True, value
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return True, future.result()
+        try:
+            value = compute()
+            self.put(key, value, ttl, tables)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return False, value
+
+    def _store(self, key, value, expires_at, tables):
+        nbytes = _sizeof(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, nbytes, expires_at, tables)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def _drop(self, key):
+        value, nbytes, _, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def _prune_disk(self):
+        names = [n for n in os.listdir(self.disk_dir) if n.endswith('.pkl')]
+        if len(names) <= self.max_disk_entries:
+            return
+        paths = sorted((os.path.join(self.disk_dir, n) for n in names), key=_mtime)
+        for path in paths[:len(paths) - self.max_disk_entries]:
+            _remove(path)
+
+    def _disk_path(self, key, tables):
+        # Table names lead the file name so invalidate() can find dependents.
+        return os.path.join(self.disk_dir, f"{'+'.join(sorted(tables))}__{key}.pkl")
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def cached(cache: ResultCache, tables, ttl: float | None = None):
+    """
+    Decorator caching a data function in ``cache``, keyed on its arguments and ``tables``' versions.
+
+    Args:
+        cache: The ResultCache to use.
+        tables: Names of the tables the function reads.
+        ttl: Seconds to keep results; defaults to the shortest ``TABLE_TTLS`` entry of ``tables``.
+    """
+    tables = tuple(tables)
+    if ttl is None:
+        ttls = [TABLE_TTLS[t] for t in tables if t in TABLE_TTLS]
+        ttl = min(ttls) if ttls else None
+
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed('data', func.__qualname__) as info, step_scope(func.__qualname__):
+                key = cache.make_key(name, args, kwargs, tables)
+                hit, value = cache.get_or_compute(key, lambda: func(*args, **kwargs), ttl, tables)
+                info['cache'] = 'hit' if hit else 'miss'
+                info['rows'] = row_count(value)
+            return value
+
+        wrapper.tables = tables
+        return wrapper
+
+    return decorator
@@ -0,0 +1,113 @@
+"""
+Materialized weekly sales rollup.
+
+``sales_weekly`` holds one row per branch, sales week and canonical StockKey
+with the week's quantities already summed, and ``calendar_weeks`` lists every
+sales week with its first and last trading date. The dashboard reads these
+instead of scanning the full ``sales`` table (and parsing every TranDate) on
+each request.
+
+Both tables are refreshed incrementally: only the most recent week already in
+the rollup (which may have been partial when it was loaded) and any newer
+weeks are recomputed, in one transaction. The refresh belongs to the jobs
+that change ``sales`` (``upload_to_bigquery.py``, the batch jobs); the
+dashboard only reads the rollup, except that the DuckDB backend builds it
+when it opens a local snapshot.
+"""
+import datetime
+
+from query_backend import QueryBackend, STRING_TYPES
+
+ROLLUP_TABLE = 'sales_weekly'
+CALENDAR_TABLE = 'calendar_weeks'
+
+# Sales week label, matching the 'YYYY-WW' weeks shown in the app.
+WEEK_EXPR = "FORMAT_DATE('%Y-%W', TranDate)"
+
+
+def _rollup_select(backend: QueryBackend) -> str:
+    return f"""
+        SELECT
+            Branch AS branch,
+            {WEEK_EXPR} AS week,
+            StockKey,
+            SUM(Quantity) AS qty,
+            SUM(IF(Quantity > 0, Quantity, 0)) AS sold_qty,
+            SUM(IF(Quantity > 0, LinkQty, 0)) AS sold_link_qty
+        FROM {backend.table('sales')}
+        WHERE TranDate >= @since_date
+        GROUP BY 1, 2, 3
+    """
+
+
+def _calendar_select(backend: QueryBackend) -> str:
+    return f"""
+        SELECT
+            {WEEK_EXPR} AS week,
+            MIN(TranDate) AS first_date,
+            MAX(TranDate) AS last_date
+        FROM {backend.table('sales')}
+        WHERE TranDate >= @since_date
+        GROUP BY 1
+    """
+
+
+def _rollup_is_current(backend: QueryBackend) -> bool:
+    """False when the rollup exists but predates the StockKey column or its string codes."""
+    columns = backend.table_columns(ROLLUP_TABLE)
+    # A missing table is created by the incremental path below.
+    return columns is None or columns.get('StockKey') in STRING_TYPES
+
+
+def week_start(week: str) -> datetime.date:
+    """Returns the first date of a 'YYYY-WW' (%Y-%W) sales week."""
+    monday = datetime.datetime.strptime(f'{week}-1', '%Y-%W-%w').date()
+    # Week 00 holds the days of January before the year's first Monday.
+    return max(monday, datetime.date(int(week[:4]), 1, 1))
+
+
+def refresh_weekly_rollup(backend: QueryBackend, full: bool = False) -> str:
+    """
+    Brings ``sales_weekly`` and ``calendar_weeks`` up to date with ``sales``.
+
+    Args:
+        backend: Backend holding the ``sales`` table; the rollup is written next to it.
+        full: Rebuild both tables from scratch instead of refreshing new weeks only.
+
+    Returns:
+        The first week that was recomputed ('' for a full rebuild).
+    """
+    rollup = backend.table(ROLLUP_TABLE)
+    calendar = backend.table(CALENDAR_TABLE)
+    if not full and not _rollup_is_current(backend):
+        full = True
+    if full:
+        backend.execute(f"CREATE OR REPLACE TABLE {rollup} AS {_rollup_select(backend)}", {'since_date': datetime.date.min})
+        backend.execute(f"CREATE OR REPLACE TABLE {calendar} AS {_calendar_select(backend)}", {'since_date': datetime.date.min})
+        print(f"[refresh_weekly_rollup] Rebuilt {ROLLUP_TABLE} and {CALENDAR_TABLE}")
+        return ''
+
+    backend.execute(f"""
+        CREATE TABLE IF NOT EXISTS {rollup} (
+            branch STRING, week STRING, StockKey STRING,
+            qty FLOAT64, sold_qty FLOAT64, sold_link_qty FLOAT64
+        )
+    """)
+    backend.execute(f"""
+        CREATE TABLE IF NOT EXISTS {calendar} (week STRING, first_date DATE, last_date DATE)
+    """)
+    latest = backend.query(f"SELECT MAX(week) AS week FROM {calendar}")['week'].iloc[0]
+    # The latest loaded week may have been partial, so it is recomputed too.
+    since_week = latest if isinstance(latest, str) else ''
+    # Filtering on the date (not the week label) lets BigQuery prune partitions.
+    since_date = week_start(since_week) if since_week else datetime.date.min
+    # One transaction: readers never see the recomputed weeks missing, and of two
+    # concurrent refreshes one fails instead of both inserting the same weeks.
+    backend.execute_transaction([
+        (f"DELETE FROM {rollup} WHERE week >= @since_week", {'since_week': since_week}),
+        (f"INSERT INTO {rollup} {_rollup_select(backend)}", {'since_date': since_date}),
+        (f"DELETE FROM {calendar} WHERE week >= @since_week", {'since_week': since_week}),
+        (f"INSERT INTO {calendar} {_calendar_select(backend)}", {'since_date': since_date}),
+    ])
+    print(f"[refresh_weekly_rollup] Refreshed weeks >= '{since_week}'")
+    return since_week
@@ -0,0 +1,244 @@
+"""
+Batch precomputation of the Purchase Schedule for every branch.
+
+The job reads the history window of all branches in one query over the
+weekly rollup and the stock on hand of all branches in one query over
+``stock_onhands``, splits both by branch and computes the schedules in
+worker processes. Each run is written to a versioned results store under
+``ANALYTIQ_SCHEDULE_DIR`` (default ``data/schedules``): a directory holding
+``schedules.parquet`` (one row group per branch) and ``manifest.json`` with
+the forecast method and window, the history weeks, the branches covered and
+the versions of the source tables the run read.
+
+The app serves a branch's schedule from the newest run with matching
+parameters whose source versions are still current, and falls back to
+computing it on demand when there is none.
+
+Usage:
+    python schedule_batch.py
+    python schedule_batch.py --branches BR01 BR02 --method ewma --window 8 --workers 8
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from forecasting import (
+    build_schedule, history_from_frame, FORECAST_METHODS, DEFAULT_METHOD, DEFAULT_WINDOW, SEASON_LENGTH,
+)
+from query_backend import QueryBackend
+from sales_rollup import ROLLUP_TABLE, CALENDAR_TABLE
+
+DEFAULT_SCHEDULE_DIR = os.path.join('data', 'schedules')
+# Runs kept in the store; older ones are removed after each run.
+KEEP_RUNS = 5
+MIN_PARALLEL_BRANCHES = 8
+# A run is current while these tables are unchanged (the rollup is derived from sales).
+SOURCE_TABLES = ['sales', 'stock_onhands']
+SCHEDULE_COLUMNS = ['StockID', 'avg_sales', 'ONHAND', 'RecommendedOrder']
+
+_SCHEDULES_FILE = 'schedules.parquet'
+_MANIFEST_FILE = 'manifest.json'
+
+
+def schedule_dir() -> str:
+    return os.environ.get('ANALYTIQ_SCHEDULE_DIR', DEFAULT_SCHEDULE_DIR)
+
+
+def default_window(method: str) -> int:
+    """The history window the app uses by default for ``method``."""
+    return SEASON_LENGTH if method == 'seasonal_naive' else DEFAULT_WINDOW
+
+
+def _compute_schedules(branch_frames, weeks, method, window) -> list:
+    # Runs in a worker process: [(branch, history rows, on-hand rows)] -> [(branch, schedule)]
+    return [
+        (branch, build_schedule(history_from_frame(history, weeks), onhand, method, window))
+        for branch, history, onhand in branch_frames
+    ]
+
+
+def _batches(items, count):
+    # Round-robin so every worker gets a similar mix of large and small branches.
+    return [items[i::count] for i in range(count) if items[i::count]]
+
+
+def run_batch(backend: QueryBackend, branches=None, method: str = DEFAULT_METHOD, window: int | None = None,
+              max_workers: int | None = None, out_dir: str | None = None) -> dict:
+    """
+    Computes the schedules of ``branches`` (default: every branch in the rollup) and stores them as a new run.
+
+    Args:
+        backend: Query backend holding the weekly rollup and ``stock_onhands``.
+        branches: Branch codes to compute; None for all.
+        method: Key of ``FORECAST_METHODS``.
+        window: History window in weeks; defaults to the app's default for ``method``.
+        max_workers: Worker processes (default: CPU count).
+        out_dir: Results store (default ``ANALYTIQ_SCHEDULE_DIR``).
+
+    Returns:
+        The run's manifest.
+    """
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method '{method}' (expected one of {sorted(FORECAST_METHODS)})")
+    window = window or default_window(method)
+    out_dir = out_dir or schedule_dir()
+    max_workers = max_workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    # Read the versions first: a load landing mid-run leaves the run stale rather than wrongly current.
+    versions = backend.table_versions(SOURCE_TABLES)
+
+    weeks = backend.query(f"SELECT week FROM {backend.table(CALENDAR_TABLE)} ORDER BY week DESC")['week'].tolist()
+    # Same weeks as the app: the window before the latest (possibly partial) week.
+    history_weeks = sorted(weeks[1:1 + window])
+    if not history_weeks:
+        raise ValueError('The weekly rollup has no complete weeks to forecast from')
+    if branches is None:
+        branches = backend.query(
+            f"SELECT DISTINCT branch FROM {backend.table(ROLLUP_TABLE)} WHERE branch IS NOT NULL ORDER BY branch"
+        )['branch'].tolist()
+    branches = sorted(set(branches))
+
+    history = backend.query(f"""
+        SELECT branch, StockKey AS StockID, week, qty
+        FROM {backend.table(ROLLUP_TABLE)}
+        WHERE week BETWEEN @first_week AND @last_week
+          AND branch IN (SELECT * FROM UNNEST(@branches))
+    """, {'first_week': history_weeks[0], 'last_week': history_weeks[-1], 'branches': branches})
+    onhand = backend.query(f"""
+        SELECT BRANCH AS branch, StockKey AS StockID, ONHAND
+        FROM {backend.table('stock_onhands')}
+        WHERE BRANCH IN (SELECT * FROM UNNEST(@branches))
+    """, {'branches': branches})
+    history_by_branch = dict(tuple(history.groupby('branch', observed=True)))
+    onhand_by_branch = dict(tuple(onhand.groupby('branch', observed=True)))
+    empty_onhand = onhand.iloc[:0]
+    branch_frames = [
+        (branch, history_by_branch[branch], onhand_by_branch.get(branch, empty_onhand))
+        for branch in branches if branch in history_by_branch
+    ]
+    print(f"[run_batch] {len(branches)} branches, {len(history)} history rows, {len(onhand)} on-hand rows")
+
+    if len(branch_frames) >= MIN_PARALLEL_BRANCHES and max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(_compute_schedules, batch, history_weeks, method, window)
+                for batch in _batches(branch_frames, max_workers)
+            ]
+            schedules = dict(pair for future in futures for pair in future.result())
+    else:
+        schedules = dict(_compute_schedules(branch_frames, history_weeks, method, window))
+
+    created = datetime.datetime.now(datetime.timezone.utc)
+    manifest = {
+        'run_id': created.strftime('%Y%m%dT%H%M%S%fZ'),
+        'created_at': created.isoformat(timespec='seconds'),
+        'method': method,
+        'window': window,
+        'weeks': history_weeks,
+        'branches': branches,
+        'source_versions': versions,
+        'backend': backend.name,
+        'rows': int(sum(len(schedule) for schedule in schedules.values())),
+    }
+    _write_run(out_dir, manifest, schedules)
+    manifest['seconds'] = round(time.perf_counter() - started, 3)
+    print(f"[run_batch] Wrote run {manifest['run_id']} ({manifest['rows']} rows) in {manifest['seconds']}s")
+    _prune_runs(out_dir)
+    return manifest
+
+
+def _write_run(out_dir, manifest, schedules):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ('branch', pa.string()), ('StockID', pa.string()), ('avg_sales', pa.float64()),
+        ('ONHAND', pa.float64()), ('RecommendedOrder', pa.float64()),
+    ])
+    run_dir = os.path.join(out_dir, manifest['run_id'])
+    tmp_dir = f'{run_dir}.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+    with pq.ParquetWriter(os.path.join(tmp_dir, _SCHEDULES_FILE), schema) as writer:
+        for branch in sorted(schedules):
+            table = pa.Table.from_pandas(schedules[branch][SCHEDULE_COLUMNS].assign(branch=branch), preserve_index=False)
+            writer.write_table(table.select(schema.names).cast(schema))
+    with open(os.path.join(tmp_dir, _MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    # Readers only see complete runs.
+    os.replace(tmp_dir, run_dir)
+
+
+def _list_runs(out_dir) -> list:
+    """Run directories in ``out_dir``, newest first."""
+    try:
+        names = os.listdir(out_dir)
+    except FileNotFoundError:
+        return []
+    runs = [name for name in names if not name.endswith('.tmp')
+            and os.path.exists(os.path.join(out_dir, name, _MANIFEST_FILE))]
+    return [os.path.join(out_dir, name) for name in sorted(runs, reverse=True)]
+
+
+def _prune_runs(out_dir):
+    for run_dir in _list_runs(out_dir)[KEEP_RUNS:]:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+@functools.lru_cache(maxsize=16)
+def _read_manifest(run_dir) -> dict:
+    with open(os.path.join(run_dir, _MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_schedules(run_dir) -> dict:
+    # Runs never change once written, so they are read once per process.
+    df = pd.read_parquet(os.path.join(run_dir, _SCHEDULES_FILE))
+    return {
+        branch: group[SCHEDULE_COLUMNS].reset_index(drop=True)
+        for branch, group in df.groupby('branch', sort=False)
+    }
+
+
+def find_schedule(branch, weeks, method: str, window: int, versions: dict, out_dir: str | None = None):
+    """
+    Returns the stored schedule of ``branch``, or None when no current run covers it.
+
+    A run is current when it used the same method, window and history weeks
+    and its source table versions equal ``versions``. The schedule is empty
+    when the branch had no sales in those weeks.
+    """
+    weeks = sorted(weeks)
+    for run_dir in _list_runs(out_dir or schedule_dir()):
+        try:
+            manifest = _read_manifest(run_dir)
+        except (OSError, ValueError):
+            continue
+        if (manifest['method'] == method and manifest['window'] == window and manifest['weeks'] == weeks
+                and branch in manifest['branches'] and manifest['source_versions'] == versions):
+            schedules = _read_schedules(run_dir)
+            return schedules.get(branch, pd.DataFrame({col: [] for col in SCHEDULE_COLUMNS}))
+    return None
+
+
+if __name__ == '__main__':
+    from query_backend import get_backend
+    from sales_rollup import refresh_weekly_rollup
+
+    parser = argparse.ArgumentParser(description="Precompute every branch's Purchase Schedule into the results store.")
+    parser.add_argument('--branches', nargs='+', help='Branch codes (default: all)')
+    parser.add_argument('--method', default=DEFAULT_METHOD, choices=sorted(FORECAST_METHODS))
+    parser.add_argument('--window', type=int, help='History window in weeks (default: the app default for the method)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--out', help=f'Results store (default: ANALYTIQ_SCHEDULE_DIR or {DEFAULT_SCHEDULE_DIR})')
+    args = parser.parse_args()
+
+    backend = get_backend()
+    refresh_weekly_rollup(backend)
+    run_batch(backend, args.branches, args.method, args.window, args.workers, args.out)
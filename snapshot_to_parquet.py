@@ -0,0 +1,11 @@
+import os
+from query_backend import BigQueryBackend, export_snapshot, DEFAULT_PARQUET_DIR
+
+# === CONFIGURATION ===
+OUT_DIR = os.environ.get("ANALYTIQ_PARQUET_DIR", DEFAULT_PARQUET_DIR)
+
+# Copy the bigsave.demo tables the app reads into local Parquet files so the
+# app can run with ANALYTIQ_BACKEND=duckdb (offline, no cloud credentials).
+print(f"Exporting BigQuery tables to {OUT_DIR}/ ...")
+export_snapshot(BigQueryBackend(), OUT_DIR)
+print("✅ Snapshot complete.")
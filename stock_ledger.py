@@ -0,0 +1,420 @@
+"""
+Weekly stock ledger: on-hand per branch and item at the end of every week.
+
+``stock_taxan`` is the stock transaction log (sales, receipts, adjustments,
+signed quantities) keyed by warehouse; each ``WH`` is mapped to its branch
+through ``stock_onhands``. The ledger sums the transactions per branch, item
+and sales week, and turns them into closing balances with a grouped
+cumulative sum, anchored so that the latest balance of every item equals its
+``stock_onhands`` snapshot (items missing from the snapshot are anchored at
+0). Weekly receipts from ``purchases`` are carried alongside as ``received``;
+they are not added to the balance again, since ``stock_taxan`` already
+records the goods received.
+
+The ledger is stored under ``ANALYTIQ_LEDGER_DIR`` (default ``data/ledger``)
+in columnar form: one Parquet file per week holding only the items that
+moved that week, ``openings.parquet`` with every item's balance before its
+first movement, and ``manifest.json``. Updates are incremental like the
+weekly rollup's: the latest stored week (possibly partial when it was built)
+and any newer weeks are recomputed from the balances before them, and only
+their files are rewritten.
+
+``StockLedger`` answers "on hand as of week W" for a whole branch with one
+vectorized binary search over the stored rows, and ``backtest`` replays the
+Purchase Schedule over past weeks against the demand that followed.
+
+Usage:
+    python stock_ledger.py                 # update with new weeks
+    python stock_ledger.py --full          # rebuild from scratch
+    python stock_ledger.py --backtest BR01 --weeks 52 --method ewma --window 8
+"""
+import argparse
+import bisect
+import datetime
+import functools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecasting import (
+    load_sales_history, order_quantities, FORECAST_METHODS, DEFAULT_METHOD, DEFAULT_WINDOW, SEASON_LENGTH,
+)
+from prefetch import fetch_all
+from query_backend import QueryBackend
+from sales_rollup import CALENDAR_TABLE, WEEK_EXPR, week_start
+
+DEFAULT_LEDGER_DIR = os.path.join('data', 'ledger')
+# The ledger is current while these tables are unchanged.
+SOURCE_TABLES = ['stock_taxan', 'purchases', 'stock_onhands']
+LEDGER_COLUMNS = ['branch', 'StockKey', 'week', 'movement', 'received', 'balance']
+
+_MANIFEST_FILE = 'manifest.json'
+_OPENINGS_FILE = 'openings.parquet'
+_WEEKS_DIR = 'weeks'
+_KEY = ['branch', 'StockKey']
+# Recorded in the manifest; ledgers stored with other keys (the old integer ones) are rebuilt.
+_KEY_FORMAT = 'code'
+
+
+def ledger_dir() -> str:
+    return os.environ.get('ANALYTIQ_LEDGER_DIR', DEFAULT_LEDGER_DIR)
+
+
+def _load_sources(backend: QueryBackend, since_date) -> tuple:
+    """Weekly movements and receipts since ``since_date``, and the current on-hand snapshot."""
+    movements = f"""
+        WITH warehouses AS (
+            SELECT WH, MIN(BRANCH) AS branch
+            FROM {backend.table('stock_onhands')}
+            WHERE WH IS NOT NULL AND BRANCH IS NOT NULL
+            GROUP BY WH
+        )
+        SELECT warehouses.branch AS branch, StockKey, {WEEK_EXPR} AS week, SUM(Quantity) AS movement
+        FROM {backend.table('stock_taxan')} AS taxan
+        JOIN warehouses ON taxan.WH = warehouses.WH
+        WHERE TranDate >= @since_date
+          AND StockKey IS NOT NULL
+        GROUP BY 1, 2, 3
+    """
+    receipts = f"""
+        SELECT BRANCH AS branch, StockKey, FORMAT_DATE('%Y-%W', GRVDATE) AS week,
+               SUM(COALESCE(RECVQTY, 0) + COALESCE(RECVFREEQTY, 0)) AS received
+        FROM {backend.table('purchases')}
+        WHERE GRVDATE >= @since_date
+          AND StockKey IS NOT NULL
+          AND BRANCH IS NOT NULL
+        GROUP BY 1, 2, 3
+    """
+    onhand = f"""
+        SELECT BRANCH AS branch, StockKey, SUM(ONHAND) AS ONHAND
+        FROM {backend.table('stock_onhands')}
+        WHERE StockKey IS NOT NULL
+          AND BRANCH IS NOT NULL
+        GROUP BY 1, 2
+    """
+    params = {'since_date': since_date}
+    return tuple(fetch_all(
+        lambda: backend.query(movements, params),
+        lambda: backend.query(receipts, params),
+        lambda: backend.query(onhand),
+    ))
+
+
+def _weekly_rows(movements: pd.DataFrame, receipts: pd.DataFrame) -> pd.DataFrame:
+    """One row per branch, item and week with any movement or receipt, sorted by branch, item and week."""
+    frames = [
+        frame.astype({'branch': str, 'week': str, 'StockKey': str})
+        for frame in (movements, receipts)
+    ]
+    rows = frames[0].merge(frames[1], on=['branch', 'StockKey', 'week'], how='outer')
+    rows['movement'] = rows['movement'].astype(float).fillna(0.0)
+    rows['received'] = rows['received'].astype(float).fillna(0.0)
+    return rows.sort_values(['branch', 'StockKey', 'week'], kind='stable').reset_index(drop=True)
+
+
+def _key_index(frame: pd.DataFrame, keys: pd.DataFrame) -> np.ndarray:
+    """Position of each (branch, StockKey) of ``frame`` in ``keys``, or -1."""
+    return pd.MultiIndex.from_frame(keys[_KEY]).get_indexer(pd.MultiIndex.from_frame(frame[_KEY]))
+
+
+class StockLedger:
+    """
+    In-memory ledger loaded from the store (see ``load_ledger``).
+
+    Args:
+        openings: ``branch``, ``StockKey`` and ``opening`` for every item in the ledger.
+        rows: Ledger rows (``LEDGER_COLUMNS``) for the weeks in ``weeks``.
+        weeks: Stored weeks, oldest first.
+        manifest: The store's manifest.
+    """
+
+    def __init__(self, openings: pd.DataFrame, rows: pd.DataFrame, weeks, manifest: dict | None = None):
+        self.manifest = manifest or {}
+        self.weeks = sorted(weeks)
+        keys = openings.sort_values(_KEY, kind='stable').reset_index(drop=True)
+        self.branches = keys['branch'].to_numpy(dtype=object)
+        self.stock_keys = keys['StockKey'].to_numpy(dtype=object)
+        self.openings = keys['opening'].to_numpy(dtype=float)
+        # Keys are sorted by branch, so each branch is one contiguous slice.
+        starts = np.flatnonzero(np.r_[True, self.branches[1:] != self.branches[:-1]]) if len(keys) else []
+        ends = [*starts[1:], len(keys)]
+        self._branch_slices = {self.branches[s]: (s, e) for s, e in zip(starts, ends)}
+        # Rows are located by code = key position × weeks + week position.
+        key_index = _key_index(rows, keys)
+        week_index = pd.Categorical(rows['week'], categories=self.weeks).codes
+        valid = (key_index >= 0) & (week_index >= 0)
+        codes = key_index[valid].astype(np.int64) * max(len(self.weeks), 1) + week_index[valid]
+        order = np.argsort(codes, kind='stable')
+        self._codes = codes[order]
+        self._balances = rows['balance'].to_numpy(dtype=float)[valid][order]
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def through_week(self) -> str | None:
+        """The newest week in the ledger."""
+        return self.weeks[-1] if self.weeks else None
+
+    def _closing(self, key_positions: np.ndarray, week: str) -> np.ndarray:
+        """Balances of the keys at ``key_positions`` at the end of ``week``."""
+        week_position = bisect.bisect_right(self.weeks, week) - 1
+        if week_position < 0 or not len(self._codes):
+            return self.openings[key_positions]
+        targets = key_positions.astype(np.int64) * len(self.weeks) + week_position
+        # The last row of each key at or before the week; keys without one keep their opening.
+        found = np.searchsorted(self._codes, targets, side='right') - 1
+        clipped = np.clip(found, 0, None)
+        has_row = (found >= 0) & (self._codes[clipped] // len(self.weeks) == key_positions)
+        return np.where(has_row, self._balances[clipped], self.openings[key_positions])
+
+    def as_of(self, branch, week: str) -> pd.DataFrame:
+        """
+        Returns the stock on hand of every item of ``branch`` at the end of ``week``.
+
+        Weeks after ``through_week`` get the latest balances.
+
+        Returns:
+            DataFrame with StockID and ONHAND, like ``get_stock_onhand_by_stockid``.
+        """
+        start, end = self._branch_slices.get(branch, (0, 0))
+        positions = np.arange(start, end)
+        return pd.DataFrame({'StockID': self.stock_keys[start:end], 'ONHAND': self._closing(positions, week)})
+
+    def balances(self, branch, stock_ids, weeks) -> np.ndarray:
+        """
+        Closing balances as an item × week array: ``result[i, j]`` is ``stock_ids[i]`` at the end of ``weeks[j]``.
+
+        Items the ledger doesn't know have 0.
+        """
+        start, end = self._branch_slices.get(branch, (0, 0))
+        found = pd.Index(self.stock_keys[start:end]).get_indexer(np.asarray(stock_ids, dtype=object))
+        known = found >= 0
+        positions = found[known] + start
+        result = np.zeros((len(found), len(weeks)))
+        for j, week in enumerate(weeks):
+            result[known, j] = self._closing(positions, week)
+        return result
+
+    def closing_frame(self, week: str) -> pd.DataFrame:
+        """Every item's balance at the end of ``week`` (``branch``, ``StockKey``, ``balance``)."""
+        return pd.DataFrame({
+            'branch': self.branches,
+            'StockKey': self.stock_keys,
+            'balance': self._closing(np.arange(len(self.stock_keys)), week),
+        })
+
+
+def _read_manifest(out_dir) -> dict | None:
+    try:
+        with open(os.path.join(out_dir, _MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=2)
+def _read_ledger(out_dir, updated_at) -> StockLedger:
+    # Keyed on the manifest's update time, so each update is read once per process.
+    manifest = _read_manifest(out_dir)
+    openings = pd.read_parquet(os.path.join(out_dir, _OPENINGS_FILE))
+    paths = [os.path.join(out_dir, _WEEKS_DIR, f'{week}.parquet') for week in manifest['weeks']]
+    rows = pd.concat([pd.read_parquet(path) for path in paths if os.path.exists(path)] or [
+        pd.DataFrame({col: [] for col in LEDGER_COLUMNS})
+    ], ignore_index=True)
+    return StockLedger(openings, rows, manifest['weeks'], manifest)
+
+
+def load_ledger(out_dir: str | None = None) -> StockLedger | None:
+    """Returns the stored ledger, or None when it hasn't been built."""
+    out_dir = out_dir or ledger_dir()
+    manifest = _read_manifest(out_dir)
+    if manifest is None or manifest.get('stock_key') != _KEY_FORMAT:
+        return None
+    return _read_ledger(out_dir, manifest['updated_at'])
+
+
+def _write_parquet(df: pd.DataFrame, path: str) -> None:
+    tmp_path = f'{path}.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def update_ledger(backend: QueryBackend, full: bool = False, out_dir: str | None = None) -> dict:
+    """
+    Brings the stored ledger up to date with ``stock_taxan``, ``purchases`` and ``stock_onhands``.
+
+    Args:
+        backend: Query backend holding the source tables.
+        full: Rebuild from scratch instead of recomputing the latest stored week and newer ones.
+        out_dir: Ledger store (default ``ANALYTIQ_LEDGER_DIR``).
+
+    Returns:
+        The store's manifest, with ``recomputed_from`` (the first recomputed
+        week, '' for a rebuild) and ``seconds``.
+    """
+    out_dir = out_dir or ledger_dir()
+    started = time.perf_counter()
+    # Read the versions first: a load landing mid-update is picked up by the next one.
+    versions = backend.table_versions(SOURCE_TABLES)
+    manifest = None if full else _read_manifest(out_dir)
+    ledger = load_ledger(out_dir) if manifest else None
+    since_week = manifest['weeks'][-1] if ledger is not None and manifest['weeks'] else ''
+    since_date = week_start(since_week) if since_week else datetime.date.min
+
+    movements, receipts, onhand = _load_sources(backend, since_date)
+    rows = _weekly_rows(movements, receipts)
+    onhand = onhand.astype({'branch': str, 'StockKey': str})
+    new_totals = rows.groupby(_KEY, sort=False)['movement'].sum().reset_index()
+
+    if ledger is None:
+        # Anchor every item so that its balance after all movements is its snapshot on hand.
+        openings = onhand.merge(new_totals, on=_KEY, how='outer')
+        openings['opening'] = openings['ONHAND'].fillna(0.0) - openings['movement'].fillna(0.0)
+        openings = openings[_KEY + ['opening']]
+        kept_weeks = []
+        start = openings.rename(columns={'opening': 'balance'})
+    else:
+        kept_weeks = [week for week in ledger.weeks if week < since_week]
+        known = pd.DataFrame({'branch': ledger.branches, 'StockKey': ledger.stock_keys, 'opening': ledger.openings})
+        # Items moving for the first time are anchored like a rebuild would, on their new movements.
+        added = new_totals[_key_index(new_totals, known) < 0].merge(onhand, on=_KEY, how='left')
+        added['opening'] = added['ONHAND'].fillna(0.0) - added['movement']
+        openings = pd.concat([known, added[_KEY + ['opening']]], ignore_index=True)
+        # Known items continue from their closing balance before the recomputed weeks.
+        start = pd.concat([
+            ledger.closing_frame(kept_weeks[-1] if kept_weeks else ''),
+            added[_KEY].assign(balance=added['opening']),
+        ], ignore_index=True)
+
+    # Closing balance = balance before the recomputed weeks + the item's cumulative movement since.
+    starting = start['balance'].to_numpy(dtype=float)[_key_index(rows, start)]
+    rows['balance'] = starting + rows.groupby(_KEY, sort=False)['movement'].cumsum().to_numpy()
+
+    weeks_dir = os.path.join(out_dir, _WEEKS_DIR)
+    os.makedirs(weeks_dir, exist_ok=True)
+    week_rows = {}
+    for week, group in rows.groupby('week', sort=True):
+        _write_parquet(group[LEDGER_COLUMNS], os.path.join(weeks_dir, f'{week}.parquet'))
+        week_rows[week] = len(group)
+    new_weeks = list(week_rows)
+    for name in os.listdir(weeks_dir):
+        week = name.removesuffix('.parquet')
+        if name.endswith('.parquet') and week not in kept_weeks and week not in new_weeks:
+            os.remove(os.path.join(weeks_dir, name))
+    _write_parquet(openings.astype({'branch': str}), os.path.join(out_dir, _OPENINGS_FILE))
+
+    all_weeks = kept_weeks + new_weeks
+    week_rows = {**{week: manifest['week_rows'][week] for week in kept_weeks}, **week_rows}
+    manifest = {
+        'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='microseconds'),
+        'through_week': all_weeks[-1] if all_weeks else None,
+        'weeks': all_weeks,
+        'source_versions': versions,
+        'backend': backend.name,
+        'stock_key': _KEY_FORMAT,
+        'items': len(openings),
+        'rows': sum(week_rows.values()),
+        'week_rows': week_rows,
+    }
+    # Written last: readers only switch to the new weeks once they are all in place.
+    tmp_path = os.path.join(out_dir, f'{_MANIFEST_FILE}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmp_path, os.path.join(out_dir, _MANIFEST_FILE))
+    manifest['recomputed_from'] = since_week
+    manifest['seconds'] = round(time.perf_counter() - started, 3)
+    print(f"[update_ledger] Weeks >= '{since_week}': {len(rows)} rows over {len(new_weeks)} weeks, "
+          f"{manifest['items']} items in {manifest['seconds']}s")
+    return manifest
+
+
+def backtest(backend: QueryBackend, ledger: StockLedger, branch, weeks,
+             method: str = DEFAULT_METHOD, window: int = DEFAULT_WINDOW) -> pd.DataFrame:
+    """
+    Replays the Purchase Schedule of ``branch`` for each of ``weeks`` and scores it against that week's sales.
+
+    For each week the forecast uses the ``window`` weeks before it and the
+    stock on hand is the ledger's closing balance of the previous week, as
+    the schedule would have shown at the start of the week.
+
+    Args:
+        backend: Query backend holding the weekly rollup and calendar.
+        ledger: The stock ledger.
+        branch: Branch code.
+        weeks: 'YYYY-WW' weeks to replay.
+        method: Key of ``FORECAST_METHODS``.
+        window: History window in weeks.
+
+    Returns:
+        One row per week: forecast, ordered and sold units, items that ran
+        out (sales above stock plus order), units short and left over, and the
+        forecast's mean absolute error per item.
+    """
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method '{method}' (expected one of {sorted(FORECAST_METHODS)})")
+    calendar = sorted(backend.query(f"SELECT week FROM {backend.table(CALENDAR_TABLE)}")['week'].dropna().astype(str))
+    weeks = sorted(week for week in weeks if week in calendar)
+    if not weeks:
+        return pd.DataFrame()
+    first = max(calendar.index(weeks[0]) - window, 0)
+    loaded = calendar[first:calendar.index(weeks[-1]) + 1]
+    # One query for every week's history and sales.
+    history = load_sales_history(backend, branch, loaded)
+    positions = [loaded.index(week) for week in weeks]
+    # The closing balance of the week before (the openings before the first week).
+    previous_weeks = [calendar[first + p - 1] if first + p > 0 else '' for p in positions]
+    onhand = ledger.balances(branch, history.stock_ids, previous_weeks)
+    forecaster = FORECAST_METHODS[method]
+    results = []
+    for j, (week, position) in enumerate(zip(weeks, positions)):
+        expected = forecaster(history.quantities[:, max(position - window, 0):position], window)
+        ordered = order_quantities(expected, onhand[:, j])
+        sold = np.clip(history.quantities[:, position], 0, None)
+        available = np.clip(onhand[:, j], 0, None) + ordered
+        active = (expected > 0) | (sold > 0)
+        results.append({
+            'week': week,
+            'items': int(active.sum()),
+            'forecast_units': float(expected.sum()),
+            'ordered_units': float(ordered.sum()),
+            'sold_units': float(sold.sum()),
+            'stockout_items': int((sold > available).sum()),
+            'short_units': float(np.clip(sold - available, 0, None).sum()),
+            'excess_units': float(np.clip(available - sold, 0, None).sum()),
+            'forecast_mae': float(np.abs(expected - sold)[active].mean()) if active.any() else 0.0,
+        })
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    from query_backend import get_backend
+    from sales_rollup import refresh_weekly_rollup
+
+    parser = argparse.ArgumentParser(description='Update the weekly stock ledger, or backtest the Purchase Schedule on it.')
+    parser.add_argument('--full', action='store_true', help='Rebuild the ledger from scratch')
+    parser.add_argument('--out', help=f'Ledger store (default: ANALYTIQ_LEDGER_DIR or {DEFAULT_LEDGER_DIR})')
+    parser.add_argument('--backtest', metavar='BRANCH', help='Replay the schedule of this branch after updating')
+    parser.add_argument('--weeks', type=int, default=52, help='Complete weeks to replay (default: 52)')
+    parser.add_argument('--method', default=DEFAULT_METHOD, choices=sorted(FORECAST_METHODS))
+    parser.add_argument('--window', type=int, help='History window in weeks (default: the app default for the method)')
+    args = parser.parse_args()
+
+    backend = get_backend()
+    update_ledger(backend, args.full, args.out)
+    if args.backtest:
+        refresh_weekly_rollup(backend)
+        window = args.window or (SEASON_LENGTH if args.method == 'seasonal_naive' else DEFAULT_WINDOW)
+        calendar = backend.query(f"SELECT week FROM {backend.table(CALENDAR_TABLE)} ORDER BY week DESC")['week'].tolist()
+        # The latest week is usually partial.
+        replayed = calendar[1:1 + args.weeks]
+        started = time.perf_counter()
+        report = backtest(backend, load_ledger(args.out), args.backtest, replayed, args.method, window)
+        print(report.to_string(index=False))
+        totals = report.sum(numeric_only=True)
+        print(f"[backtest] {len(report)} weeks in {time.perf_counter() - started:.2f}s: "
+              f"{int(totals['stockout_items'])} stockouts, {totals['short_units']:.0f} units short, "
+              f"{totals['excess_units']:.0f} units left over")
@@ -0,0 +1,383 @@
+"""
+Generates a synthetic ``bigsave.demo`` snapshot for benchmarks and offline development.
+
+Writes the six tables the app reads (``sales``, ``stock``, ``stock_onhands``,
+``suppliers``, ``stock_taxan``, ``purchases``) as typed Parquet, in the
+layout the DuckDB backend reads (see ``query_backend.py``): the large
+transactional tables as ``<table>/part-NNNNN.parquet`` written chunk by chunk
+in date order, the others as ``<table>.parquet``. Columns and types follow
+``bigquery_tables.md`` and ``table_schemas.py``, including ``StockKey``.
+
+The data is shaped to exercise the same paths as production: item
+popularity is skewed (Zipf-like), branches differ in size, sales follow a
+weekly and yearly pattern, and a few stock codes carry variant suffixes.
+
+Usage:
+    python synthetic_data.py --out data/synthetic --sales-rows 1000000 --branches 50 --items 20000
+"""
+import argparse
+import datetime
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from table_schemas import arrow_schema
+
+TABLE_COLUMNS = {
+    'sales': [
+        'StockID', 'CustomerID', 'StockCode', 'LinkCode', 'CO', 'Branch', 'TranDate', 'TXTP', 'DocNo', 'WH',
+        'PriceExcl', 'AccountType', 'Quantity', 'LinkQty', 'SalesExcl', 'SalesIncl', 'CostExcl', 'CostIncl',
+        'GrossProfit', 'Rebate', 'NettProfit', 'StockKey',
+    ],
+    'stock': [
+        'StockID', 'CSUPackSize', 'co', 'branch', 'Status', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand',
+        'Selpal', 'Category0', 'Category1', 'Category2', 'Category3', 'Category4', 'Brand Name', 'StockType',
+        'StockCode', 'LinkCode', 'BarCode', 'SupplierCode', 'Description1', 'Description3', 'SupplierID',
+        'VatCode', 'PackSize', 'Units', 'Weight', 'HouseBrand', 'Variant', 'RN', 'LOOKUP', 'CASESIZE', 'StockKey',
+    ],
+    'stock_onhands': ['StockCodeID', 'CO', 'BRANCH', 'STOCKCODE', 'WH', 'ONHAND', 'VAL_EXCL', 'VAL_INCL', 'StockKey'],
+    'suppliers': ['SupplierID', 'SupplierGroup', 'SupplierName', 'Sup_Group_Code', 'Group_Head_Buyer', 'Group_Admin_Buyer'],
+    'stock_taxan': ['StockID', 'TxTp', 'Transaction', 'TranDate', 'WH', 'Quantity', 'LinkQty', 'StockKey'],
+    'purchases': [
+        'StockID', 'CO', 'BRANCH', 'AP', 'GRVDATE', 'GRVedAccount', 'GRVedSupplier', 'DocumentType', 'STOCKCODE',
+        'LINKCODE', 'RECVQTY', 'RECVFREEQTY', 'RECVLINKQTY', 'RECVFREELINKQTY', 'RECVPRICE', 'RECVDISCOUNT',
+        'RECVTOTAL', 'RECVTAX', 'RECVNETUNIT', 'RECVNNET', 'RECVTOTALINCL', 'INTERCO', 'StockKey',
+    ],
+}
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+VAT = 1.15
+BRANDS = ['Tastic', 'Albany', 'Sasko', 'Koo', 'Jungle', 'Clover', 'Coca-Cola', 'Lucky Star', 'Sunlight', 'Omo',
+          'Joko', 'Five Roses', 'Iwisa', 'Ace', 'Huletts', 'Rama', 'Simba', 'Lays', 'Nestle', 'Kellogg']
+PRODUCTS = ['Rice', 'Bread', 'Maize Meal', 'Beans', 'Cereal', 'Milk', 'Cola', 'Pilchards', 'Soap', 'Washing Powder',
+            'Tea', 'Sugar', 'Margarine', 'Chips', 'Coffee', 'Flour', 'Oil', 'Juice', 'Biscuits', 'Yoghurt']
+SIZES = ['250g', '500g', '1kg', '2kg', '5kg', '10kg', '340ml', '1L', '2L', '6x1L']
+
+
+class Catalogue:
+    """Items, branches and suppliers shared by all generated tables."""
+
+    def __init__(self, rng, items: int, branches: int, suppliers: int):
+        self.items = items
+        self.branches = branches
+        self.suppliers = suppliers
+        # About 5% of codes carry a variant suffix, as in the source data.
+        variant = rng.random(items) < 0.05
+        self.stock_ids = np.array([f'{k}-{v}' if has else str(k) for k, v, has in
+                                   zip(range(100_000, 100_000 + items), rng.integers(1, 4, items), variant)])
+        # The codes are already trimmed and upper-case, so they are their own StockKey.
+        self.stock_keys = self.stock_ids
+        self.item_weights = _zipf_weights(rng, items, 1.0)
+        self.prices = np.round(rng.lognormal(3.2, 0.8, items), 2)
+        self.item_supplier = rng.choice(suppliers, items, p=_zipf_weights(rng, suppliers, 0.8))
+        self.branch_names = np.array([f'BR{i:04d}' for i in range(branches)])
+        self.branch_wh = np.array([f'{i + 1:04d}' for i in range(branches)])
+        self.branch_weights = rng.lognormal(0, 0.6, branches)
+        self.branch_weights /= self.branch_weights.sum()
+        self.supplier_ids = np.array([f'SUP{i:05d}' for i in range(suppliers)])
+
+
+def _zipf_weights(rng, n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _strings(values, indices) -> pa.Array:
+    """String array of ``values[indices]``, built through a dictionary (no per-row Python objects)."""
+    return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), pa.array(values)).dictionary_decode()
+
+
+def _constant(value: str, n: int) -> pa.Array:
+    return _strings([value], np.zeros(n, dtype=np.int32))
+
+
+def _numbered(prefix: str, numbers) -> pa.Array:
+    return pc.binary_join_element_wise(prefix, pa.array(numbers).cast(pa.string()), '')
+
+
+def _write(table: str, columns: dict, path: str):
+    schema = arrow_schema(table, TABLE_COLUMNS[table])
+    pq.write_table(pa.Table.from_pydict(columns, schema=schema), path)
+
+
+def _day_weights(days: np.ndarray) -> np.ndarray:
+    # Busier weekends and month-ends, and a mild yearly cycle.
+    day_of_year = (days - days.astype('datetime64[Y]')).astype(int)
+    weekday = (days.view('int64') + 3) % 7  # 0 = Monday (1970-01-01 was a Thursday)
+    weights = 1.0 + 0.3 * np.sin(2 * np.pi * day_of_year / 365.25)
+    weights *= np.where(weekday >= 4, 1.4, 1.0)
+    weights *= np.where((days + 3).astype('datetime64[M]') != days.astype('datetime64[M]'), 1.25, 1.0)
+    return weights / weights.sum()
+
+
+def _chunks(rng, days, total_rows, chunk_rows):
+    """Yields ``(row_count, day_array)`` chunks covering ``days`` in order, sized by the day weights."""
+    weights = _day_weights(days)
+    per_day = rng.multinomial(total_rows, weights)
+    start = 0
+    while start < len(days):
+        end = start + 1
+        rows = per_day[start]
+        while end < len(days) and rows + per_day[end] <= chunk_rows:
+            rows += per_day[end]
+            end += 1
+        yield rows, np.repeat(days[start:end], per_day[start:end])
+        start = end
+
+
+def generate_sales(rng, cat: Catalogue, days, rows, out_dir, chunk_rows):
+    os.makedirs(os.path.join(out_dir, 'sales'), exist_ok=True)
+    doc_base = 0
+    for part, (n, dates) in enumerate(_chunks(rng, days, rows, chunk_rows)):
+        item = rng.choice(cat.items, n, p=cat.item_weights)
+        branch = rng.choice(cat.branches, n, p=cat.branch_weights)
+        quantity = rng.geometric(0.45, n).astype(float)
+        quantity[rng.random(n) < 0.02] *= -1  # returns
+        price = cat.prices[item]
+        sales_excl = np.round(quantity * price, 2)
+        cost_excl = np.round(sales_excl * rng.uniform(0.65, 0.85, n), 2)
+        columns = {
+            'StockID': _strings(cat.stock_ids, item),
+            'CustomerID': _numbered('C', rng.integers(1, 50_000, n)),
+            'StockCode': _strings(cat.stock_ids, item),
+            'LinkCode': _strings(cat.stock_ids, item),
+            'CO': _constant('01', n),
+            'Branch': _strings(cat.branch_names, branch),
+            'TranDate': pa.array(dates, type=pa.date32()),
+            'TXTP': _strings(['INV', 'CRN'], (quantity < 0).astype(np.int32)),
+            'DocNo': _numbered('D', doc_base + np.arange(n)),
+            'WH': _strings(cat.branch_wh, branch),
+            'PriceExcl': price,
+            'AccountType': _strings(['CASH', 'ACCOUNT'], (rng.random(n) < 0.15).astype(np.int32)),
+            'Quantity': quantity,
+            'LinkQty': np.floor(quantity / 6),
+            'SalesExcl': sales_excl,
+            'SalesIncl': np.round(sales_excl * VAT, 2),
+            'CostExcl': cost_excl,
+            'CostIncl': np.round(cost_excl * VAT, 2),
+            'GrossProfit': sales_excl - cost_excl,
+            'Rebate': np.zeros(n),
+            'NettProfit': sales_excl - cost_excl,
+            'StockKey': _strings(cat.stock_keys, item),
+        }
+        _write('sales', columns, os.path.join(out_dir, 'sales', f'part-{part:05d}.parquet'))
+        doc_base += n
+        print(f"[synthetic_data] sales part {part}: {n} rows ({dates[0]} .. {dates[-1]})")
+    return doc_base
+
+
+def generate_stock_taxan(rng, cat: Catalogue, days, rows, out_dir, chunk_rows):
+    os.makedirs(os.path.join(out_dir, 'stock_taxan'), exist_ok=True)
+    total = 0
+    for part, (n, dates) in enumerate(_chunks(rng, days, rows, chunk_rows)):
+        item = rng.choice(cat.items, n, p=cat.item_weights)
+        branch = rng.choice(cat.branches, n, p=cat.branch_weights)
+        kind = rng.choice(3, n, p=[0.75, 0.2, 0.05])  # sale, receipt, adjustment
+        quantity = rng.geometric(0.45, n).astype(float)
+        quantity = np.where(kind == 0, -quantity, np.where(kind == 1, quantity * 12, quantity * rng.choice([-1, 1], n)))
+        columns = {
+            'StockID': _strings(cat.stock_ids, item),
+            'TxTp': _strings(['SAL', 'GRV', 'ADJ'], kind.astype(np.int32)),
+            'Transaction': _numbered('T', total + np.arange(n)),
+            'TranDate': pa.array(dates, type=pa.date32()),
+            'WH': _strings(cat.branch_wh, branch),
+            'Quantity': quantity,
+            'LinkQty': np.floor(quantity / 6),
+            'StockKey': _strings(cat.stock_keys, item),
+        }
+        _write('stock_taxan', columns, os.path.join(out_dir, 'stock_taxan', f'part-{part:05d}.parquet'))
+        total += n
+        print(f"[synthetic_data] stock_taxan part {part}: {n} rows")
+    return total
+
+
+def generate_purchases(rng, cat: Catalogue, days, rows, out_dir, chunk_rows):
+    os.makedirs(os.path.join(out_dir, 'purchases'), exist_ok=True)
+    total = 0
+    for part, (n, dates) in enumerate(_chunks(rng, days, rows, chunk_rows)):
+        item = rng.choice(cat.items, n, p=cat.item_weights)
+        branch = rng.choice(cat.branches, n, p=cat.branch_weights)
+        quantity = (rng.geometric(0.2, n) * 6).astype(float)
+        price = np.round(cat.prices[item] * 0.75, 2)
+        total_excl = np.round(quantity * price, 2)
+        supplier = cat.item_supplier[item]
+        columns = {
+            'StockID': _strings(cat.stock_ids, item),
+            'CO': _constant('01', n),
+            'BRANCH': _strings(cat.branch_names, branch),
+            'AP': _strings(cat.supplier_ids, supplier),
+            'GRVDATE': pa.array(dates, type=pa.date32()),
+            'GRVedAccount': _strings(cat.supplier_ids, supplier),
+            'GRVedSupplier': _strings(cat.supplier_ids, supplier),
+            'DocumentType': _constant('GRV', n),
+            'STOCKCODE': _strings(cat.stock_ids, item),
+            'LINKCODE': _strings(cat.stock_ids, item),
+            'RECVQTY': quantity,
+            'RECVFREEQTY': np.zeros(n),
+            'RECVLINKQTY': quantity / 6,
+            'RECVFREELINKQTY': np.zeros(n),
+            'RECVPRICE': price,
+            'RECVDISCOUNT': np.zeros(n),
+            'RECVTOTAL': total_excl,
+            'RECVTAX': np.round(total_excl * (VAT - 1), 2),
+            'RECVNETUNIT': price,
+            'RECVNNET': total_excl,
+            'RECVTOTALINCL': np.round(total_excl * VAT, 2),
+            'INTERCO': _constant('N', n),
+            'StockKey': _strings(cat.stock_keys, item),
+        }
+        _write('purchases', columns, os.path.join(out_dir, 'purchases', f'part-{part:05d}.parquet'))
+        total += n
+    print(f"[synthetic_data] purchases: {total} rows")
+    return total
+
+
+def generate_stock(rng, cat: Catalogue, out_dir):
+    n = cat.items
+    brand = rng.integers(0, len(BRANDS), n)
+    product = rng.integers(0, len(PRODUCTS), n)
+    size = rng.integers(0, len(SIZES), n)
+    names = np.array([f'{BRANDS[b]} {PRODUCTS[p]} {SIZES[s]}' for b, p, s in zip(brand, product, size)])
+    cat0 = product % 4
+    cat1 = product
+    columns = {col: _constant('', n) for col in TABLE_COLUMNS['stock']}
+    columns.update({
+        'StockID': pa.array(cat.stock_ids),
+        'co': _constant('01', n),
+        'Status': _constant('A', n),
+        'Cat0': _strings(['Food', 'Beverages', 'Household', 'Snacks'], cat0),
+        'Cat1': _strings(PRODUCTS, cat1),
+        'Cat2': _strings(SIZES, size),
+        'Cat3': _strings(['Regular', 'Premium'], (cat.prices > 40).astype(np.int32)),
+        'Cat4': _strings(['Core', 'Seasonal'], (rng.random(n) < 0.1).astype(np.int32)),
+        'Brand': _strings(BRANDS, brand),
+        'Brand Name': _strings(BRANDS, brand),
+        'StockCode': pa.array(cat.stock_ids),
+        'LinkCode': pa.array(cat.stock_ids),
+        'Description1': pa.array(names),
+        'SupplierID': _strings(cat.supplier_ids, cat.item_supplier),
+        'SupplierCode': _strings(cat.supplier_ids, cat.item_supplier),
+        'StockKey': pa.array(cat.stock_keys),
+    })
+    _write('stock', columns, os.path.join(out_dir, 'stock.parquet'))
+    return n
+
+
+def generate_suppliers(rng, cat: Catalogue, out_dir):
+    n = cat.suppliers
+    group = rng.integers(0, max(1, n // 20), n)
+    columns = {
+        'SupplierID': pa.array(cat.supplier_ids),
+        'SupplierGroup': _numbered('Group ', group),
+        'SupplierName': pa.array([f'{BRANDS[i % len(BRANDS)]} Distributors {i}' for i in range(n)]),
+        'Sup_Group_Code': _numbered('G', group),
+        'Group_Head_Buyer': _constant('Buyer', n),
+        'Group_Admin_Buyer': _constant('Admin', n),
+    }
+    _write('suppliers', columns, os.path.join(out_dir, 'suppliers.parquet'))
+    return n
+
+
+def generate_stock_onhands(rng, cat: Catalogue, out_dir, items_per_branch):
+    items_per_branch = min(items_per_branch, cat.items)
+    branch = np.repeat(np.arange(cat.branches), items_per_branch)
+    item = np.concatenate([
+        rng.choice(cat.items, items_per_branch, replace=False, p=cat.item_weights) for _ in range(cat.branches)
+    ])
+    n = len(item)
+    onhand = np.round(rng.normal(20, 15, n))
+    value = np.round(np.clip(onhand, 0, None) * cat.prices[item] * 0.75, 2)
+    columns = {
+        'StockCodeID': _strings(cat.stock_ids, item),
+        'CO': _constant('01', n),
+        'BRANCH': _strings(cat.branch_names, branch),
+        'STOCKCODE': _strings(cat.stock_ids, item),
+        'WH': _strings(cat.branch_wh, branch),
+        'ONHAND': onhand,
+        'VAL_EXCL': value,
+        'VAL_INCL': np.round(value * VAT, 2),
+        'StockKey': _strings(cat.stock_keys, item),
+    }
+    _write('stock_onhands', columns, os.path.join(out_dir, 'stock_onhands.parquet'))
+    return n
+
+
+def generate(out_dir: str, sales_rows: int = 1_000_000, taxan_rows: int | None = None,
+             purchase_rows: int | None = None, items: int = 20_000, branches: int = 50,
+             suppliers: int = 1_500, weeks: int = 104, onhand_items_per_branch: int = 2_000,
+             end_date: datetime.date | None = None, seed: int = 0,
+             chunk_rows: int = DEFAULT_CHUNK_ROWS) -> dict:
+    """
+    Writes a synthetic snapshot to ``out_dir``.
+
+    Args:
+        out_dir: Target directory (the DuckDB backend's ``ANALYTIQ_PARQUET_DIR``).
+        sales_rows: Rows in ``sales``.
+        taxan_rows: Rows in ``stock_taxan``; defaults to ``sales_rows``.
+        purchase_rows: Rows in ``purchases``; defaults to 5% of ``sales_rows``.
+        items: Distinct products.
+        branches: Branches (each with one warehouse).
+        suppliers: Suppliers.
+        weeks: Weeks of history, ending at ``end_date`` (default today).
+        onhand_items_per_branch: ``stock_onhands`` rows per branch.
+        seed: Random seed; the same arguments and seed give the same data.
+        chunk_rows: Rows per Parquet part of the transactional tables.
+
+    Returns:
+        The manifest (arguments and row counts), also written to ``<out_dir>/_manifest.json``.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    end_date = end_date or datetime.date.today()
+    days = np.arange(
+        np.datetime64(end_date - datetime.timedelta(weeks=weeks)) + 1, np.datetime64(end_date) + 1
+    ).astype('datetime64[D]')
+    cat = Catalogue(rng, items, branches, suppliers)
+    rows = {
+        'stock': generate_stock(rng, cat, out_dir),
+        'suppliers': generate_suppliers(rng, cat, out_dir),
+        'stock_onhands': generate_stock_onhands(rng, cat, out_dir, onhand_items_per_branch),
+        'sales': generate_sales(rng, cat, days, sales_rows, out_dir, chunk_rows),
+        'stock_taxan': generate_stock_taxan(rng, cat, days, taxan_rows or sales_rows, out_dir, chunk_rows),
+        'purchases': generate_purchases(rng, cat, days, purchase_rows or sales_rows // 20, out_dir, chunk_rows),
+    }
+    manifest = {
+        'seed': seed,
+        'items': items,
+        'branches': branches,
+        'suppliers': suppliers,
+        'weeks': weeks,
+        'first_date': str(days[0]),
+        'last_date': str(days[-1]),
+        'rows': {table: int(count) for table, count in rows.items()},
+    }
+    with open(os.path.join(out_dir, '_manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', default=os.path.join('data', 'synthetic'))
+    parser.add_argument('--sales-rows', type=int, default=1_000_000)
+    parser.add_argument('--taxan-rows', type=int)
+    parser.add_argument('--purchase-rows', type=int)
+    parser.add_argument('--items', type=int, default=20_000)
+    parser.add_argument('--branches', type=int, default=50)
+    parser.add_argument('--suppliers', type=int, default=1_500)
+    parser.add_argument('--weeks', type=int, default=104)
+    parser.add_argument('--onhand-items-per-branch', type=int, default=2_000)
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args()
+    manifest = generate(
+        args.out, args.sales_rows, args.taxan_rows, args.purchase_rows, args.items, args.branches,
+        args.suppliers, args.weeks, args.onhand_items_per_branch, args.end_date, args.seed, args.chunk_rows,
+    )
+    print(json.dumps(manifest, indent=2))
@@ -0,0 +1,174 @@
+"""
+Declared column types and physical layout for the tables loaded from the Excel workbook.
+
+Columns not listed for a table are loaded as STRING. Dates are loaded as
+DATE and quantity/money columns as FLOAT64, so queries no longer need
+``PARSE_DATE``/``CAST`` at read time; the large transactional tables are
+partitioned by date and clustered on their usual filter/join keys.
+
+Every table that references a product also gets a canonical ``StockKey``
+column at ingest (see ``stock_key``), which all queries join on.
+"""
+import pandas as pd
+
+MONEY_AND_QTY = 'FLOAT64'
+
+# Source column of the canonical StockKey for each table that has one.
+STOCK_KEY_SOURCES = {
+    'sales': 'StockID',
+    'stock': 'StockID',
+    'stock_onhands': 'StockCodeID',
+    'stock_taxan': 'StockID',
+    'purchases': 'StockID',
+}
+
+COLUMN_TYPES = {
+    'sales': {
+        'TranDate': 'DATE',
+        'PriceExcl': MONEY_AND_QTY,
+        'Quantity': MONEY_AND_QTY,
+        'LinkQty': MONEY_AND_QTY,
+        'SalesExcl': MONEY_AND_QTY,
+        'SalesIncl': MONEY_AND_QTY,
+        'CostExcl': MONEY_AND_QTY,
+        'CostIncl': MONEY_AND_QTY,
+        'GrossProfit': MONEY_AND_QTY,
+        'Rebate': MONEY_AND_QTY,
+        'NettProfit': MONEY_AND_QTY,
+    },
+    'stock_taxan': {
+        'TranDate': 'DATE',
+        'Quantity': MONEY_AND_QTY,
+        'LinkQty': MONEY_AND_QTY,
+    },
+    'purchases': {
+        'GRVDATE': 'DATE',
+        'RECVQTY': MONEY_AND_QTY,
+        'RECVFREEQTY': MONEY_AND_QTY,
+        'RECVLINKQTY': MONEY_AND_QTY,
+        'RECVFREELINKQTY': MONEY_AND_QTY,
+        'RECVPRICE': MONEY_AND_QTY,
+        'RECVDISCOUNT': MONEY_AND_QTY,
+        'RECVTOTAL': MONEY_AND_QTY,
+        'RECVTAX': MONEY_AND_QTY,
+        'RECVNETUNIT': MONEY_AND_QTY,
+        'RECVNNET': MONEY_AND_QTY,
+        'RECVTOTALINCL': MONEY_AND_QTY,
+    },
+    'stock_onhands': {
+        'ONHAND': MONEY_AND_QTY,
+        'VAL_EXCL': MONEY_AND_QTY,
+        'VAL_INCL': MONEY_AND_QTY,
+    },
+    'stock': {},
+    'stock_master': {
+        'LastCostExcl': MONEY_AND_QTY,
+        'LastCostIncl': MONEY_AND_QTY,
+        'AvgCostExcl': MONEY_AND_QTY,
+        'AvgCostIncl': MONEY_AND_QTY,
+        'BuyCostExcl': MONEY_AND_QTY,
+        'BuyCostIncl': MONEY_AND_QTY,
+        'SugSell': MONEY_AND_QTY,
+        'ListCostExcl': MONEY_AND_QTY,
+        'ListCostIncl': MONEY_AND_QTY,
+        'MinQty': MONEY_AND_QTY,
+        'MaxQty': MONEY_AND_QTY,
+    },
+}
+
+# Monthly date partitions keep the partition count well under BigQuery's
+# limit while still pruning most of the history for single-week queries.
+PARTITIONING = {
+    'sales': ('TranDate', 'MONTH'),
+    'stock_taxan': ('TranDate', 'MONTH'),
+}
+
+# stock_taxan has no branch column; WH is its location key.
+CLUSTERING = {
+    'sales': ['Branch', 'StockKey'],
+    'stock_taxan': ['WH', 'StockKey'],
+}
+
+# High-water mark columns for incremental loads: (date column, document key).
+# Rows on the watermark date are de-duplicated by the key where the sheet has
+# one; without a key the whole watermark day is replaced.
+WATERMARKS = {
+    'sales': ('TranDate', 'DocNo'),
+    'stock_taxan': ('TranDate', None),
+    'purchases': ('GRVDATE', None),
+}
+
+
+for _table in STOCK_KEY_SOURCES:
+    COLUMN_TYPES[_table]['StockKey'] = 'STRING'
+
+
+def column_type(table: str, column: str) -> str:
+    """Returns the declared BigQuery type of ``column`` in ``table`` (STRING if undeclared)."""
+    return COLUMN_TYPES.get(table, {}).get(column, 'STRING')
+
+
+def stock_key(codes: pd.Series) -> pd.Series:
+    """
+    Canonical product key: the whole stock code, trimmed and upper-cased.
+
+    Only spacing and case are normalized, so variant codes ("123-1", "123-2")
+    and leading zeros ("00123") stay distinct items; blank codes get NULL.
+    """
+    keys = codes.astype('string').str.strip().str.upper()
+    return keys.mask(keys == '')
+
+
+def coerce_frame(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    """
+    Converts the columns of a sheet to their declared types, in place, and adds its StockKey.
+
+    Unparseable dates and numbers become NULL rather than failing the load.
+    """
+    if table in STOCK_KEY_SOURCES and STOCK_KEY_SOURCES[table] in df.columns:
+        df['StockKey'] = stock_key(df[STOCK_KEY_SOURCES[table]])
+    for col in df.columns:
+        kind = column_type(table, col)
+        if kind == 'DATE':
+            df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
+        elif kind in ('FLOAT64', 'NUMERIC'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        elif kind == 'INT64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        else:
+            df[col] = df[col].astype('string')
+    return df
+
+
+def bigquery_schema(table: str, columns) -> list:
+    """Returns the BigQuery SchemaField list for ``columns`` of ``table``."""
+    from google.cloud import bigquery
+    return [bigquery.SchemaField(col, column_type(table, col)) for col in columns]
+
+
+def arrow_schema(table: str, columns):
+    """Returns the pyarrow schema matching the declared types of ``columns``."""
+    import pyarrow as pa
+    arrow_types = {
+        'DATE': pa.date32(),
+        'FLOAT64': pa.float64(),
+        'NUMERIC': pa.float64(),
+        'INT64': pa.int64(),
+        'STRING': pa.string(),
+    }
+    return pa.schema([(col, arrow_types[column_type(table, col)]) for col in columns])
+
+
+def load_job_options(table: str) -> dict:
+    """Returns partitioning/clustering keyword arguments for a LoadJobConfig."""
+    from google.cloud import bigquery
+    options = {}
+    if table in PARTITIONING:
+        field, granularity = PARTITIONING[table]
+        options['time_partitioning'] = bigquery.TimePartitioning(
+            type_=getattr(bigquery.TimePartitioningType, granularity),
+            field=field,
+        )
+    if table in CLUSTERING:
+        options['clustering_fields'] = CLUSTERING[table]
+    return options
@@ -0,0 +1,138 @@
+"""
+AnswerService against a fake LLM client whose chunks are released by the test.
+"""
+import threading
+import time
+
+from answer_service import ERROR_MESSAGE, AnswerService, answer_key
+from llm_client import LLMClient
+from result_cache import ResultCache
+
+TIMEOUT = 5
+
+
+class GatedClient(LLMClient):
+    """Yields ``chunks``, the first at once and each next one after ``release`` is set."""
+
+    name = 'gated'
+
+    def __init__(self, chunks, error=None, hold_first=False):
+        self.chunks = chunks
+        self.error = error
+        self.hold_first = hold_first
+        self.release = threading.Event()
+        self.calls = 0
+        self.yielded = 0
+
+    def stream(self, prompt):
+        self.calls += 1
+        for index, chunk in enumerate(self.chunks):
+            if index or self.hold_first:
+                assert self.release.wait(TIMEOUT)
+            self.yielded += 1
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def collect(service, session_id, question, into):
+    into[session_id] = list(service.stream_answer(session_id, question, 'v1', f'prompt: {question}'))
+
+
+def test_identical_concurrent_questions_share_one_call():
+    client = GatedClient(['Top ', 'supplier ', 'is S1.'], hold_first=True)
+    service = AnswerService(client, cache=ResultCache())
+    answers = {}
+    threads = [
+        threading.Thread(target=collect, args=(service, session_id, question, answers))
+        for session_id, question in (('a', 'Top supplier?'), ('b', 'top supplier'))
+    ]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: service.stats['started'] + service.stats['coalesced'] == 2)
+    client.release.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert client.calls == 1
+    assert service.stats['coalesced'] == 1
+    assert ''.join(answers['a']) == ''.join(answers['b']) == 'Top supplier is S1.'
+
+    # Completed answers are then served from the cache.
+    assert list(service.stream_answer('c', 'Top supplier?', 'v1', 'prompt')) == ['Top supplier is S1.']
+    assert client.calls == 1
+
+
+def test_abandoned_answer_stops_the_stream():
+    client = GatedClient([f'chunk {i} ' for i in range(10)])
+    service = AnswerService(client, cache=ResultCache())
+    stream = service.stream_answer('a', 'Slow question', 'v1', 'prompt')
+    assert next(stream) == 'chunk 0 '
+    # What Streamlit does when the user asks again mid-answer.
+    stream.close()
+    assert service.stats['cancelled'] == 1
+    client.release.set()
+    wait_for(lambda: not service._requests)
+
+    assert client.yielded < len(client.chunks)
+    # A cancelled answer is not cached; asking again starts a new call.
+    assert ''.join(service.stream_answer('a', 'Slow question', 'v1', 'prompt')) == ''.join(client.chunks)
+    assert client.calls == 2
+
+
+def test_new_question_cancels_the_session_previous_one():
+    client = GatedClient(['first ', 'answer'], hold_first=True)
+    service = AnswerService(client, cache=ResultCache())
+    previous = service.stream_answer('a', 'First question', 'v1', 'prompt')
+    listener = threading.Thread(target=lambda: list(previous))
+    listener.start()
+    wait_for(lambda: service.stats['started'] == 1)
+    service.cache.put(answer_key('Second question', 'v1'), 'second', tables=('answers',))
+
+    assert list(service.stream_answer('a', 'Second question', 'v1', 'prompt')) == ['second']
+    assert service.stats['cancelled'] == 1
+    client.release.set()
+    listener.join(TIMEOUT)
+    assert client.yielded < len(client.chunks)
+
+
+def test_errors_reach_the_caller():
+    client = GatedClient(['Partial '], error=RuntimeError('quota exceeded'))
+    client.release.set()
+    service = AnswerService(client, cache=ResultCache())
+
+    assert list(service.stream_answer('a', 'Question', 'v1', 'prompt')) == ['Partial ', ERROR_MESSAGE]
+    assert service.stats['errors'] == 1
+    # Failed answers are not cached.
+    assert list(service.stream_answer('a', 'Question', 'v1', 'prompt')) == ['Partial ', ERROR_MESSAGE]
+    assert client.calls == 2
+
+
+def test_hung_call_gives_every_listener_the_error_at_the_deadline():
+    client = GatedClient(['never'], hold_first=True)
+    service = AnswerService(client, cache=ResultCache(), timeout=0.2)
+    answers = {}
+    threads = [
+        threading.Thread(target=collect, args=(service, session_id, 'Hung question', answers))
+        for session_id in 'ab'
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+    assert answers == {'a': [ERROR_MESSAGE], 'b': [ERROR_MESSAGE]}
+    assert client.calls == 1
+    assert service.stats['timeouts'] == 1
+    assert not service._requests
+    # A late answer is dropped, not cached.
+    client.release.set()
+    wait_for(lambda: client.yielded == 1)
+    assert service.cache.get(answer_key('Hung question', 'v1'), ('answers',)) == (False, None)
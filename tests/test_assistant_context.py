@@ -0,0 +1,109 @@
+"""
+Retrieval of the Data Assistant's context over a small displayed table.
+"""
+import pandas as pd
+
+from assistant_context import (
+    MAX_MATCHED_ROWS, PROMPT_TEMPLATE, ContextIndex, TrigramIndex, answer_question, build_prompt,
+)
+
+
+def weekly_table():
+    return pd.DataFrame({
+        'Item Name': ['TASTIC RICE 2KG', 'TASTIC RICE 10KG', 'WHITE STAR MAIZE 5KG', 'COCA COLA 2L', 'SPEKKO RICE 1KG'],
+        'SupplierID': ['S1', 'S1', 'S2', 'S3', 'S2'],
+        'SupplierName': ['Tiger Brands', 'Tiger Brands', 'Pioneer Foods', 'Coca Cola SA', 'Pioneer Foods'],
+        'Cat0': ['GROCERY', 'GROCERY', 'GROCERY', 'BEVERAGES', 'GROCERY'],
+        'Cat1': ['RICE', 'RICE', 'MAIZE', 'SOFT DRINKS', 'RICE'],
+        'Brand': ['TASTIC', 'TASTIC', 'WHITE STAR', 'COCA COLA', 'SPEKKO'],
+        'Quantity Sold': [10, 25, 40, 100, 5],
+    })
+
+
+def matching_items(context):
+    """The item names listed under "Matching items", in order."""
+    lines = context.split('Matching items')[1].splitlines()[1:]
+    return [line[2:].split(' | ')[0] for line in lines if line.startswith('- ')]
+
+
+def test_trigram_index_matches_misspellings_and_ranks_closer_names_first():
+    index = TrigramIndex(weekly_table()['Item Name'])
+
+    scores = index.search(['tastc'])
+    assert list(scores > 0) == [True, True, False, False, False]
+
+    scores = index.search(['tastic', '10kg'])
+    assert scores[1] > scores[0] > 0
+    assert scores[2:].sum() == 0
+
+
+def test_item_question_retrieves_the_matching_items_largest_first():
+    index = ContextIndex(weekly_table(), 'Quantity Sold', 'Weekly Sales, week 2025-20')
+    context = index.build_context('How much Tastic did we sell?')
+
+    assert context.splitlines()[0] == 'Weekly Sales, week 2025-20'
+    assert 'total Quantity Sold: 180' in context
+    assert matching_items(context) == ['TASTIC RICE 10KG', 'TASTIC RICE 2KG']
+
+
+def test_supplier_question_retrieves_the_supplier_total_and_its_items():
+    index = ContextIndex(weekly_table(), 'Quantity Sold', 'Weekly Sales')
+    context = index.build_context('What did Pioneer Foods sell?')
+
+    assert 'Matching suppliers: Pioneer Foods (S2): 45' in context
+    assert matching_items(context) == ['WHITE STAR MAIZE 5KG', 'SPEKKO RICE 1KG']
+
+
+def test_category_question_retrieves_the_category_total_and_its_items():
+    index = ContextIndex(weekly_table(), 'Quantity Sold', 'Weekly Sales')
+    context = index.build_context('beverages')
+
+    assert 'Matching categories: Cat0 BEVERAGES: 100' in context
+    assert matching_items(context) == ['COCA COLA 2L']
+
+
+def test_question_without_search_words_gets_only_the_aggregates():
+    index = ContextIndex(weekly_table(), 'Quantity Sold', 'Weekly Sales')
+    context = index.build_context('What are the top sales this week?')
+
+    assert 'Top items by Quantity Sold: COCA COLA 2L: 100, WHITE STAR MAIZE 5KG: 40' in context
+    assert 'Matching items' not in context
+
+
+def test_prompt_size_does_not_grow_with_the_table():
+    def table(rows):
+        return pd.DataFrame({
+            'Item Name': [f'TASTIC RICE {i}KG' for i in range(rows)],
+            'SupplierID': [f'S{i % 50}' for i in range(rows)],
+            'SupplierName': [f'Supplier {i % 50}' for i in range(rows)],
+            'Cat0': ['GROCERY'] * rows,
+            'Quantity Sold': range(rows),
+        })
+
+    small = build_prompt('tastic rice', ContextIndex(table(MAX_MATCHED_ROWS), 'Quantity Sold', 'Weekly Sales'))
+    large_index = ContextIndex(table(20000), 'Quantity Sold', 'Weekly Sales')
+    large = build_prompt('tastic rice', large_index)
+
+    assert f'Matching items (showing {MAX_MATCHED_ROWS} of 20000)' in large
+    assert len(matching_items(large)) == MAX_MATCHED_ROWS
+    # Only the numbers in the listed rows get longer.
+    assert len(large) < len(small) + 1000
+    assert len(large) < 10000
+
+
+def test_answer_question_sends_the_built_prompt():
+    index = ContextIndex(weekly_table(), 'Quantity Sold', 'Weekly Sales')
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return 'Tastic sold 35 units.'
+
+    answer, stats = answer_question('How much Tastic?', index, generate)
+
+    assert answer == 'Tastic sold 35 units.'
+    assert prompts == [build_prompt('How much Tastic?', index)]
+    assert prompts[0].startswith(PROMPT_TEMPLATE.split('{context}')[0])
+    assert prompts[0].endswith('User question: How much Tastic?')
+    assert stats['prompt_chars'] == len(prompts[0])
+    assert 0 <= stats['context_seconds'] <= stats['total_seconds']
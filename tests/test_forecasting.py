@@ -0,0 +1,86 @@
+"""
+Forecast methods and schedule computation against hand-computed item × week arrays.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecasting import (
+    SEASON_LENGTH, SalesHistory, build_schedule, ewma, forecast, history_from_frame, moving_average,
+    order_quantities, seasonal_naive,
+)
+
+# Three items over six weeks, oldest → newest.
+QUANTITIES = np.array([
+    [1, 2, 3, 4, 5, 6],
+    [0, 0, 0, 0, 0, 0],
+    [10, 0, 0, 0, 0, 2],
+], dtype=float)
+
+
+def test_moving_average_of_the_last_window_weeks():
+    np.testing.assert_allclose(moving_average(QUANTITIES, 4), [4.5, 0.0, 0.5])
+    np.testing.assert_allclose(moving_average(QUANTITIES, 1), [6.0, 0.0, 2.0])
+
+
+def test_moving_average_with_fewer_weeks_than_the_window_averages_what_there_is():
+    np.testing.assert_allclose(moving_average(QUANTITIES, 10), [3.5, 0.0, 2.0])
+
+
+def test_ewma_weights_recent_weeks_more():
+    # Span 3: alpha 0.5, weights 0.25, 0.5, 1 for the last three weeks.
+    np.testing.assert_allclose(ewma(QUANTITIES, 3), [9.5 / 1.75, 0.0, 2 / 1.75])
+
+
+def test_ewma_with_fewer_weeks_than_the_window_weights_what_there_is():
+    # Span 4: alpha 0.4, weights 0.6, 1 for the two weeks there are.
+    np.testing.assert_allclose(ewma(QUANTITIES[:, -2:], 4), [(5 * 0.6 + 6) / 1.6, 0.0, 2 / 1.6])
+
+
+def test_seasonal_naive_takes_the_week_one_season_back():
+    np.testing.assert_allclose(seasonal_naive(QUANTITIES, 4), [3.0, 0.0, 0.0])
+    np.testing.assert_allclose(seasonal_naive(QUANTITIES, 6), [1.0, 0.0, 10.0])
+
+
+def test_seasonal_naive_with_less_than_a_season_falls_back_to_the_mean():
+    np.testing.assert_allclose(seasonal_naive(QUANTITIES, SEASON_LENGTH), [3.5, 0.0, 2.0])
+
+
+@pytest.mark.parametrize('method', [moving_average, ewma, seasonal_naive])
+def test_zero_history_forecasts_zero(method):
+    np.testing.assert_array_equal(method(np.zeros((3, 0)), 4), np.zeros(3))
+    assert method(np.zeros((0, 0)), 4).shape == (0,)
+
+
+def test_forecast_rejects_unknown_methods():
+    history = SalesHistory(np.array(['A']), ['2025-01'], np.ones((1, 1)))
+    with pytest.raises(ValueError, match='Unknown forecast method'):
+        forecast(history, 'median')
+
+
+def test_history_from_frame_pivots_and_fills_missing_weeks():
+    rows = pd.DataFrame({
+        'StockID': ['B', 'A', 'A', 'B', None],
+        'week': ['2025-02', '2025-01', '2025-03', '2025-02', '2025-01'],
+        'qty': [1.0, 2.0, 3.0, 4.0, 9.0],
+    })
+    history = history_from_frame(rows, ['2025-03', '2025-01', '2025-02'])
+    assert list(history.stock_ids) == ['A', 'B']
+    assert history.weeks == ['2025-01', '2025-02', '2025-03']
+    np.testing.assert_array_equal(history.quantities, [[2, 0, 3], [0, 5, 0]])
+
+
+def test_orders_treat_negative_stock_as_zero():
+    np.testing.assert_array_equal(
+        order_quantities(np.array([5.0, 5.0, 5.0]), np.array([2.0, -3.0, 8.0])), [3.0, 5.0, 0.0]
+    )
+
+
+def test_build_schedule_matches_stock_on_hand_by_item():
+    history = SalesHistory(np.array(['A', 'B', 'C']), ['w1', 'w2', 'w3', 'w4', 'w5', 'w6'], QUANTITIES)
+    onhand = pd.DataFrame({'StockID': ['C', 'A', 'A', 'Z'], 'ONHAND': [1.0, 1.0, 2.0, 50.0]})
+    schedule = build_schedule(history, onhand, 'moving_average', 4)
+    assert list(schedule['StockID']) == ['A', 'B', 'C']
+    np.testing.assert_allclose(schedule['avg_sales'], [4.5, 0.0, 0.5])
+    np.testing.assert_allclose(schedule['ONHAND'], [3.0, 0.0, 1.0])
+    np.testing.assert_allclose(schedule['RecommendedOrder'], [1.5, 0.0, 0.0])
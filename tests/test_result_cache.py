@@ -0,0 +1,158 @@
+"""
+ResultCache bounds, expiry, versioning, disk tier and shared computations.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+import result_cache
+from result_cache import ResultCache, cached
+
+
+class Clock:
+    """Stands in for ``time.time`` in result_cache."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, 'time', clock)
+    return clock
+
+
+def block(kb):
+    return np.zeros(kb * 128)  # kb × 1024 bytes
+
+
+def test_memory_tier_stays_within_its_byte_budget_evicting_least_recently_used():
+    cache = ResultCache(max_bytes=3 * 1024)
+    for key in 'abc':
+        cache.put(key, block(1))
+    assert cache.get('a')[0]  # now the most recently used
+    cache.put('d', block(1))
+
+    assert [cache.get(key)[0] for key in 'abcd'] == [True, False, True, True]
+    assert cache.stats['evictions'] == 1
+    assert cache._bytes <= cache.max_bytes
+
+
+def test_values_larger_than_the_budget_are_not_kept():
+    cache = ResultCache(max_bytes=1024)
+    cache.put('big', block(2))
+    assert cache.get('big') == (False, None)
+
+
+def test_results_expire_after_the_shortest_ttl_of_their_tables(clock):
+    calls = []
+    cache = ResultCache(versions=lambda tables: {t: 'v1' for t in tables})
+
+    @cached(cache, ['sales_weekly', 'stock_onhands'])
+    def onhand(branch):
+        calls.append(branch)
+        return len(calls)
+
+    @cached(cache, ['sales_weekly'])
+    def sales(branch):
+        calls.append(branch)
+        return len(calls)
+
+    assert onhand('BR01') == 1 and sales('BR01') == 2
+    clock.now += result_cache.TABLE_TTLS['stock_onhands'] - 1
+    assert onhand('BR01') == 1
+    clock.now += 2
+    assert onhand('BR01') == 3
+    # Tables without a TTL only change with their version.
+    clock.now += 365 * 24 * 60 * 60
+    assert sales('BR01') == 2
+
+
+def test_version_bump_invalidates_only_the_results_reading_that_table():
+    versions = {'sales_weekly': 'v1', 'stock': 'v1'}
+    cache = ResultCache(versions=lambda tables: {t: versions[t] for t in tables})
+    calls = {'sales': 0, 'stock': 0}
+
+    @cached(cache, ['sales_weekly'])
+    def sales():
+        calls['sales'] += 1
+        return calls['sales']
+
+    @cached(cache, ['stock'])
+    def stock():
+        calls['stock'] += 1
+        return calls['stock']
+
+    assert (sales(), stock()) == (1, 1)
+    versions['sales_weekly'] = 'v2'
+    # Versions are trusted for version_ttl until refreshed.
+    assert sales() == 1
+    cache.refresh_versions()
+    assert (sales(), stock()) == (2, 1)
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path, clock):
+    ResultCache(disk_dir=str(tmp_path)).put('k', {'rows': [1, 2]}, ttl=60, tables=('stock',))
+
+    reopened = ResultCache(disk_dir=str(tmp_path))
+    assert reopened.get('k', ('stock',)) == (True, {'rows': [1, 2]})
+    assert reopened.stats['disk_hits'] == 1
+
+    clock.now += 61
+    assert ResultCache(disk_dir=str(tmp_path)).get('k', ('stock',)) == (False, None)
+    assert not list(tmp_path.glob('*.pkl'))
+
+
+def test_invalidate_drops_dependent_entries_from_both_tiers(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path))
+    cache.put('sales', 1, tables=('sales_weekly',))
+    cache.put('stock', 2, tables=('stock',))
+    cache.invalidate('stock')
+
+    reopened = ResultCache(disk_dir=str(tmp_path))
+    assert reopened.get('sales', ('sales_weekly',)) == (True, 1)
+    assert reopened.get('stock', ('stock',)) == (False, None)
+
+
+def test_concurrent_misses_for_one_key_share_one_computation():
+    cache = ResultCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        assert release.wait(5)
+        return 'result'
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)))
+    owner.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)))
+    waiter.start()
+    # The waiter is blocked on the owner's computation, not computing itself.
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [(False, 'result'), (True, 'result')]
+
+
+def test_failed_computation_is_raised_and_not_cached():
+    cache = ResultCache()
+
+    def fail():
+        raise RuntimeError('backend down')
+
+    with pytest.raises(RuntimeError, match='backend down'):
+        cache.get_or_compute('k', fail)
+    assert cache.get_or_compute('k', lambda: 'ok') == (False, 'ok')
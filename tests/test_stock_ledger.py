@@ -0,0 +1,127 @@
+"""
+Stock ledger built from a small snapshot, read through the DuckDB backend.
+"""
+import datetime
+
+import pandas as pd
+import pytest
+
+from query_backend import DuckDBBackend
+from stock_ledger import backtest, load_ledger, update_ledger
+
+# Mondays of sales weeks 2025-01 to 2025-04.
+WEEK_STARTS = {week: datetime.date(2025, 1, 6) + datetime.timedelta(weeks=i)
+               for i, week in enumerate(['2025-01', '2025-02', '2025-03', '2025-04'])}
+
+# (item, week, quantity) movements in warehouse 0001 of branch BR01.
+MOVEMENTS = [
+    ('A', '2025-01', 20.0), ('A', '2025-02', -5.0), ('A', '2025-03', -3.0),
+    ('B', '2025-02', -4.0), ('B', '2025-04', 2.0),
+    ('D', '2025-04', 6.0),
+]
+# Stock on hand after all MOVEMENTS; C never moves.
+ONHAND = {'A': 30.0, 'B': 5.0, 'C': 7.0, 'D': 6.0}
+
+
+def write_snapshot(path, through_week):
+    """Writes the snapshot as it stood at the end of ``through_week``."""
+    path.mkdir(exist_ok=True)
+    moved = [(item, week, qty) for item, week, qty in MOVEMENTS if week <= through_week]
+    later = [(item, qty) for item, week, qty in MOVEMENTS if week > through_week]
+    onhand = dict(ONHAND)
+    for item, qty in later:
+        onhand[item] -= qty
+    if any(item == 'D' and week > through_week for item, week, _ in MOVEMENTS):
+        del onhand['D']  # not stocked yet
+
+    pd.DataFrame({
+        'StockID': [item for item, _, _ in moved],
+        'StockKey': [item for item, _, _ in moved],
+        'WH': '0001',
+        'TranDate': [WEEK_STARTS[week] + datetime.timedelta(days=2) for _, week, _ in moved],
+        'Quantity': [qty for _, _, qty in moved],
+    }).to_parquet(path / 'stock_taxan.parquet', index=False)
+    pd.DataFrame({
+        'StockCodeID': list(onhand), 'StockKey': list(onhand), 'BRANCH': 'BR01', 'WH': '0001',
+        'ONHAND': list(onhand.values()),
+    }).to_parquet(path / 'stock_onhands.parquet', index=False)
+    pd.DataFrame({
+        'StockID': ['A'], 'StockKey': ['A'], 'BRANCH': ['BR01'], 'GRVDATE': [WEEK_STARTS['2025-01']],
+        'RECVQTY': [20.0], 'RECVFREEQTY': [0.0],
+    }).to_parquet(path / 'purchases.parquet', index=False)
+    # Sales of A and B, every week up to through_week.
+    sales = [(item, week, qty) for item, week, qty in [
+        ('A', '2025-01', 4.0), ('A', '2025-02', 5.0), ('A', '2025-03', 3.0), ('B', '2025-02', 4.0),
+        ('A', '2025-04', 2.0),
+    ] if week <= through_week]
+    pd.DataFrame({
+        'StockID': [item for item, _, _ in sales],
+        'StockKey': [item for item, _, _ in sales],
+        'Branch': 'BR01',
+        'TranDate': [WEEK_STARTS[week] + datetime.timedelta(days=1) for _, week, _ in sales],
+        'Quantity': [qty for _, _, qty in sales],
+        'LinkQty': [qty for _, _, qty in sales],
+    }).to_parquet(path / 'sales.parquet', index=False)
+    return DuckDBBackend(str(path))
+
+
+def onhand_dict(frame):
+    return dict(zip(frame['StockID'], frame['ONHAND']))
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    backend = write_snapshot(tmp_path / 'data', '2025-04')
+    update_ledger(backend, full=True, out_dir=str(tmp_path / 'ledger'))
+    return load_ledger(str(tmp_path / 'ledger'))
+
+
+def test_latest_balance_equals_the_on_hand_snapshot(ledger):
+    assert ledger.through_week == '2025-04'
+    assert onhand_dict(ledger.as_of('BR01', '2025-04')) == ONHAND
+    # Weeks after the ledger get the latest balances too.
+    assert onhand_dict(ledger.as_of('BR01', '2026-10')) == ONHAND
+
+
+def test_as_of_returns_each_week_closing_balance(ledger):
+    assert onhand_dict(ledger.as_of('BR01', '2025-01')) == {'A': 38.0, 'B': 7.0, 'C': 7.0, 'D': 0.0}
+    assert onhand_dict(ledger.as_of('BR01', '2025-02')) == {'A': 33.0, 'B': 3.0, 'C': 7.0, 'D': 0.0}
+    assert onhand_dict(ledger.as_of('BR01', '2025-03')) == {'A': 30.0, 'B': 3.0, 'C': 7.0, 'D': 0.0}
+    # Before any movement: the openings.
+    assert onhand_dict(ledger.as_of('BR01', '2024-52')) == {'A': 18.0, 'B': 7.0, 'C': 7.0, 'D': 0.0}
+    assert ledger.as_of('BR99', '2025-02').empty
+
+
+def test_balances_of_unknown_items_are_zero(ledger):
+    balances = ledger.balances('BR01', ['B', 'X'], ['2025-01', '2025-02'])
+    assert balances.tolist() == [[7.0, 3.0], [0.0, 0.0]]
+
+
+def test_incremental_update_equals_a_full_rebuild(tmp_path):
+    data = tmp_path / 'data'
+    update_ledger(write_snapshot(data, '2025-02'), out_dir=str(tmp_path / 'incremental'))
+    backend = write_snapshot(data, '2025-04')
+    manifest = update_ledger(backend, out_dir=str(tmp_path / 'incremental'))
+    update_ledger(backend, full=True, out_dir=str(tmp_path / 'rebuilt'))
+
+    assert manifest['recomputed_from'] == '2025-02'
+    incremental = load_ledger(str(tmp_path / 'incremental'))
+    rebuilt = load_ledger(str(tmp_path / 'rebuilt'))
+    assert incremental.weeks == rebuilt.weeks
+    for week in ['2024-52', *rebuilt.weeks]:
+        assert onhand_dict(incremental.as_of('BR01', week)) == onhand_dict(rebuilt.as_of('BR01', week))
+
+
+def test_backtest_of_weeks_without_history(tmp_path, ledger):
+    backend = DuckDBBackend(str(tmp_path / 'data'))
+
+    # Weeks the calendar doesn't know give an empty report.
+    assert backtest(backend, ledger, 'BR01', ['2030-01']).empty
+
+    # The first week has no earlier sales: nothing is forecast or ordered.
+    report = backtest(backend, ledger, 'BR01', ['2025-01'], 'moving_average', 4)
+    row = report.iloc[0]
+    assert row['week'] == '2025-01'
+    assert (row['forecast_units'], row['ordered_units'], row['sold_units']) == (0.0, 0.0, 4.0)
+    # A sold 4 from its opening 18.
+    assert (row['stockout_items'], row['excess_units']) == (0, 14.0)
@@ -0,0 +1,23 @@
+"""
+Canonical StockKey computed at ingest.
+"""
+import pandas as pd
+
+from table_schemas import coerce_frame, stock_key
+
+
+def test_stock_key_keeps_variants_and_leading_zeros_distinct():
+    keys = stock_key(pd.Series(['123-1', '123-2', '00123', '123']))
+    assert keys.tolist() == ['123-1', '123-2', '00123', '123']
+
+
+def test_stock_key_normalizes_only_spacing_and_case():
+    keys = stock_key(pd.Series([' 123-1 ', 'ab12', '', '  ', None]))
+    assert keys.iloc[:2].tolist() == ['123-1', 'AB12']
+    assert keys.iloc[2:].isna().all()
+
+
+def test_coerce_frame_adds_the_key_from_the_table_source_column():
+    onhands = coerce_frame(pd.DataFrame({'StockCodeID': ['00123 '], 'ONHAND': ['4']}), 'stock_onhands')
+    assert onhands['StockKey'].tolist() == ['00123']
+    assert onhands['ONHAND'].tolist() == [4.0]
@@ -1,45 +1,126 @@
+import argparse
 import os
-import pandas as pd
+import time
+import pyarrow.parquet as pq
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+from table_schemas import bigquery_schema, load_job_options
+from excel_ingest import ingest_workbook, list_sheets, table_name_for, DEFAULT_CHUNK_ROWS, DEFAULT_WORKERS
+from incremental_load import get_watermark, merge_delta, record_load
 
 # === CONFIGURATION ===
 EXCEL_FILE = "Espresso Test Data.xlsx"
 SERVICE_ACCOUNT_FILE = "bigsave-6767d8651634.json"
 PROJECT_ID = "bigsave"
 DATASET_ID = "demo"
+# Per-table Parquet files; also the local snapshot for ANALYTIQ_BACKEND=duckdb
+PARQUET_DIR = os.environ.get("ANALYTIQ_PARQUET_DIR", "data")
+CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+MAX_WORKERS = int(os.environ.get("INGEST_WORKERS", DEFAULT_WORKERS))
 
 # === AUTHENTICATION ===
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_FILE
 client = bigquery.Client(project=PROJECT_ID)
 
-print(f"Loading {EXCEL_FILE}...")
-xls = pd.ExcelFile(EXCEL_FILE)
-sheet_names = xls.sheet_names
-print(f"Found {len(sheet_names)} sheets: {sheet_names}")
 
-for sheet in sheet_names:
-    print(f"Processing sheet: {sheet}")
-    df = pd.read_excel(EXCEL_FILE, sheet_name=sheet)
-
-    # Convert all columns to string to avoid type inference issues
-    for col in df.columns:
-        df[col] = df[col].astype(str)
-
-    print(f"Read {len(df)} rows and {len(df.columns)} columns.")
-
-    # Sanitize table name: remove spaces and lowercase
-    table_name = sheet.strip().replace(' ', '_').lower()
+def upload_parquet(stats):
+    """Loads one sheet's Parquet file into its BigQuery table (runs on the upload thread pool)."""
+    if stats['watermark'] is not None:
+        upload_delta(stats)
+        return
+    table_name = stats['table']
     full_table_id = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
+    columns = pq.read_schema(stats['path']).names
 
     # === CONFIGURE LOAD JOB ===
+    options = load_job_options(table_name)
     job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
         write_disposition="WRITE_TRUNCATE",  # Overwrites table
-        autodetect=True,                     # Infers schema
+        schema=bigquery_schema(table_name, columns),
+        **options,
     )
 
+    # WRITE_TRUNCATE cannot change an existing table's partitioning, so
+    # drop tables created with a different layout (e.g. the old all-string ones).
+    wanted = options.get('time_partitioning')
+    try:
+        existing = client.get_table(full_table_id)
+        have = existing.time_partitioning
+        if (have and (have.field, have.type_)) != (wanted and (wanted.field, wanted.type_)) or \
+                (existing.clustering_fields or None) != options.get('clustering_fields'):
+            print(f"Recreating {full_table_id} with the declared partitioning/clustering...")
+            client.delete_table(full_table_id)
+    except NotFound:
+        pass
+
     # === UPLOAD ===
-    print(f"Uploading to BigQuery table: {full_table_id}...")
-    load_job = client.load_table_from_dataframe(df, full_table_id, job_config=job_config)
+    print(f"Uploading {stats['rows']} rows to BigQuery table: {full_table_id}...")
+    start = time.perf_counter()
+    with open(stats['path'], 'rb') as source:
+        load_job = client.load_table_from_file(source, full_table_id, job_config=job_config)
     load_job.result()
+    record_load(client, PROJECT_ID, DATASET_ID, table_name, 'full', stats['rows'], None)
+    print(f"✅ Upload complete for {full_table_id} in {time.perf_counter() - start:.1f}s.")
+
+
+def upload_delta(stats):
+    """Stages a sheet's new rows and merges them into the existing table."""
+    table_name = stats['table']
+    watermark = stats['watermark']
+    full_table_id = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
+    if stats['rows'] == 0:
+        print(f"No new rows for {full_table_id} past {watermark['date']}.")
+        record_load(client, PROJECT_ID, DATASET_ID, table_name, 'incremental', 0, watermark)
+        return
+    delta_table_id = f"{full_table_id}__delta"
+    columns = pq.read_schema(stats['path']).names
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition="WRITE_TRUNCATE",
+        schema=bigquery_schema(table_name, columns),
+    )
+    print(f"Merging {stats['rows']} new rows into {full_table_id} (watermark {watermark['date']})...")
+    start = time.perf_counter()
+    with open(stats['path'], 'rb') as source:
+        client.load_table_from_file(source, delta_table_id, job_config=job_config).result()
+    try:
+        merge_delta(client, full_table_id, delta_table_id, columns, watermark)
+    finally:
+        client.delete_table(delta_table_id, not_found_ok=True)
+    record_load(client, PROJECT_ID, DATASET_ID, table_name, 'incremental', stats['rows'], watermark)
+    print(f"✅ Incremental load complete for {full_table_id} in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Load {EXCEL_FILE} into {PROJECT_ID}.{DATASET_ID}.")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Rewrite every table (WRITE_TRUNCATE) instead of appending new sales, "
+                             "stock_taxan and purchases rows past each table's watermark.")
+    args = parser.parse_args()
+
+    watermarks = {}
+    if not args.full_refresh:
+        for sheet in list_sheets(EXCEL_FILE):
+            table_name = table_name_for(sheet)
+            watermark = get_watermark(client, f"{PROJECT_ID}.{DATASET_ID}.{table_name}", table_name)
+            if watermark is not None:
+                print(f"{table_name}: incremental load past {watermark['date']}")
+                watermarks[table_name] = watermark
+
+    mode = 'full refresh' if args.full_refresh else 'incremental'
+    print(f"Loading {EXCEL_FILE} ({mode}, {MAX_WORKERS} workers, {CHUNK_ROWS} rows per chunk)...")
+    # Deltas are staged separately so they don't replace the local full snapshot;
+    # the tables reloaded in full still refresh it.
+    results = ingest_workbook(EXCEL_FILE, PARQUET_DIR, upload=upload_parquet, watermarks=watermarks,
+                              max_workers=MAX_WORKERS, chunk_rows=CHUNK_ROWS,
+                              delta_dir=os.path.join(PARQUET_DIR, '_delta'))
+    for stats in results:
+        print(f"{stats['table']:<20} {stats['rows']:>10} rows  {stats['rows_per_sec']:>10,.0f} rows/s")
 
-    print(f"✅ Upload complete for {full_table_id}.")
+    # === REFRESH DERIVED TABLES ===
+    # A full refresh reloads every sales week, so the weekly rollup is rebuilt;
+    # after a delta only the newest weeks need recomputing.
+    from query_backend import BigQueryBackend
+    from sales_rollup import refresh_weekly_rollup
+    refresh_weekly_rollup(BigQueryBackend(client), full=args.full_refresh)
@@ -0,0 +1,137 @@
+"""
+Rerun-aware, staged construction of the dashboard views.
+
+Streamlit re-executes ``app.py`` on every interaction, chat messages
+included. Rather than rebuilding the table, the grid model and the Data
+Assistant index each time (and hashing the whole table to find them in
+``st.cache_*``), a page is built in explicit stages:
+
+    table   -> the displayed DataFrame (``views.py``)
+    grid    -> the grouped row model or the client grid options, from the table
+    context -> the Data Assistant index, from the table
+
+Every stage is memoized, process-wide, on the key of its inputs: the view,
+its parameters and the data version of the tables its data functions read
+(plus the stage's own arguments). Computing that key never touches the
+table, so a rerun whose inputs are unchanged, such as a chat turn, costs the
+same whatever the table's size, and only the stages downstream of a changed
+input are rebuilt.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from assistant_context import ContextIndex
+from data_access import (
+    result_cache, get_dimensions, get_sales_history, get_stock_ledger, get_stock_onhand_by_stockid,
+    get_weekly_sales_table, SCHEDULE_SOURCE_TABLES,
+)
+from instrumentation import timed
+from result_cache import TABLE_TTLS
+from views import build_weekly_sales_view, build_purchase_schedule_view
+
+# Stage results kept in memory (tables, grid models and indexes together).
+MAX_STAGE_ENTRIES = 48
+
+# Tables each view reads, from its data functions' cache declarations (plus the
+# batch results' sources, which decide whether a precomputed schedule is served).
+VIEW_TABLES = {
+    'weekly': sorted({*get_weekly_sales_table.tables, *get_dimensions.tables}),
+    'schedule': sorted({
+        *get_sales_history.tables, *get_stock_onhand_by_stockid.tables, *get_dimensions.tables,
+        *SCHEDULE_SOURCE_TABLES,
+    }),
+}
+
+_lock = threading.Lock()
+_stages = OrderedDict()  # stage key -> Future of the stage's result
+
+
+def _stage(key, build):
+    """Returns the memoized result of ``build()`` for ``key``; concurrent callers share one build."""
+    with _lock:
+        future = _stages.get(key)
+        owner = future is None
+        if owner:
+            future = _stages[key] = Future()
+        _stages.move_to_end(key)
+        while len(_stages) > MAX_STAGE_ENTRIES:
+            _stages.popitem(last=False)
+    if owner:
+        try:
+            future.set_result(build())
+        except BaseException as e:
+            with _lock:
+                if _stages.get(key) is future:
+                    del _stages[key]
+            future.set_exception(e)
+            raise
+    return future.result()
+
+
+def _data_version(tables) -> tuple:
+    versions = result_cache.table_versions(tables)
+    # Tables with a TTL (e.g. stock on hand) also roll over when their results expire.
+    ttls = [TABLE_TTLS[t] for t in tables if t in TABLE_TTLS]
+    epoch = int(time.time() // min(ttls)) if ttls else 0
+    return tuple(sorted(versions.items())), epoch
+
+
+class ViewPipeline:
+    """
+    The stages of one view for one set of parameters.
+
+    Args:
+        show_schedule: Purchase Schedule (True) or Weekly Sales (False).
+        branch: Branch of the schedule (the weekly table covers all branches).
+        week: Week of the weekly table.
+        prev_weeks: History weeks of the schedule.
+        method, window: Forecast method and window of the schedule.
+        onhand_week: Week whose closing stock on hand (stock ledger) a past week's schedule uses.
+    """
+
+    def __init__(self, show_schedule: bool, branch=None, week=None, prev_weeks=(), method=None, window=None,
+                 onhand_week=None):
+        self.show_schedule = show_schedule
+        self.branch, self.week = branch, week
+        self.prev_weeks, self.method, self.window = tuple(prev_weeks), method, window
+        self.onhand_week = onhand_week
+        if show_schedule:
+            ledger = get_stock_ledger() if onhand_week else None
+            # The ledger is versioned by its own updates rather than by a backend table.
+            params = ('schedule', branch, self.prev_weeks, method, window, onhand_week,
+                      ledger.manifest.get('updated_at') if ledger is not None else None)
+            self.title = f"Purchase Schedule for branch {branch}."
+            self.value_column = 'Order Qty'
+        else:
+            params = ('weekly', week)
+            self.title = f"Weekly Sales Table for week {week} (all branches)."
+            self.value_column = 'Quantity Sold'
+        self.key = (*params, _data_version(VIEW_TABLES[params[0]]))
+        # Identifies the displayed data, e.g. for caching answers or exports about it.
+        self.version = hashlib.sha256(repr(self.key).encode('utf-8')).hexdigest()[:16]
+
+    def table(self):
+        """The displayed table, or None when the schedule has no history."""
+        if self.show_schedule:
+            return _stage(('table', self.key), lambda: build_purchase_schedule_view(
+                self.branch, self.prev_weeks, self.method, self.window, self.onhand_week
+            ))
+        return _stage(('table', self.key), lambda: build_weekly_sales_view(self.week))
+
+    def stage(self, name: str, build, *args):
+        """
+        Returns ``build(table, *args)``, memoized on this view's key and ``args``.
+
+        ``args`` must be hashable; the result is shared and must not be mutated.
+        """
+        def run():
+            with timed('stage', name):
+                return build(self.table(), *args)
+        return _stage((name, self.key, args), run)
+
+    def context_index(self) -> ContextIndex:
+        """The Data Assistant's search index and aggregates over the table."""
+        return self.stage('context', lambda table: ContextIndex(table, self.value_column, self.title))
@@ -0,0 +1,151 @@
+"""
+Builds the tables shown by the dashboard views from the data functions.
+
+Kept out of ``app.py`` so the same pipelines can be benchmarked and reused
+without Streamlit.
+"""
+import pandas as pd
+
+from instrumentation import timed
+from data_access import (
+    get_dimensions, get_precomputed_schedule, get_sales_history, get_stock_onhand_as_of, get_stock_onhand_by_stockid,
+    get_weekly_sales_table,
+)
+from forecasting import build_schedule
+from prefetch import fetch_all, prefetch
+
+GROUP_COLS = ['SupplierName', 'Cat0', 'Cat1', 'Cat2', 'Cat3', 'Cat4', 'Brand']
+
+
+def _display_frame(columns: dict, index) -> pd.DataFrame:
+    """Assembles the displayed table from already-built columns, without copying them again."""
+    return pd.DataFrame({name: pd.Series(values, index=index, copy=False) for name, values in columns.items()},
+                        index=index, copy=False)
+
+
+def build_weekly_sales_view(week) -> pd.DataFrame:
+    """
+    Returns the Weekly Sales Table for ``week`` (all branches) as displayed.
+    """
+    # The dimension load doesn't depend on the week's query, so both run at once.
+    weekly_sales_df, dims = fetch_all(lambda: get_weekly_sales_table(week), get_dimensions)
+    # Categories, brand and supplier name come from the stock dimension in one
+    # lookup; categorical columns hold only codes.
+    with timed('merge', 'weekly_sales_view.merge') as info:
+        items = dims.lookup_items(weekly_sales_df['StockID'].to_numpy(), GROUP_COLS)
+        view = _display_frame({
+            'SupplierID': weekly_sales_df['SupplierID'].array,
+            **{col: items[col].array for col in GROUP_COLS},
+            'StockID': weekly_sales_df['StockID'].array,
+            'Item Name': weekly_sales_df['Name'].array,
+            'Quantity Sold': weekly_sales_df['Quantity_Sold'].array,
+            'LinkQty': weekly_sales_df['LinkQty_Sold'].array,
+        }, weekly_sales_df.index)
+        info['rows'] = len(view)
+    return view
+
+
+def _stock_onhand(branch, onhand_week):
+    # The ledger's balance at the end of onhand_week, or the current snapshot when the ledger doesn't reach it.
+    if onhand_week:
+        onhand = get_stock_onhand_as_of(branch, onhand_week)
+        if onhand is not None:
+            return onhand
+    return get_stock_onhand_by_stockid(branch)
+
+
+def build_purchase_schedule_view(branch, prev_weeks, method, window, onhand_week=None) -> pd.DataFrame | None:
+    """
+    Returns the Purchase Schedule of ``branch`` as displayed, or None when it has no sales in ``prev_weeks``.
+
+    Served from the batch job's results (see ``schedule_batch.py``) when they
+    are current, computed here otherwise.
+
+    Args:
+        onhand_week: Week whose closing stock on hand (from the stock ledger,
+            see ``stock_ledger.py``) the schedule uses, for the schedule of a
+            past week; None for the current snapshot.
+    """
+    schedule = None if onhand_week else get_precomputed_schedule(branch, prev_weeks, method, window)
+    if schedule is None:
+        sales_history, stock_onhand_df, _ = fetch_all(
+            lambda: get_sales_history(branch, tuple(prev_weeks)),
+            lambda: _stock_onhand(branch, onhand_week),
+            get_dimensions,
+        )
+        if not len(sales_history.stock_ids):
+            return None
+        with timed('merge', 'build_schedule') as info:
+            schedule = build_schedule(sales_history, stock_onhand_df, method, window)
+            info['rows'] = len(schedule)
+    elif not len(schedule):
+        return None
+    with timed('merge', 'purchase_schedule_view.merge') as info:
+        items = get_dimensions().lookup_items(
+            schedule['StockID'].to_numpy(), ['SupplierID', *GROUP_COLS, 'Description1']
+        )
+        # Sort on the lookup's columns, then take every column once in that order.
+        order = items.sort_values(GROUP_COLS + ['Description1']).index.to_numpy()
+        view = _display_frame({
+            'SupplierID': items['SupplierID'].array.take(order),
+            **{col: items[col].array.take(order) for col in GROUP_COLS},
+            'StockID': schedule['StockID'].to_numpy()[order],
+            'Item Name': items['Description1'].array.take(order),
+            'Avg Weekly Sales': schedule['avg_sales'].to_numpy()[order],
+            'Stock On Hand': schedule['ONHAND'].to_numpy()[order],
+            'Order Qty': schedule['RecommendedOrder'].to_numpy()[order],
+        }, pd.RangeIndex(len(order)))
+        info['rows'] = len(view)
+    return view
+
+
+def schedule_weeks(week, weeks, window) -> tuple:
+    """
+    Returns ``(prev_weeks, onhand_week)`` of the Purchase Schedule for ``week``.
+
+    ``prev_weeks`` are the ``window`` weeks before ``week`` (newest first);
+    ``onhand_week`` is the week whose closing stock a past week's schedule
+    uses, or None for the latest week, which uses the current snapshot.
+    """
+    position = weeks.index(week) if week in weeks else 0
+    prev_weeks = tuple(weeks[position + 1:position + 1 + window])
+    onhand_week = prev_weeks[0] if position > 0 and prev_weeks else None
+    return prev_weeks, onhand_week
+
+
+def _prefetch_schedule_data(branch, prev_weeks, method, window, onhand_week):
+    # The data behind build_purchase_schedule_view, unless the batch job already has it.
+    if onhand_week or get_precomputed_schedule(branch, prev_weeks, method, window) is None:
+        fetch_all(lambda: get_sales_history(branch, tuple(prev_weeks)), lambda: _stock_onhand(branch, onhand_week))
+
+
+def prefetch_related(branch, sales_week, schedule_week, weeks, branches, show_schedule, method, window) -> None:
+    """
+    Queues, in the background, the data of the pages the user is likely to open next.
+
+    From the Weekly Sales view: the weeks either side of ``sales_week`` and
+    this branch's Purchase Schedule. From the Purchase Schedule: the schedules
+    of the branches either side of ``branch``, and the sales table of
+    ``sales_week``.
+
+    Args:
+        sales_week: Week the Weekly Sales view shows (or will open on).
+        schedule_week: Week the Purchase Schedule shows (or will open on).
+        weeks: Week labels as listed in the sidebar (newest first).
+        branches: Branch codes as listed in the sidebar.
+        method, window: Forecast settings the Purchase Schedule shows (or will open with).
+    """
+    prev_weeks, onhand_week = schedule_weeks(schedule_week, weeks, window)
+    if not show_schedule:
+        position = weeks.index(sales_week) if sales_week in weeks else 0
+        for neighbour in (position + 1, position - 1):
+            if 0 <= neighbour < len(weeks):
+                prefetch(get_weekly_sales_table, weeks[neighbour])
+        if prev_weeks:
+            prefetch(_prefetch_schedule_data, branch, prev_weeks, method, window, onhand_week)
+    else:
+        position = branches.index(branch) if branch in branches else 0
+        for neighbour in (position + 1, position - 1):
+            if 0 <= neighbour < len(branches) and prev_weeks:
+                prefetch(_prefetch_schedule_data, branches[neighbour], prev_weeks, method, window, onhand_week)
+        prefetch(get_weekly_sales_table, sales_week)